@@ -2,26 +2,105 @@ import os
 import json
 import requests
 import mysql.connector
-from flask import Flask, request, redirect, session, jsonify, url_for, send_from_directory
+from flask import Flask, request, redirect, session, jsonify, url_for, send_from_directory, g, Response, stream_with_context, has_request_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 import firebase_admin
 from firebase_admin import auth, credentials, firestore
 from google.cloud import storage
-import uuid, tempfile
+from google.api_core import exceptions as gcs_exceptions
+import uuid, io, mimetypes
 from werkzeug.utils import secure_filename
-import traceback
+from werkzeug.middleware.proxy_fix import ProxyFix
+import math
+import time
+import threading
+from datetime import datetime, timedelta
+from rate_limit import RateLimiter
+from db import ConnectionPool, PoolExhausted, PoolOverloaded, ReplicaSet, retry_on_deadlock
+import functools
+import atexit
+from resilience import CircuitBreaker, DeadlineExceeded, retry, call_with_deadline
+from cache import TTLCache, TieredCache, RedisBackend, InvalidationBus, MISSING
+import hashlib
+from bulk_import import BulkImporter, read_rows, detect_format
+import exports
+import image_gc
+from prefix_index import PrefixIndex
+from query_builder import QueryPlanner, parse_filters, PRODUCT_COLUMNS
+from singleflight import SingleFlight, SingleFlightTimeout
+from similar import SimilarityIndex
+import signed_uploads
+from popularity import PopularityCounters, decayed_score
+from memprofile import AllocationProfiler
+from events import EventHub
+import inventory
+from idempotency import IdempotencyStore, KeyReused, StillInProgress
+from image_store import ImageStore
+import order_archive
+import logging
+from logs import setup_logging, parse_levels
+from shaping import (
+    prices_to_float, format_product_detail, shape_grouped_order, shape_user_order, shape_order_detail
+)
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
+
+# Proxies in front of the app (Cloud Run and Vercel each add one). Only the
+# X-Forwarded-For hops they appended are trusted for request.remote_addr.
+TRUSTED_PROXIES = int(os.getenv("TRUSTED_PROXIES", "1"))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
+
+# =================== LOGGING =================== #
+
+def log_context():
+    """request_id and route for log lines written while handling a request."""
+    if not has_request_context():
+        return None
+    return {"request_id": g.get('request_id'), "route": request.endpoint}
+
+
+# JSON lines written by a background thread. LOG_LEVELS sets per-logger levels
+# ("cache=WARNING,db=DEBUG"), LOG_DEBUG_SAMPLE_RATE keeps that share of DEBUG lines.
+log_handler = setup_logging(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    module_levels=parse_levels(os.getenv("LOG_LEVELS")),
+    debug_sample_rate=float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1")),
+    context=log_context,
+)
+log = logging.getLogger("unisale")
+LOG_REQUESTS = os.getenv("LOG_REQUESTS", "1") == "1"
+
+
+@app.before_request
+def start_request_log():
+    # Registered first so everything logged for the request, rate limiting included, carries the id
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def finish_request_log(response):
+    response.headers['X-Request-ID'] = g.get('request_id', '')
+    if LOG_REQUESTS and 'request_started' in g:
+        log.info("%s %s %s", request.method, request.path, response.status_code, extra={
+            "method": request.method,
+            "status": response.status_code,
+            "duration_ms": round((time.perf_counter() - g.request_started) * 1000, 1),
+        })
+    return response
+
 # Update CORS configuration to handle all routes and methods
 CORS(app, resources={
     r"/*": {
         "origins": ["http://localhost:5173"],
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
+        "allow_headers": ["Content-Type", "Authorization", "Idempotency-Key"],
+        "expose_headers": ["Idempotent-Replayed", "X-Request-ID"]
     }
 })
 
@@ -74,19 +153,129 @@ os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "tactile-rigging-451008-a0-f0a39b
 #         print(f"Error connecting to Cloud SQL: {err}")
 #         raise
 
-def get_db_connection():
+def running_under_gevent():
     try:
-        connection = mysql.connector.connect(
-            host="localhost",
-            user="root",
-            password="",
-            database="unisale"
-        )
-        return connection
-    except mysql.connector.Error as err:
-        print(f"Error connecting to MySQL: {err}")
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("socket")
+
+
+def run_cpu_bound(fn, *args):
+    """Runs fn(*args) on a real OS thread under gevent, where it would otherwise stall
+    every greenlet on the hub (requests and SSE streams alike). Only the caller waits."""
+    if running_under_gevent():
+        import gevent
+        return gevent.get_hub().threadpool.apply(fn, args)
+    return fn(*args)
+
+
+DB_CONFIG = {
+    # The C extension blocks the whole gevent hub during a query; the pure driver yields
+    'use_pure': running_under_gevent(),
+    'host': os.getenv("DB_HOST", "localhost"),
+    'port': int(os.getenv("DB_PORT", "3306")),
+    'user': os.getenv("DB_USER", "root"),
+    'password': os.getenv("DB_PASSWORD", ""),
+    'database': os.getenv("DB_NAME", "unisale"),
+}
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+# Requests allowed to queue for a connection; past that, checkouts fail fast and the request gets a 503
+DB_MAX_QUEUE = int(os.getenv("DB_MAX_QUEUE", "12"))
+
+# Read replicas as "host[:port],host[:port]", e.g. a second local instance: DB_REPLICA_HOSTS=127.0.0.1:3307
+DB_REPLICA_HOSTS = [h.strip() for h in os.getenv("DB_REPLICA_HOSTS", "").split(",") if h.strip()]
+MAX_REPLICA_LAG = float(os.getenv("MAX_REPLICA_LAG", "5"))
+
+# After a client writes, its reads stay on the primary this long so it sees its own changes
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+
+# Pooled connections keep their sessions, so hot statements stay prepared server-side
+db_pool = ConnectionPool(size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT, max_waiting=DB_MAX_QUEUE, **DB_CONFIG)
+
+
+def _replica_pool(address):
+    host, _, port = address.partition(':')
+    return ConnectionPool(size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT, max_waiting=DB_MAX_QUEUE,
+                          **{**DB_CONFIG, 'host': host, 'port': int(port or 3306)})
+
+
+replicas = ReplicaSet([_replica_pool(address) for address in DB_REPLICA_HOSTS], max_lag=MAX_REPLICA_LAG)
+if DB_REPLICA_HOSTS:
+    replicas.start()
+
+
+def get_db_connection(read_only=None, max_lag=None):
+    """Connection for the current request.
+
+    Handlers marked @read_only are served by a healthy replica unless the client
+    wrote recently; everything else (and background jobs) uses the primary.
+    With `max_lag`, only replicas at most that many seconds behind qualify.
+    """
+    if read_only is None:
+        read_only = has_request_context() and g.get('db_read_only', False) and not g.get('db_pinned', False)
+
+    if read_only:
+        pool = replicas.pick(max_lag)
+        if pool is not None:
+            try:
+                return pool.get()
+            except (mysql.connector.Error, PoolExhausted) as err:
+                log.warning("Replica unavailable, using primary: %s", err)
+
+    try:
+        return db_pool.get()
+    except (mysql.connector.Error, PoolExhausted) as err:
+        if isinstance(err, PoolOverloaded) and has_request_context():
+            # Most handlers turn this into a 500; shed_overloaded_response makes it a 503
+            g.db_overloaded = True
+        log.error("Error connecting to MySQL: %s", err)
         raise
 
+
+# Shared cache fills only use replicas at most this many seconds behind the primary
+CACHE_FILL_MAX_LAG = float(os.getenv("CACHE_FILL_MAX_LAG", "0"))
+# When this instance last saw a write to cached rows (its own or a relayed catalog event),
+# in time.monotonic() seconds
+last_cached_write = 0.0
+
+
+def get_cache_fill_connection():
+    """Connection for filling a shared catalog cache: a caught-up replica, else the primary.
+
+    Pinned clients read the primary, and so does every fill shortly after a write to
+    cached rows (lag is reported in whole seconds), so a page missing that write is
+    never cached for the whole TTL. Detail fills also seed the profile cache.
+    """
+    pinned = has_request_context() and g.get('db_pinned', False)
+    settled = time.monotonic() - last_cached_write > CACHE_FILL_MAX_LAG + 1
+    return get_db_connection(read_only=not pinned and settled, max_lag=CACHE_FILL_MAX_LAG)
+
+
+def read_only(view):
+    """Marks a handler whose queries may be served by a read replica."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+# =================== SHARED CACHE TIER =================== #
+
+# With REDIS_URL set (e.g. redis://localhost:6379/0), the caches below share a
+# Redis L2 across instances and invalidations reach every instance's L1.
+REDIS_URL = os.getenv("REDIS_URL")
+redis_breaker = CircuitBreaker("redis", failure_threshold=3, reset_timeout=10)
+cache_backend = RedisBackend.from_url(REDIS_URL, redis_breaker) if REDIS_URL else None
+# Started once the catalog events channel is added, see LIVE CATALOG EVENTS
+cache_bus = InvalidationBus(cache_backend) if cache_backend else None
+
+
+def shared_cache(namespace, maxsize, ttl):
+    return TieredCache(namespace, maxsize=maxsize, ttl=ttl, backend=cache_backend, bus=cache_bus)
+
+
 # =================== FIREBASE AUTH SETUP =================== #
 
 cred = credentials.Certificate("firebase-adminsdk.json")  # Update path
@@ -95,43 +284,518 @@ firebase_admin.initialize_app(cred)
 # After existing Firebase initialization
 db = firestore.client()
 
+FIREBASE_TIMEOUT = float(os.getenv("FIREBASE_TIMEOUT", "5"))
+firebase_breaker = CircuitBreaker("firebase", failure_threshold=5, reset_timeout=15)
+
+# Only infrastructure errors count against the breaker, an invalid or expired token doesn't
+FIREBASE_TRANSIENT_ERRORS = (auth.CertificateFetchError, DeadlineExceeded)
+
+
+# Verified tokens, keyed by hash, until they expire (revocation isn't checked on verification either)
+token_cache = shared_cache("firebase-tokens", maxsize=20000, ttl=int(os.getenv("TOKEN_CACHE_TTL", "300")))
+
+
+def verify_firebase_token(token):
+    """auth.verify_id_token with a deadline, one retry on transient errors and a circuit breaker."""
+    key = hashlib.sha256(token.encode()).hexdigest()
+    decoded_token = token_cache.get(key)
+    if decoded_token is not MISSING:
+        return decoded_token
+
+    decoded_token = retry(
+        lambda: firebase_breaker.call(
+            call_with_deadline, auth.verify_id_token, FIREBASE_TIMEOUT, token,
+            is_failure=lambda e: isinstance(e, FIREBASE_TRANSIENT_ERRORS)
+        ),
+        attempts=2,
+        retry_on=FIREBASE_TRANSIENT_ERRORS
+    )
+    expires_in = decoded_token.get('exp', 0) - time.time()
+    if expires_in > 1:
+        token_cache.set(key, decoded_token, ttl=min(token_cache.ttl, expires_in))
+    return decoded_token
+
+
 # Authentication middleware
 def authenticate_token(token):
     try:
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = verify_firebase_token(token)
         return decoded_token['uid']
     except Exception as e:
-        print(f"Auth error: {e}")
+        log.warning("Auth error: %s", e)
         return None
 
 
 # Utility function to get Firebase UID from token
 def get_current_user_id():
+    # Token verification is memoized per request, the rate limiter and the handler both need it
+    if 'current_user_id' in g:
+        return g.current_user_id
+
     auth_header = request.headers.get('Authorization')
     if not auth_header or not auth_header.startswith('Bearer '):
+        g.current_user_id = None
         return None
 
     try:
         token = auth_header.split(' ')[1]
-        decoded_token = auth.verify_id_token(token)
-        return decoded_token['uid']
+        decoded_token = verify_firebase_token(token)
+        g.current_user_id = decoded_token['uid']
+        g.current_user_email = decoded_token.get('email')
     except Exception as e:
-        print(f"Error authenticating token: {e}")
+        log.warning("Error authenticating token: %s", e)
+        g.current_user_id = None
+    return g.current_user_id
+
+
+def get_current_account_id():
+    """users.id of the verified Firebase user, found by the token's email. None when unauthenticated."""
+    if 'current_account_id' in g:
+        return g.current_account_id
+
+    g.current_account_id = None
+    if get_current_user_id() and g.get('current_user_email'):
+        profile = get_user_profile_by_email(g.current_user_email)
+        if profile:
+            g.current_account_id = profile['id']
+    return g.current_account_id
+
+
+# =================== RATE LIMITING & LOAD SHEDDING =================== #
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+
+# Per-route budgets as (burst capacity, tokens refilled per second), keyed by endpoint name
+RATE_LIMITS = {
+    "get_products": (20, 5),
+    "get_product_detail": (30, 10),
+    "similar_products": (30, 10),
+    "trending_products": (20, 5),
+    "catalog_events_stream": (10, 0.5),
+    "autocomplete_products": (50, 20),
+    "upload_product": (5, 0.1),
+    "upload_multiple": (5, 0.1),
+    "import_products": (2, 0.01),
+    "sign_uploads": (10, 0.5),
+    "finalize_product_upload": (5, 0.1),
+    "finalize_profile_picture": (5, 0.1),
+    "export_orders": (2, 0.05),
+    "export_users": (2, 0.05),
+    "update_profile_picture": (5, 0.1),
+    "create_order": (5, 0.2),
+    "checkout_reservation": (10, 0.5),
+    "signup": (5, 0.1),
+}
+DEFAULT_RATE_LIMIT = (60, 10)
+
+# Endpoints that never touch MySQL are exempt
+RATE_LIMIT_EXEMPT = {"home", "static", "get_user_id", "dependency_health", "memory_profile"}
+
+rate_limiter = RateLimiter(RATE_LIMITS, DEFAULT_RATE_LIMIT)
+
+
+def get_client_key():
+    """Rate limit key: the Firebase uid when authenticated, otherwise the client IP."""
+    user_id = get_current_user_id()
+    if user_id:
+        return f"uid:{user_id}"
+    # Set by ProxyFix from the trusted hops; the client can't choose it by sending X-Forwarded-For
+    return f"ip:{request.remote_addr}"
+
+
+@app.before_request
+def enforce_rate_limits():
+    if not RATE_LIMIT_ENABLED or request.method == 'OPTIONS':
+        return None
+    if request.endpoint is None or request.endpoint in RATE_LIMIT_EXEMPT:
         return None
 
+    retry_after = rate_limiter.check(request.endpoint, get_client_key())
+    if retry_after:
+        response = jsonify({"error": "Too many requests"})
+        response.headers['Retry-After'] = str(math.ceil(retry_after))
+        return response, 429
+    return None
+
+
+@app.after_request
+def shed_overloaded_response(response):
+    """Load shedding happens at pool checkout (DB_MAX_QUEUE), so only requests that need
+    a connection while MySQL is backed up are turned away; uploads and cache hits aren't."""
+    if g.get('db_overloaded') and response.status_code >= 500:
+        response = jsonify({"error": "Server is busy, please retry shortly"})
+        response.status_code = 503
+        response.headers['Retry-After'] = "1"
+    return response
+
+
+# =================== READ-YOUR-WRITES PINNING =================== #
+
+primary_pins = TTLCache(maxsize=100000, ttl=READ_YOUR_WRITES_SECONDS)
+
+
+@app.before_request
+def check_primary_pin():
+    if DB_REPLICA_HOSTS and request.method != 'OPTIONS':
+        g.db_pinned = primary_pins.get(get_client_key(), False)
+
+
+@app.after_request
+def pin_writers_to_primary(response):
+    if not DB_REPLICA_HOSTS or g.get('db_read_only', False):
+        return response
+    if request.method in ('POST', 'PUT', 'DELETE') and response.status_code < 400:
+        primary_pins.set(get_client_key(), True)
+    return response
+
+
+# =================== IDEMPOTENCY KEYS =================== #
+
+# Responses to requests sent with an Idempotency-Key header, replayed to retries of the same request
+idempotency_store = IdempotencyStore(
+    lambda: get_db_connection(read_only=False),
+    ttl=int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400")),
+    lock_timeout=int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "120")),
+    wait_timeout=float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10")),
+)
+idempotency_store.start()
+
+
+def request_fingerprint():
+    """Hash of the request method, URL and body; uploaded files are hashed without buffering them."""
+    digest = hashlib.sha256(f"{request.method} {request.full_path}".encode())
+    if request.mimetype == 'multipart/form-data':
+        for field in request.form.items(multi=True):
+            digest.update(repr(field).encode())
+        for name, file in request.files.items(multi=True):
+            digest.update(repr((name, file.filename)).encode())
+            for chunk in iter(lambda: file.stream.read(65536), b""):
+                digest.update(chunk)
+            file.stream.seek(0)
+    else:
+        digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def idempotency_scope():
+    """Whose keys a request's Idempotency-Key is looked up among: the verified Firebase user.
+
+    None without a verified token. A user id from the body can be claimed by anyone,
+    and scoping by it would replay that user's stored responses to them.
+    """
+    uid = get_current_user_id()
+    return f"{request.endpoint}:uid:{uid}" if uid else None
+
+
+def idempotent(view):
+    """Honors an Idempotency-Key header: a retry of the same request gets the original response back.
+
+    Keys are kept per verified user; without a Firebase token the header is ignored
+    and nothing is stored or replayed. Errors that may go away on retry (5xx, 429)
+    aren't stored, so retrying those runs the request again.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key', '').strip()
+        if not key or request.method == 'OPTIONS':
+            return view(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({"error": "Idempotency-Key must be at most 255 characters"}), 400
+
+        scope = idempotency_scope()
+        if scope is None:
+            return view(*args, **kwargs)
+        try:
+            stored = idempotency_store.begin(scope, key, request_fingerprint())
+        except KeyReused:
+            return jsonify({"error": "Idempotency-Key was already used for a different request"}), 422
+        except StillInProgress:
+            response = jsonify({"error": "A request with this Idempotency-Key is still in progress"})
+            response.headers['Retry-After'] = "1"
+            return response, 409
+        except Exception as e:
+            log.error("Error checking idempotency key: %s", e)
+            response = jsonify({"error": "Server is busy, please retry shortly"})
+            response.headers['Retry-After'] = "1"
+            return response, 503
+
+        if stored is not None:
+            response = Response(stored.body, status=stored.status, content_type=stored.content_type)
+            response.headers['Idempotent-Replayed'] = "true"
+            return response
+
+        response = None
+        try:
+            response = app.make_response(view(*args, **kwargs))
+        finally:
+            # If storing fails the claim stays until IDEMPOTENCY_LOCK_SECONDS, then a retry runs again
+            try:
+                if response is None or response.status_code >= 500 or response.status_code == 429:
+                    idempotency_store.abandon(scope, key)
+                else:
+                    idempotency_store.complete(
+                        scope, key, response.status_code, response.get_data(), response.content_type
+                    )
+            except Exception as e:
+                log.error("Error saving idempotency key: %s", e)
+        return response
+
+    return wrapper
+
+
+# =================== MEMORY PROFILING =================== #
+
+# Share of requests traced with tracemalloc (0 disables; 0.01 is cheap enough to leave on)
+MEMORY_PROFILE_SAMPLE_RATE = float(os.getenv("MEMORY_PROFILE_SAMPLE_RATE", "0"))
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+
+memory_profiler = AllocationProfiler(
+    sample_rate=MEMORY_PROFILE_SAMPLE_RATE,
+    top_n=int(os.getenv("MEMORY_PROFILE_TOP_N", "10")),
+    window=int(os.getenv("MEMORY_PROFILE_WINDOW", "20")),
+    run=run_cpu_bound,
+)
+
+
+def is_admin_request():
+    return bool(ADMIN_API_KEY) and request.headers.get('X-Admin-Key') == ADMIN_API_KEY
+
+
+@app.before_request
+def start_memory_sample():
+    if request.endpoint in (None, "memory_profile", "static", "catalog_events_stream"):
+        return
+    # Admins can force a sample with X-Profile-Memory: 1, even with sampling off
+    force = request.headers.get('X-Profile-Memory') == '1' and is_admin_request()
+    if force or memory_profiler.enabled:
+        g.memory_sample = memory_profiler.start(force=force)
+
+
+@app.teardown_request
+def finish_memory_sample(exc):
+    # Streamed responses tear down after the last chunk, so exports are measured whole
+    token = g.pop('memory_sample', None)
+    if token is not None:
+        memory_profiler.finish(token, request.endpoint)
+
+
+@app.route("/api/admin/memory-profile", methods=["GET", "DELETE"])
+def memory_profile():
+    """Rolling per-route allocation samples. DELETE clears them. Requires X-Admin-Key."""
+    if not is_admin_request():
+        return jsonify({"error": "Unauthorized"}), 401
+    if request.method == 'DELETE':
+        memory_profiler.reset()
+        return jsonify({"message": "Memory profile cleared"})
+    return jsonify({
+        "sample_rate": memory_profiler.sample_rate,
+        **memory_profiler.stats,
+        "routes": memory_profiler.report()
+    })
+
 
 # Get product by ID
 def get_product_by_id(product_id):
-    cursor = mysql.connection.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM product WHERE id = %s", (product_id,))
-    return cursor.fetchone()
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT * FROM products WHERE id = %s", (product_id,))
+        product = cursor.fetchone()
+        cursor.close()
+    finally:
+        conn.close()
+    return product
+
+
+def delete_products(product_ids, seller_id=None):
+    """Deletes products with their image, cart and wishlist rows in one transaction, then
+    removes images nothing else references from the bucket in batched requests.
+    Returns the ids that were actually deleted.
+
+    With `seller_id`, nothing is deleted and PermissionError is raised if any of
+    the products belongs to another seller."""
+    product_ids = sorted({int(product_id) for product_id in product_ids})
+    if not product_ids:
+        return []
+
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    conn = get_db_connection(read_only=False)
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        cursor.execute(
+            f"SELECT id, image_url, category, user_id FROM products WHERE id IN ({placeholders}) FOR UPDATE",
+            product_ids
+        )
+        rows = cursor.fetchall()
+        not_owned = [row[0] for row in rows if seller_id is not None and row[3] != seller_id]
+        if not rows or not_owned:
+            conn.rollback()
+            cursor.close()
+            conn.close()
+            if not_owned:
+                raise PermissionError(f"Products {not_owned} belong to another seller")
+            return []
+
+        deleted_ids = [row[0] for row in rows]
+        categories = {row[0]: row[2] for row in rows}
+        placeholders = ', '.join(['%s'] * len(deleted_ids))
+        cursor.execute(f"SELECT product_id, image_url FROM product_images WHERE product_id IN ({placeholders})", deleted_ids)
+        image_rows = [row for row in cursor.fetchall() if row[1]]
+        # Each product_images row holds the reference its upload took; the main image is normally one of them
+        listed = set(image_rows)
+        image_refs = [url for _, url in image_rows] + [
+            row[1] for row in rows if row[1] and (row[0], row[1]) not in listed
+        ]
+
+        cursor.execute(f"DELETE FROM wishlist WHERE product_id IN ({placeholders})", deleted_ids)
+        cursor.execute(f"DELETE FROM cart WHERE product_id IN ({placeholders})", deleted_ids)
+        cursor.execute(f"DELETE FROM product_images WHERE product_id IN ({placeholders})", deleted_ids)
+        cursor.execute(f"DELETE FROM products WHERE id IN ({placeholders})", deleted_ids)
+        conn.commit()
+
+    except Exception:
+        conn.rollback()
+        cursor.close()
+        conn.close()
+        raise
+
+    # Reference-counted images are deleted by the store once their last reference goes
+    try:
+        names = {url: image_gc.blob_name_from_url(url, BUCKET_NAME) for url in image_refs}
+        untracked = set(image_store.release(names[url] for url in image_refs if names[url]))
+        image_urls = {url for url, name in names.items() if name in untracked}
+    except Exception as e:
+        log.error("Error releasing product images: %s", e)
+        image_urls = set()
+
+    # An older photo can be shared with another product or used as a profile picture;
+    # if this check fails the objects are left for the image GC job
+    try:
+        if image_urls:
+            url_placeholders = ', '.join(['%s'] * len(image_urls))
+            cursor.execute(f"""
+                SELECT image_url FROM products WHERE image_url IN ({url_placeholders})
+                UNION SELECT image_url FROM product_images WHERE image_url IN ({url_placeholders})
+                UNION SELECT profile_picture FROM users WHERE profile_picture IN ({url_placeholders})
+            """, list(image_urls) * 3)
+            image_urls -= {row[0] for row in cursor.fetchall()}
+    except Exception as e:
+        log.error("Error checking image references: %s", e)
+        image_urls = set()
+    finally:
+        cursor.close()
+        conn.close()
+
+    delete_many_from_gcs(image_urls)
+    for product_id in deleted_ids:
+        invalidate_catalog_caches(product_id)
+        autocomplete_index.remove_product(product_id)
+        similarity_index.remove_product(product_id)
+        publish_listing_event("removed", product_id, categories[product_id])
+    return deleted_ids
 
 
 # Delete product by ID
-def delete_product_by_id(product_id):
-    cursor = mysql.connection.cursor()
-    cursor.execute("DELETE FROM product WHERE id = %s", (product_id,))
-    mysql.connection.commit()
+def delete_product_by_id(product_id, seller_id=None):
+    return bool(delete_products([product_id], seller_id))
+
+
+# =================== USER PROFILE CACHE =================== #
+
+# Profile rows change only through /update-name, /update-phone-number and
+# /update-profile-picture, which invalidate by user id. Emails never change,
+# so the email -> id index only ever needs to expire.
+profile_cache = shared_cache("profiles", maxsize=10000, ttl=int(os.getenv("PROFILE_CACHE_TTL", "600")))
+profile_email_index = shared_cache("profile-emails", maxsize=10000, ttl=3600)
+
+PROFILE_COLUMNS = "id, name, email, phone, profile_picture"
+
+
+def _profile_key(user_id):
+    try:
+        return int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_user_profiles(user_ids):
+    """Returns {user_id: profile row} for the given ids, reading through the profile cache."""
+    profiles = {}
+    missing = []
+    for user_id in {_profile_key(uid) for uid in user_ids}:
+        if user_id is None:
+            continue
+        profile = profile_cache.get(user_id)
+        if profile is MISSING:
+            missing.append(user_id)
+        else:
+            profiles[user_id] = profile
+
+    if missing:
+        # Profile fills read the primary: they follow the user's own writes, which pinning only covers for them
+        conn = get_db_connection(read_only=False)
+        try:
+            cursor = conn.cursor(dictionary=True)
+            placeholders = ', '.join(['%s'] * len(missing))
+            cursor.execute(f"SELECT {PROFILE_COLUMNS} FROM users WHERE id IN ({placeholders})", tuple(missing))
+            rows = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+        for row in rows:
+            profile_cache.set(row['id'], row)
+            profiles[row['id']] = row
+
+    return profiles
+
+
+def get_user_profile(user_id):
+    return get_user_profiles([user_id]).get(_profile_key(user_id))
+
+
+def get_user_profile_by_email(email):
+    user_id = profile_email_index.get(email)
+    if user_id is not MISSING:
+        profile = get_user_profile(user_id)
+        if profile:
+            return profile
+
+    conn = get_db_connection(read_only=False)
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(f"SELECT {PROFILE_COLUMNS} FROM users WHERE email = %s", (email,))
+        profile = cursor.fetchone()
+        cursor.close()
+    finally:
+        conn.close()
+
+    if profile:
+        profile_cache.set(profile['id'], profile)
+        profile_email_index.set(email, profile['id'])
+    return profile
+
+
+def invalidate_user_profile(user_id):
+    """Must be called after every committed write to a users row."""
+    global last_cached_write
+    last_cached_write = time.monotonic()
+    key = _profile_key(user_id)
+    if key is not None:
+        profile_cache.delete(key)
+
+
+def seller_summary(profile):
+    """Seller block embedded in product responses."""
+    if not profile:
+        return None
+    return {
+        "id": profile["id"],
+        "name": profile["name"],
+        "email": profile["email"],
+        "profilePic": profile["profile_picture"],
+        "phoneNumber": profile["phone"]
+    }
 
 
 # =================== ROUTES =================== #
@@ -141,18 +805,52 @@ def home():
     return "Welcome to UniSale API!"
 
 
+@app.route("/api/health/dependencies", methods=["GET"])
+def dependency_health():
+    """Circuit breaker state and counters for external dependencies."""
+    return jsonify({
+        "gcs": gcs_breaker.snapshot(),
+        "firebase": firebase_breaker.snapshot(),
+        "replicas": {
+            pool.connect_args['host'] + ':' + str(pool.connect_args['port']): {
+                "lag_seconds": replicas.lag[id(pool)],
+                "healthy": pool in replicas.healthy
+            } for pool in replicas.pools
+        },
+        "catalog_single_flight": dict(catalog_flights.stats),
+        "similarity_index": similarity_index.stats(),
+        "popularity": {**popularity.stats, "pending": popularity.pending},
+        "sse_subscribers": catalog_events.subscribers,
+        "idempotency": dict(idempotency_store.stats),
+        "log_records_dropped": log_handler.dropped,
+        "image_store": dict(image_store.stats),
+        "order_archive": dict(order_archiver.stats) if order_archiver else None,
+        "redis": redis_breaker.snapshot() if cache_backend else None,
+        "cache_invalidation": dict(cache_bus.stats) if cache_bus else None,
+        "caches": {
+            cache.namespace: {**cache.stats, "l1_entries": len(cache)}
+            for cache in (token_cache, profile_cache, listing_cache, facet_cache, product_detail_cache, trending_cache)
+        }
+    })
+
+
 @app.route("/users", methods=["GET"])
+@read_only
 def get_users():
     """Fetch all users from the database (test route)."""
+    conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         cursor.execute("SELECT id, name, email, verified FROM users")
         users = cursor.fetchall()
-        conn.close()
+        cursor.close()
         return jsonify(users)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    finally:
+        if conn is not None:
+            conn.close()
 
 
 @app.route("/signup", methods=["POST"])
@@ -161,6 +859,7 @@ def signup():
     email = data.get("email")
     name = data.get("name")
 
+    conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
@@ -175,66 +874,122 @@ def signup():
         # Insert new user
         cursor.execute("INSERT INTO users (name, email, verified) VALUES (%s, %s, 1)", (name, email))
         conn.commit()
-        conn.close()
 
         return jsonify({"success": True, "message": "Signup successful!"})
 
     except Exception as e:
         return jsonify({"success": False, "message": str(e)})
+    finally:
+        if conn is not None:
+            conn.close()
 
 
 # =================== Google Cloud Storage Setup =================== #
 
 BUCKET_NAME = "unisale-storage"
 
+# Per-request timeout for each GCS call, and the total budget for one operation including retries
+GCS_TIMEOUT = float(os.getenv("GCS_TIMEOUT", "20"))
+GCS_DEADLINE = float(os.getenv("GCS_DEADLINE", "45"))
 
-def gcs_upload_image(file, folder):
-    """Uploads an image to Google Cloud Storage under the specified folder and returns the public URL."""
+gcs_breaker = CircuitBreaker("gcs", failure_threshold=5, reset_timeout=30)
+
+GCS_TRANSIENT_ERRORS = (
+    gcs_exceptions.TooManyRequests,
+    gcs_exceptions.InternalServerError,
+    gcs_exceptions.BadGateway,
+    gcs_exceptions.ServiceUnavailable,
+    gcs_exceptions.GatewayTimeout,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+)
+
+_storage_client = None
+
+
+def get_bucket():
+    """The storage client is created once; building one per call costs an auth round trip."""
+    global _storage_client
+    if _storage_client is None:
+        _storage_client = storage.Client()
+    return _storage_client.bucket(BUCKET_NAME)
+
+
+def gcs_call(operation):
+    """Runs an idempotent GCS operation through the breaker, retrying transient errors within GCS_DEADLINE."""
+    deadline = time.monotonic() + GCS_DEADLINE
+    return retry(
+        lambda: gcs_breaker.call(operation, is_failure=lambda e: isinstance(e, GCS_TRANSIENT_ERRORS)),
+        deadline=deadline,
+        retry_on=GCS_TRANSIENT_ERRORS
+    )
+
+
+def gcs_put_object(object_name, fileobj, size, content_type):
+    """Uploads a content-addressed object and returns its public URL."""
+    blob = get_bucket().blob(object_name)
+    # The name is the content hash, so the bytes behind a URL never change
+    blob.cache_control = "public, max-age=31536000, immutable"
+    # Re-uploading to the same object name is idempotent, so it can be retried (rewinding the file)
+    gcs_call(lambda: blob.upload_from_file(fileobj, rewind=True, size=size, content_type=content_type,
+                                           timeout=GCS_TIMEOUT, retry=None))
+    gcs_call(lambda: blob.make_public(timeout=GCS_TIMEOUT, retry=None))
+    return blob.public_url
+
+
+def gcs_delete_object(object_name):
+    blob = get_bucket().blob(object_name)
     try:
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(BUCKET_NAME)
+        gcs_call(lambda: blob.delete(timeout=GCS_TIMEOUT, retry=None))
+    except gcs_exceptions.NotFound:
+        pass
 
-        # Generate a unique filename inside the folder
-        unique_filename = f"{folder}/{uuid.uuid4()}_{secure_filename(file.filename)}"
-        blob = bucket.blob(unique_filename)
 
-        # Create a temporary file
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            file.save(temp_file.name)
-            temp_file_path = temp_file.name
+# Identical images are stored once and reference counted (sql/image_blobs.sql)
+image_store = ImageStore(lambda: get_db_connection(read_only=False), gcs_put_object, gcs_delete_object)
 
-        # Upload the file to GCS
-        blob.upload_from_filename(temp_file_path)
-        blob.make_public()
-        public_url = blob.public_url
-        print(f"Image uploaded to {public_url}")
 
-        # Remove the temporary file
-        os.unlink(temp_file_path)
+def gcs_upload_image(file, folder):
+    """Uploads an image to Google Cloud Storage under the specified folder and returns the public URL.
 
+    An image that is already stored is not uploaded again; its URL is returned.
+    """
+    try:
+        public_url = image_store.put(file.stream, secure_filename(file.filename), folder)
+        log.debug("Image stored at %s", public_url)
         return public_url
     except Exception as e:
-        print(f"Error uploading file to GCS: {str(e)}")
-        # Ensure temporary file is removed even if an error occurs
-        if 'temp_file_path' in locals():
-            try:
-                os.unlink(temp_file_path)
-            except Exception as del_error:
-                print(f"Error deleting temporary file: {str(del_error)}")
+        log.error("Error uploading file to GCS: %s", e)
+        return None
+
+
+def gcs_upload_bytes(data, filename, folder):
+    """Uploads in-memory image bytes to Google Cloud Storage and returns the public URL."""
+    try:
+        return image_store.put(io.BytesIO(data), secure_filename(filename), folder)
+    except Exception as e:
+        log.error("Error uploading file to GCS: %s", e)
         return None
 
 
 def delete_from_gcs(public_url):
-    """Deletes an image from Google Cloud Storage using its public URL."""
+    """Releases an uploaded image; the object is deleted once nothing else references it."""
+    try:
+        blob_name = image_gc.blob_name_from_url(public_url, BUCKET_NAME)
+        # Images uploaded before deduplication aren't reference counted
+        if blob_name and image_store.release([blob_name]):
+            gcs_delete_object(blob_name)
+    except Exception as e:
+        log.error("Error deleting image from GCS: %s", e)
+
+def delete_many_from_gcs(public_urls):
+    """Deletes several images using batched requests. Failures are left to the image GC job."""
     try:
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(BUCKET_NAME)
-        # Extract blob name from public URL
-        blob_name = public_url.split(f'{BUCKET_NAME}/')[1]
-        blob = bucket.blob(blob_name)
-        blob.delete()
+        bucket = get_bucket()
+        blob_names = [name for name in (image_gc.blob_name_from_url(url, BUCKET_NAME) for url in public_urls) if name]
+        image_gc.batch_delete(bucket.client, bucket, blob_names, call=gcs_call)
     except Exception as e:
-        print(f"Error deleting image from GCS: {str(e)}")
+        log.error("Error deleting images from GCS: %s", e)
 
 # File extension validation helper
 def allowed_file(filename):
@@ -255,14 +1010,18 @@ cursor = db.cursor()
 
 @app.route('/api/upload', methods=['POST'])
 @app.route('/api/upload', methods=['POST', 'OPTIONS'])
+@idempotent
 def upload_product():
     """Handle single image product upload"""
     # Handle preflight CORS requests
     if request.method == 'OPTIONS':
         return '', 200
         
+    conn = None
+    image_url = None
+    committed = False
     try:
-        print("Single image upload started...")
+        log.debug("Single image upload started...")
         
         # Get form data
         user_id = request.form.get('user_id')
@@ -274,7 +1033,7 @@ def upload_product():
         original_price = request.form.get('original_price')
         months_used = request.form.get('months_used')
         
-        print(f"Received product data: {name}, {category}, {price}")
+        log.debug("Received product data: %s, %s, %s", name, category, price)
         
         # Validate required fields
         if not all([user_id, name, description, category, price]):
@@ -282,7 +1041,7 @@ def upload_product():
         
         # Check if image file is present
         if 'image' not in request.files:
-            print("No image file found in request")
+            log.debug("No image file found in request")
             return jsonify({"error": "No image file found"}), 400
         
         file = request.files['image']
@@ -294,7 +1053,7 @@ def upload_product():
         if not image_url:
             return jsonify({"error": "Failed to upload image"}), 500
         
-        print(f"Image uploaded to GCS: {image_url}")
+        log.debug("Image uploaded to GCS: %s", image_url)
         
         # Create database connection
         conn = get_db_connection()
@@ -327,10 +1086,14 @@ def upload_product():
         """, (product_id, image_url))
         
         conn.commit()
+        committed = True
         cursor.close()
         conn.close()
+        after_product_write(product_id, name, description, category)
+        publish_listing_event("new-listing", product_id, category, name=name, price=float(price),
+                              state=state, image_url=image_url)
         
-        print(f"Product {product_id} created successfully")
+        log.info("Product %s created successfully", product_id)
         
         return jsonify({
             "message": "Product uploaded successfully",
@@ -339,10 +1102,29 @@ def upload_product():
         })
             
     except Exception as e:
-        print(f"Error in upload_product: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error in upload_product: %s", e)
+        # The upload took a reference to the image; without the product nothing would ever drop it
+        if image_url and not committed:
+            delete_from_gcs(image_url)
         return jsonify({"error": str(e)}), 500
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def release_replaced_picture(old_url):
+    """Drops the reference a replaced profile picture held. Older, untracked pictures are left to the image GC job.
+
+    Re-uploading the same picture still drops one: put() took a new reference to it.
+    """
+    if not old_url:
+        return
+    blob_name = image_gc.blob_name_from_url(old_url, BUCKET_NAME)
+    if blob_name:
+        try:
+            image_store.release([blob_name])
+        except Exception as e:
+            log.error("Error releasing old profile picture: %s", e)
 
 
 @app.route("/update-profile-picture", methods=["POST"])
@@ -357,8 +1139,12 @@ def update_profile_picture():
         return jsonify({"error": "Image upload failed"}), 500
 
     try:
+        cursor.execute("SELECT profile_picture FROM users WHERE id = %s", (user_id,))
+        row = cursor.fetchone()
         cursor.execute("UPDATE users SET profile_picture = %s WHERE id = %s", (image_url, user_id))
         db.commit()
+        invalidate_user_profile(user_id)
+        release_replaced_picture(row[0] if row else None)
         return jsonify({"message": "Profile picture updated", "image_url": image_url}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -379,11 +1165,7 @@ def get_profile():
         return jsonify({"error": "Email is required"}), 400
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT id, name, profile_picture, phone FROM users WHERE email = %s", (email,))
-        user = cursor.fetchone()
-        conn.close()
+        user = get_user_profile_by_email(email)
 
         if user:
             return jsonify({
@@ -396,8 +1178,7 @@ def get_profile():
             return jsonify({"error": "User not found"}), 404
 
     except Exception as e:
-        print("Error in get-profile route:")
-        print(traceback.format_exc())  # Logs full error stack trace
+        log.exception("Error in get-profile route: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
@@ -413,6 +1194,7 @@ def update_name():
     try:
         cursor.execute("UPDATE users SET name = %s WHERE id = %s", (name, user_id))
         db.commit()
+        invalidate_user_profile(user_id)
         return jsonify({"message": "Name updated successfully"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -428,6 +1210,7 @@ def update_phone_number():
     if not user_id or not phone_number or not phone_number.isdigit() or len(phone_number) != 10:
         return jsonify({"error": "Invalid phone number. Must be exactly 10 digits."}), 400
 
+    conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -435,280 +1218,720 @@ def update_phone_number():
         conn.commit()
         cursor.close()
         conn.close()
+        invalidate_user_profile(user_id)
 
         return jsonify({"message": "Phone number updated successfully"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    finally:
+        if conn is not None:
+            conn.close()
 
 
-@app.route("/get-products", methods=["GET"])
-def get_products():
-    try:
-        search = request.args.get('search', '')
-        category = request.args.get('category', '')
-        condition = request.args.get('condition', '')
-        sort_order = request.args.get('sort', 'newest')
-
-        query = """
-            SELECT p.id, p.user_id, p.name, p.description, p.category, p.state, p.price, p.image_url 
-            FROM products p 
-            WHERE 1=1
-        """
-        params = []
-
-        # Add search condition
-        if search:
-            query += " AND (p.name LIKE %s OR p.description LIKE %s)"
-            params.extend([f'%{search}%', f'%{search}%'])
-
-        # Add category filter
-        if category and category != 'All':
-            query += " AND p.category = %s"
-            params.append(category)
-
-        # Add condition filter
-        if condition:
-            query += " AND p.state = %s"
-            params.append(condition)
-
-        # Add sorting
-        if sort_order == 'low-to-high':
-            query += " ORDER BY p.price ASC"
-        elif sort_order == 'high-to-low':
-            query += " ORDER BY p.price DESC"
-        else:  # newest
-            query += " ORDER BY p.created_at DESC"
+# Composite indexes on products, loaded at startup so the planner only hints ones that exist
+query_planner = QueryPlanner()
 
+
+def load_product_indexes():
+    conn = None
+    try:
         conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(query, params)
-        products = cursor.fetchall()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'products'
+        """)
+        query_planner.set_available_indexes(row[0] for row in cursor.fetchall())
+        cursor.close()
+    except Exception as e:
+        log.error("Error loading product indexes: %s", e)
+    finally:
+        if conn is not None:
+            conn.close()
 
-        # Convert decimal values to float for JSON serialization
-        for product in products:
-            if 'price' in product and product['price'] is not None:
-                product['price'] = float(product['price'])
 
-        conn.close()
-        return jsonify(products)
+load_product_indexes()
 
-    except Exception as e:
-        print(f"Error fetching products: {e}")
-        traceback.print_exc()  # Print full stack trace for debugging
-        return jsonify({"error": str(e)}), 500
 
+# Concurrent identical catalog queries wait on one in-flight execution
+catalog_flights = SingleFlight()
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_TIMEOUT", "10"))
 
-@app.route('/api/products/<int:product_id>', methods=['PUT'])
-def update_product(product_id):
-    # You can add authorization checks here if needed,
-    # for example, ensuring the current user is the owner of the product.
-    data = request.json
-    # Make sure to get the necessary fields from the request.
-    name = data.get("name")
-    description = data.get("description")
-    category = data.get("category")
-    state = data.get("state")
-    price = data.get("price")
+# Listing pages per compiled query and parameters, dropped on every product write.
+# Very large pages aren't worth shipping to and from the shared tier.
+listing_cache = shared_cache("listings", maxsize=256, ttl=int(os.getenv("LISTING_CACHE_TTL", "30")))
+LISTING_CACHE_MAX_ROWS = int(os.getenv("LISTING_CACHE_MAX_ROWS", "2000"))
 
-    # Validate that all required fields are provided.
-    if not all([name, description, category, state, price]):
-        return jsonify({"error": "All fields are required to update the product"}), 400
 
+def load_product_listing(query, params):
+    conn = get_cache_fill_connection()
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        update_query = """
-            UPDATE products
-            SET name = %s, description = %s, category = %s, state = %s, price = %s
-            WHERE id = %s
-        """
-        cursor.execute(update_query, (name, description, category, state, price, product_id))
-        conn.commit()
-        cursor.close()
+        products = conn.execute_prepared(query, params)
+    finally:
         conn.close()
 
-        return jsonify({"message": "Product updated successfully"}), 200
+    # Convert decimal values to float for JSON serialization
+    prices_to_float(products)
+    memory_profiler.checkpoint()
+    return products
+
+
+@app.route("/get-products", methods=["GET"])
+def get_products():
+    """List products.
+
+    Filters: search, category and condition (repeatable or comma-separated),
+    price_min, price_max, seller_id, months_used_min, months_used_max.
+    Sorts: newest (default), oldest, low-to-high, high-to-low.
+    """
+    try:
+        try:
+            filters = parse_filters(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        query, params = query_planner.listing(filters)
+        pinned = g.get('db_pinned', False)
+
+        # Clients that just wrote skip the cache, it may have been filled by a query that started before their write
+        products = MISSING if pinned else listing_cache.get((query, params))
+        if products is MISSING:
+            # Identical concurrent listings share one query; pinned clients only share with each other
+            products = catalog_flights.do(
+                ("products", query, tuple(params), pinned),
+                lambda: load_product_listing(query, params),
+                timeout=SINGLE_FLIGHT_TIMEOUT
+            )
+            if len(products) <= LISTING_CACHE_MAX_ROWS:
+                listing_cache.set((query, params), products)
+        return jsonify(products)
+
+    except SingleFlightTimeout:
+        return jsonify({"error": "Server is busy, please retry shortly"}), 503
     except Exception as e:
+        log.exception("Error fetching products: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/userid')
-def get_user_id():
-    user_id = get_current_user_id()
-    if not user_id:
-        return jsonify({'error': 'Unauthorized'}), 403
-    return jsonify({'user_id': user_id})
+# Facet counts are cached per search/filter context and dropped whenever a listing changes
+facet_cache = shared_cache("facets", maxsize=512, ttl=int(os.getenv("FACET_CACHE_TTL", "300")))
 
+# Formatted detail payloads for the most-viewed products
+product_detail_cache = shared_cache(
+    "product-detail",
+    maxsize=int(os.getenv("PRODUCT_CACHE_SIZE", "2000")),
+    ttl=int(os.getenv("PRODUCT_CACHE_TTL", "120"))
+)
 
-@app.route('/toggle-wishlist', methods=['POST'])
-def toggle_wishlist():
-    data = request.json
-    print(f"Received wishlist toggle request: {data}")  # Add debug logging
 
-    user_id = data.get("users_id")
-    image_url = data.get("image_url")
+def invalidate_catalog_caches(product_id=None):
+    """Called after any product insert or update."""
+    global last_cached_write
+    last_cached_write = time.monotonic()
+    facet_cache.clear()
+    listing_cache.clear()
+    if product_id is not None:
+        product_detail_cache.delete(product_id)
 
-    if not user_id or not image_url:
-        print(f"Missing fields - user_id: {user_id}, image_url: {image_url}")
-        return jsonify({"error": "Missing fields"}), 400
 
+@app.route("/get-products/facets", methods=["GET"])
+def get_product_facets():
+    """Counts per category and per condition for the current search and filter context.
+
+    Each facet ignores its own filter (so the sidebar can show the alternatives)
+    but honours the others, matching what /get-products would return.
+    """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        try:
+            filters = parse_filters(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        # Check if item exists in wishlist
+        cache_key = filters._replace(sort=None)
+        facets = facet_cache.get(cache_key)
+        if facets is not MISSING:
+            return jsonify(facets)
+
+        conn = get_cache_fill_connection()
+        try:
+            cursor = conn.cursor()
+
+            cursor.execute(*query_planner.facet(filters, "category"))
+            categories = {row[0]: row[1] for row in cursor.fetchall()}
+
+            cursor.execute(*query_planner.facet(filters, "condition"))
+            conditions = {row[0]: row[1] for row in cursor.fetchall()}
+
+            cursor.close()
+        finally:
+            conn.close()
+
+        selected = filters.conditions or conditions.keys()
+        facets = {
+            "categories": categories,
+            "conditions": conditions,
+            "total": sum(conditions.get(condition, 0) for condition in selected)
+        }
+        facet_cache.set(cache_key, facets)
+        return jsonify(facets)
+
+    except Exception as e:
+        log.error("Error fetching product facets: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+
+# =================== POPULARITY & TRENDING =================== #
+
+# Views, wishlist and cart adds and orders are counted in memory and upserted in batches
+popularity = PopularityCounters(
+    lambda: get_db_connection(read_only=False),
+    half_life=float(os.getenv("TRENDING_HALF_LIFE_HOURS", "24")) * 3600,
+    flush_interval=float(os.getenv("POPULARITY_FLUSH_SECONDS", "10")),
+)
+popularity.start()
+
+
+@atexit.register
+def flush_popularity():
+    try:
+        popularity.flush()
+    except Exception as e:
+        log.error("Error flushing popularity counters on exit: %s", e)
+
+
+trending_cache = shared_cache("trending", maxsize=64, ttl=int(os.getenv("TRENDING_CACHE_TTL", "30")))
+
+
+@app.route("/get-products/trending", methods=["GET"])
+def trending_products():
+    """Products with the highest time-decayed popularity, optionally within one category."""
+    category = request.args.get('category', '').strip()
+    if category == 'All':
+        category = ''
+    try:
+        limit = min(int(request.args.get('limit', 20)), 100)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    try:
+        products = trending_cache.get((category, limit))
+        if products is not MISSING:
+            return jsonify(products)
+
+        where = "AND p.category = %s " if category else ""
+        conn = get_cache_fill_connection()
+        try:
+            products = conn.execute_prepared(f"""
+                SELECT {PRODUCT_COLUMNS}, pp.trend, pp.views, pp.wishlist_adds, pp.cart_adds, pp.orders
+                FROM product_popularity pp
+                JOIN products p ON p.id = pp.product_id
+                WHERE p.status = 'available' {where}ORDER BY pp.trend DESC
+                LIMIT %s
+            """, (category, limit) if category else (limit,))
+        finally:
+            conn.close()
+
+        now = time.time()
+        for product in products:
+            if product['price'] is not None:
+                product['price'] = float(product['price'])
+            product['trending_score'] = round(decayed_score(product.pop('trend'), now, popularity.half_life), 3)
+
+        trending_cache.set((category, limit), products)
+        return jsonify(products)
+
+    except Exception as e:
+        log.error("Error fetching trending products: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+
+# =================== AUTOCOMPLETE =================== #
+
+autocomplete_index = PrefixIndex()
+# Rebuilds run one at a time; a second one (after a bulk import) waits, then rereads the table
+autocomplete_rebuild_lock = threading.Lock()
+
+
+def rebuild_autocomplete_index():
+    with autocomplete_rebuild_lock:
+        started = time.perf_counter()
+        conn = None
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor(buffered=False)
+            # The query runs inside rebuild(), after it starts recording concurrent changes.
+            # Rows are read on this greenlet, the index is built on an OS thread
+            autocomplete_index.rebuild(
+                exports.iter_query(cursor, "SELECT id, name, category FROM products WHERE status = 'available'"),
+                run=run_cpu_bound
+            )
+            cursor.close()
+            conn.close()
+            log.info("Autocomplete index built: %s keys in %.2fs", len(autocomplete_index), time.perf_counter() - started)
+        except Exception as e:
+            log.error("Error building autocomplete index: %s", e)
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+def start_autocomplete_rebuild():
+    threading.Thread(target=rebuild_autocomplete_index, daemon=True).start()
+
+
+# Built in the background so startup isn't blocked; suggestions are empty until it finishes
+start_autocomplete_rebuild()
+
+
+def after_product_write(product_id, name, description, category):
+    """Keeps the in-memory catalog structures in step after a product is inserted or updated."""
+    invalidate_catalog_caches(product_id)
+    autocomplete_index.add_product(product_id, name, category)
+    if similarity_index.add_product(product_id, name, description, category):
+        start_similarity_rebuild()
+
+
+@app.route("/get-products/autocomplete", methods=["GET"])
+def autocomplete_products():
+    """Top-N product name and category suggestions for a prefix, served from memory."""
+    prefix = request.args.get('q', '')
+    try:
+        limit = min(int(request.args.get('limit', 10)), 50)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    return jsonify(autocomplete_index.suggest(prefix, limit))
+
+
+# =================== SIMILAR PRODUCTS =================== #
+
+similarity_index = SimilarityIndex()
+similarity_rebuild_lock = threading.Lock()
+
+
+def rebuild_similarity_index():
+    # One build at a time; a build reads the whole products table
+    if not similarity_rebuild_lock.acquire(blocking=False):
+        return
+    conn = None
+    try:
+        conn = get_db_connection(read_only=False)
+        cursor = conn.cursor(buffered=False)
+        # The query runs inside rebuild(), after it starts recording concurrent changes
+        similarity_index.rebuild(
+            exports.iter_query(cursor, "SELECT id, name, description, category FROM products WHERE status = 'available'"),
+            run=run_cpu_bound
+        )
+        cursor.close()
+        conn.close()
+        stats = similarity_index.stats()
+        log.info("Similarity index built: %s products, %s terms, %.1f MiB in %ss",
+                 stats['products'], stats['terms'], stats['memory_bytes'] / 2 ** 20, stats['build_seconds'])
+    except Exception as e:
+        log.error("Error building similarity index: %s", e)
+    finally:
+        if conn is not None:
+            conn.close()
+        similarity_rebuild_lock.release()
+
+
+def start_similarity_rebuild():
+    threading.Thread(target=rebuild_similarity_index, daemon=True).start()
+
+
+start_similarity_rebuild()
+
+
+@app.route('/product/<int:product_id>/similar', methods=['GET'])
+@read_only
+def similar_products(product_id):
+    """Top-K products most similar to this one by TF-IDF cosine over name, description and category."""
+    try:
+        limit = min(int(request.args.get('limit', 10)), 50)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    try:
+        scored = similarity_index.similar(product_id, limit)
+        if not scored:
+            return jsonify([])
+
+        scores = dict(scored)
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(
+                f"SELECT {PRODUCT_COLUMNS} FROM products p "
+                f"WHERE p.id IN ({', '.join(['%s'] * len(scores))}) AND p.status = 'available'",
+                list(scores)
+            )
+            products = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+
+        for product in products:
+            product['price'] = float(product['price']) if product['price'] is not None else None
+            product['similarity'] = scores[product['id']]
+        products.sort(key=lambda product: -product['similarity'])
+        return jsonify(products)
+
+    except Exception as e:
+        log.error("Error fetching similar products: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+
+# =================== LIVE CATALOG EVENTS =================== #
+
+catalog_events = EventHub(capacity=int(os.getenv("SSE_BUFFER_SIZE", "1000")))
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_MAX_STREAM_SECONDS = float(os.getenv("SSE_MAX_STREAM_SECONDS", "300"))
+# gunicorn's --worker-connections (see Dockerfile); every open stream holds one of them
+WORKER_CONNECTIONS = int(os.getenv("WORKER_CONNECTIONS", "1000"))
+# A quarter of them by default and never more than half, so idle streams can't starve the other routes
+SSE_MAX_SUBSCRIBERS = min(int(os.getenv("SSE_MAX_SUBSCRIBERS", str(WORKER_CONNECTIONS // 4))),
+                          WORKER_CONNECTIONS // 2)
+
+
+CATALOG_EVENTS_CHANNEL = "catalog-events"
+
+
+def publish_listing_event(event_type, product_id, category, **fields):
+    """new-listing, price-change, sold or removed, for /api/events subscribers on every instance."""
+    data = {"id": product_id, "category": category, **fields}
+    catalog_events.publish(event_type, data, category)
+    if cache_bus:
+        cache_bus.broadcast(CATALOG_EVENTS_CHANNEL, {"type": event_type, "data": data, "category": category})
+
+
+def relay_listing_event(event):
+    # A write another instance handled; its own subscribers already have it
+    global last_cached_write
+    last_cached_write = time.monotonic()
+    catalog_events.publish(event["type"], event["data"], event["category"])
+
+
+if cache_bus:
+    cache_bus.add_channel(CATALOG_EVENTS_CHANNEL, relay_listing_event)
+    cache_bus.start()
+
+
+@app.route('/api/events', methods=['GET'])
+def catalog_events_stream():
+    """Server-sent events for listing changes, instead of polling /get-products.
+
+    Optional `category` (repeatable or comma-separated) limits the stream.
+    Reconnects resume after the Last-Event-ID header (or `last_event_id`).
+    """
+    if catalog_events.subscribers >= SSE_MAX_SUBSCRIBERS:
+        response = jsonify({"error": "Too many subscribers, please retry shortly"})
+        response.headers['Retry-After'] = "5"
+        return response, 503
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = -1  # Unknown id: the stream starts with a reset event
+
+    categories = {c.strip() for raw in request.args.getlist('category') for c in raw.split(',') if c.strip()}
+    categories.discard('All')
+
+    stream = catalog_events.stream(last_event_id, categories,
+                                   heartbeat=SSE_HEARTBEAT_SECONDS, max_duration=SSE_MAX_STREAM_SECONDS)
+    return Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@app.route('/api/products/<int:product_id>', methods=['PUT'])
+def update_product(product_id):
+    # You can add authorization checks here if needed,
+    # for example, ensuring the current user is the owner of the product.
+    data = request.json
+    # Make sure to get the necessary fields from the request.
+    name = data.get("name")
+    description = data.get("description")
+    category = data.get("category")
+    state = data.get("state")
+    price = data.get("price")
+
+    # Validate that all required fields are provided.
+    if not all([name, description, category, state, price]):
+        return jsonify({"error": "All fields are required to update the product"}), 400
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        conn.start_transaction()
+        # Locked so a checkout can't sell it between this check and the update
+        cursor.execute("SELECT price, status FROM products WHERE id = %s FOR UPDATE", (product_id,))
+        previous = cursor.fetchone()
+        if previous is None:
+            conn.rollback()
+            return jsonify({"error": "Product not found"}), 404
+        # A sold listing is out of the catalog; editing it would put it back in the indexes
+        if previous[1] == 'sold':
+            conn.rollback()
+            return jsonify({"error": "Sold products can't be edited"}), 409
+        update_query = """
+            UPDATE products
+            SET name = %s, description = %s, category = %s, state = %s, price = %s
+            WHERE id = %s
+        """
+        cursor.execute(update_query, (name, description, category, state, price, product_id))
+        conn.commit()
+        cursor.close()
+        conn.close()
+        after_product_write(product_id, name, description, category)
+        if float(previous[0]) != float(price):
+            publish_listing_event("price-change", product_id, category, name=name, price=float(price),
+                                  previous_price=float(previous[0]))
+
+        return jsonify({"message": "Product updated successfully"}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+@app.route('/api/products/<int:product_id>', methods=['DELETE'])
+def delete_product(product_id):
+    """Delete one of the signed-in user's products."""
+    user_id = get_current_account_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        if not delete_product_by_id(product_id, seller_id=user_id):
+            return jsonify({"error": "Product not found"}), 404
+        return jsonify({"message": "Product deleted successfully"}), 200
+    except PermissionError:
+        return jsonify({"error": "You can only delete your own products"}), 403
+    except Exception as e:
+        log.error("Error deleting product: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/products', methods=['DELETE'])
+def delete_products_batch():
+    """Delete several of the signed-in user's products at once. Body: {"product_ids": [1, 2, 3]}
+
+    If any id belongs to another seller the whole batch is rejected with 403.
+    """
+    user_id = get_current_account_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    data = request.json or {}
+    product_ids = data.get('product_ids') or []
+    if not isinstance(product_ids, list) or not product_ids or len(product_ids) > 500:
+        return jsonify({"error": "product_ids must be a list of 1-500 ids"}), 400
+
+    try:
+        deleted_ids = delete_products(product_ids, seller_id=user_id)
+        return jsonify({"message": f"Deleted {len(deleted_ids)} products", "deleted_ids": deleted_ids}), 200
+    except (TypeError, ValueError):
+        return jsonify({"error": "product_ids must be integers"}), 400
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 403
+    except Exception as e:
+        log.error("Error deleting products: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/userid')
+def get_user_id():
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify({'user_id': user_id})
+
+
+@app.route('/toggle-wishlist', methods=['POST'])
+def toggle_wishlist():
+    data = request.json
+    log.debug("Received wishlist toggle request: %s", data)
+
+    user_id = data.get("users_id")
+    product_id = data.get("product_id")
+    image_url = data.get("image_url")
+
+    if not user_id or not (product_id or image_url):
+        log.debug("Missing fields - user_id: %s, product_id: %s, image_url: %s", user_id, product_id, image_url)
+        return jsonify({"error": "Missing fields"}), 400
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+
+        # Older clients send only the main image, which identical photos share between listings
+        if product_id:
+            cursor.execute("SELECT id, image_url FROM products WHERE id = %s", (product_id,))
+        else:
+            cursor.execute("SELECT id, image_url FROM products WHERE image_url = %s LIMIT 2", (image_url,))
+        products = cursor.fetchall()
+        if len(products) != 1:
+            cursor.close()
+            if not products:
+                return jsonify({"error": "Product not found"}), 404
+            return jsonify({"error": "image_url matches several products, send product_id"}), 400
+        product = products[0]
+
+        # Check if item exists in wishlist
         cursor.execute(
-            "SELECT * FROM wishlist WHERE users_id = %s AND image_url = %s",
-            (user_id, image_url)
+            "SELECT * FROM wishlist WHERE users_id = %s AND product_id = %s",
+            (user_id, product['id'])
         )
         existing = cursor.fetchone()
-        print(f"Existing wishlist item: {existing}")  # Add debug logging
+        log.debug("Existing wishlist item: %s", existing)
 
         if existing:
             cursor.execute(
-                "DELETE FROM wishlist WHERE users_id = %s AND image_url = %s",
-                (user_id, image_url)
+                "DELETE FROM wishlist WHERE users_id = %s AND product_id = %s",
+                (user_id, product['id'])
             )
             result = {"message": "Removed from wishlist", "status": "removed"}
         else:
             cursor.execute(
-                "INSERT INTO wishlist (users_id, image_url) VALUES (%s, %s)",
-                (user_id, image_url)
+                "INSERT INTO wishlist (users_id, product_id, image_url) VALUES (%s, %s, %s)",
+                (user_id, product['id'], product['image_url'])
             )
             result = {"message": "Added to wishlist", "status": "added"}
 
         conn.commit()
         cursor.close()
         conn.close()
-        print(f"Operation result: {result}")  # Add debug logging
+        if not existing:
+            popularity.incr(product['id'], "wishlist_adds")
+        log.debug("Operation result: %s", result)
         return jsonify(result), 200
 
     except Exception as e:
-        print(f"Error in toggle-wishlist: {str(e)}")
-        import traceback
-        traceback.print_exc()  # Add full traceback
+        log.exception("Error in toggle-wishlist: %s", e)
         return jsonify({"error": str(e)}), 500
+    finally:
+        if conn is not None:
+            conn.close()
 
 
 @app.route('/get-wishlist', methods=['GET'])
+@read_only
 def get_wishlist():
     user_id = request.args.get('user_id')
-    print(f"Received request for user_id: {user_id}")  # Add debug logging
+    log.debug("Received request for user_id: %s", user_id)
 
     if not user_id:
         return jsonify({"error": "User ID is required"}), 400
 
+    conn = None
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            "SELECT image_url FROM wishlist WHERE users_id = %s",
-            (user_id,)
-        )
-        wishlist_items = cursor.fetchall()
-        print(f"Found wishlist items: {wishlist_items}")  # Add debug logging
 
-        # If the wishlist is empty, clean up and return an empty list
-        if not wishlist_items:
-            cursor.close()
-            conn.close()
-            return jsonify([])
-
-        image_urls = [item[0] for item in wishlist_items]
-        print(f"Image URLs: {image_urls}")  # Add debug logging
-
-        # Use dictionary cursor for better data handling
-        cursor = conn.cursor(dictionary=True)
-        placeholders = ', '.join(['%s'] * len(image_urls))
-        
-        query = f"""
-            SELECT id, name, description, price, state, category, image_url, user_id 
-            FROM products 
-            WHERE image_url IN ({placeholders})
-        """
-        cursor.execute(query, tuple(image_urls))
-        products = cursor.fetchall()
-        print(f"Found products: {products}")  # Add debug logging
+        products = conn.execute_prepared("""
+            SELECT p.id, p.name, p.description, p.price, p.state, p.category, p.image_url, p.user_id
+            FROM wishlist w
+            JOIN products p ON p.id = w.product_id
+            WHERE w.users_id = %s
+        """, (user_id,))
+        log.debug("Found products: %s", products)
+        memory_profiler.checkpoint()
 
-        cursor.close()
         conn.close()
         return jsonify(products)  # Return products directly since we're using dictionary cursor
 
     except Exception as e:
-        print(f"Error in get-wishlist: {str(e)}")
-        traceback.print_exc()  # Add full traceback
+        log.exception("Error in get-wishlist: %s", e)
         return jsonify({"error": str(e)}), 500
+    finally:
+        if conn is not None:
+            conn.close()
 
 
-@app.route('/product/<int:product_id>', methods=['GET'])
-def get_product_detail(product_id):
+def load_product_detail(product_id):
+    """Loads and caches one product detail. Returns (product, seller) or None."""
+    conn = get_cache_fill_connection()
     try:
-        conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
 
-        # Get product details
+        # Product, images and seller in one round trip. Images are aggregated as
+        # [id, url] JSON pairs so URLs containing commas survive and nothing is
+        # truncated at group_concat_max_len.
         cursor.execute("""
             SELECT p.id, p.user_id, p.name, p.description, p.category, p.state, 
-                   p.price, p.image_url as main_image, p.created_at,
-                   GROUP_CONCAT(pi.image_url) as additional_images
+                   p.price, p.image_url as main_image, p.created_at, p.status,
+                   (SELECT JSON_ARRAYAGG(JSON_ARRAY(pi.id, pi.image_url))
+                    FROM product_images pi
+                    WHERE pi.product_id = p.id) as additional_images,
+                   u.id as seller_id, u.name as seller_name, u.email as seller_email,
+                   u.phone as seller_phone, u.profile_picture as seller_profile_picture
             FROM products p
-            LEFT JOIN product_images pi ON p.id = pi.product_id
+            LEFT JOIN users u ON u.id = p.user_id
             WHERE p.id = %s
-            GROUP BY p.id
         """, (product_id,))
         product = cursor.fetchone()
+        cursor.close()
+    finally:
+        conn.close()
 
-        if not product:
-            return jsonify({"error": "Product not found"}), 404
+    if not product:
+        return None
 
-        # Get seller details
-        cursor.execute("""
-            SELECT id, name, email, profile_picture as profilePic, phone as phoneNumber
-            FROM users
-            WHERE id = %s
-        """, (product.get('user_id'),))
-        seller = cursor.fetchone()
-
-        # Process the additional images
-        all_images = [product['main_image']]  # Start with main image
-        if product['additional_images']:
-            additional_images = product['additional_images'].split(',')
-            all_images.extend(additional_images)
-
-        # Format the product data
-        formatted_product = {
-            **product,
-            'images': all_images,  # Add all images array
-            'created_at': product['created_at'].isoformat() if product['created_at'] else None
-        }
-        del formatted_product['additional_images']  # Remove the concatenated string
+    # Get seller details, and seed the profile cache while we have the row
+    profile = {column: product.pop(f'seller_{column}') for column in PROFILE_COLUMNS.split(', ')}
+    if profile['id'] is None:
+        profile = None
+    else:
+        profile_cache.set(profile['id'], profile)
 
-        conn.close()
+    formatted_product = format_product_detail(product)
+    product_detail_cache.set(product_id, formatted_product)
+    return formatted_product, seller_summary(profile)
+
+
+@app.route('/product/<int:product_id>', methods=['GET'])
+def get_product_detail(product_id):
+    try:
+        # Hot products are served from the cache, the seller block from the profile cache
+        formatted_product = product_detail_cache.get(product_id)
+        if formatted_product is not MISSING:
+            popularity.incr(product_id, "views")
+            return jsonify({
+                "product": formatted_product,
+                "seller": seller_summary(get_user_profile(formatted_product['user_id']))
+            })
+
+        # Pinned clients read the primary, so they only share a load with each other
+        detail = catalog_flights.do(
+            ("product", product_id, g.get('db_pinned', False)),
+            lambda: load_product_detail(product_id),
+            timeout=SINGLE_FLIGHT_TIMEOUT
+        )
+        if detail is None:
+            return jsonify({"error": "Product not found"}), 404
 
+        popularity.incr(product_id, "views")
+        formatted_product, seller = detail
         return jsonify({
             "product": formatted_product,
             "seller": seller
         })
 
+    except SingleFlightTimeout:
+        return jsonify({"error": "Server is busy, please retry shortly"}), 503
     except Exception as e:
-        print("Error fetching product details:", e)
+        log.error("Error fetching product details: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/user/<int:user_id>", methods=["GET"])
-def get_user_by_id(users_id):
+def get_user_by_id(user_id):
     """Fetch user information by ID."""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT id, name, email, phone, profile_picture FROM users WHERE id = %s",
-            (users_id,)
-        )
-        users = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        users = get_user_profile(user_id)
 
         if not users:
             return jsonify({"error": "User not found"}), 404
@@ -722,16 +1945,50 @@ def get_user_by_id(users_id):
             "profilePic": users["profile_picture"]
         })
     except Exception as e:
-        print(f"Error fetching user: {str(e)}")
+        log.error("Error fetching user: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
+def insert_product(cursor, user_id, name, description, category, state, price,
+                   original_price, months_used, image_urls):
+    """Inserts a product with the first image as main image plus all its product_images rows."""
+    cursor.execute("""
+        INSERT INTO products 
+        (user_id, name, description, category, state, price, image_url, original_price, months_used)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, (
+        user_id, 
+        name, 
+        description, 
+        category, 
+        state, 
+        price, 
+        image_urls[0],  # Use first image as main product image
+        original_price if original_price else None,
+        months_used if months_used else None
+    ))
+    
+    # Get the inserted product ID
+    product_id = cursor.lastrowid
+    
+    # Add all images to product_images table in one statement
+    cursor.execute(
+        "INSERT INTO product_images (product_id, image_url) VALUES " + ", ".join(["(%s, %s)"] * len(image_urls)),
+        [value for image_url in image_urls for value in (product_id, image_url)]
+    )
+    return product_id
+
+
 @app.route('/api/upload-multiple', methods=['POST', 'OPTIONS'])
+@idempotent
 def upload_multiple():
     # Handle preflight CORS requests
     if request.method == 'OPTIONS':
         return '', 200
         
+    conn = None
+    image_urls = []
+    committed = False
     try:
         # Get form data
         user_id = request.form.get('user_id')
@@ -743,7 +2000,7 @@ def upload_multiple():
         original_price = request.form.get('original_price')
         months_used = request.form.get('months_used')
         
-        print(f"Received product data: name={name}, category={category}, price={price}, user_id={user_id}")
+        log.debug("Received product data: name=%s, category=%s, price=%s, user_id=%s", name, category, price, user_id)
         
         # Validate required fields
         if not all([user_id, name, description, category, price]):
@@ -751,7 +2008,7 @@ def upload_multiple():
         
         # Check if image files are present
         if 'images[]' not in request.files:
-            print("No images found in request")
+            log.debug("No images found in request")
             return jsonify({"error": "No images part"}), 400
         
         files = request.files.getlist('images[]')
@@ -759,7 +2016,6 @@ def upload_multiple():
             return jsonify({"error": "No images selected"}), 400
         
         # Upload to Google Cloud Storage and get URLs
-        image_urls = []
         for file in files:
             if file and allowed_file(file.filename):
                 # Upload to Google Cloud Storage instead of local storage
@@ -775,43 +2031,23 @@ def upload_multiple():
         if not image_urls:
             return jsonify({"error": "No valid images uploaded"}), 400
             
-        print(f"Uploaded {len(image_urls)} images to GCS")
+        log.debug("Uploaded %s images to GCS", len(image_urls))
         
         # Create database connection
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Insert product into database with first image as main image
-        cursor.execute("""
-            INSERT INTO products 
-            (user_id, name, description, category, state, price, image_url, original_price, months_used)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            user_id, 
-            name, 
-            description, 
-            category, 
-            state, 
-            price, 
-            image_urls[0],  # Use first image as main product image
-            original_price if original_price else None,
-            months_used if months_used else None
-        ))
-        
-        # Get the inserted product ID
-        product_id = cursor.lastrowid
-        print(f"Created product with ID: {product_id}")
-        
-        # Add all images to product_images table
-        for image_url in image_urls:
-            cursor.execute("""
-                INSERT INTO product_images (product_id, image_url)
-                VALUES (%s, %s)
-            """, (product_id, image_url))
+        product_id = insert_product(cursor, user_id, name, description, category, state, price,
+                                    original_price, months_used, image_urls)
+        log.info("Created product with ID: %s", product_id)
         
         conn.commit()
+        committed = True
         cursor.close()
         conn.close()
+        after_product_write(product_id, name, description, category)
+        publish_listing_event("new-listing", product_id, category, name=name, price=float(price),
+                              state=state, image_url=image_urls[0])
         
         return jsonify({
             "message": f"Product uploaded successfully with {len(image_urls)} images",
@@ -820,47 +2056,260 @@ def upload_multiple():
         })
             
     except Exception as e:
-        print(f"Error in upload_multiple: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error in upload_multiple: %s", e)
+        # Same as a failed GCS upload: drop the references the uploads took
+        if not committed:
+            for url in image_urls:
+                delete_from_gcs(url)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+# Each request imports a bounded slice so it finishes well inside the gunicorn timeout;
+# anything bigger should use `python bulk_import.py` instead
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", "500"))
+IMPORT_MAX_SECONDS = float(os.getenv("IMPORT_MAX_SECONDS", "60"))
+
+
+@app.route('/api/products/import', methods=['POST'])
+def import_products():
+    """Bulk import the signed-in user's listings from an uploaded CSV or JSONL file.
+
+    Images must be http(s) URLs on public hosts. At most IMPORT_MAX_ROWS rows
+    (or IMPORT_MAX_SECONDS) are imported per request; while `complete` is false,
+    send the file again with `start_row` set to the `rows_done` of the response.
+    """
+    user_id = get_current_account_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    if 'file' not in request.files:
+        return jsonify({"error": "No import file found"}), 400
+
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
+
+    try:
+        start_row = int(request.form.get('start_row', 0))
+        importer = BulkImporter(
+            get_db_connection, gcs_upload_bytes, delete_from_gcs, allowed_file,
+            batch_size=min(int(request.form.get('batch_size', 100)), IMPORT_MAX_ROWS),
+            owner_id=user_id,
+            max_image_bytes=MAX_IMAGE_BYTES,
+            fetch_timeout=10
+        )
+
+        stream = io.TextIOWrapper(file.stream, encoding='utf-8', newline='')
+        stats = importer.run(read_rows(stream, detect_format(file.filename)), start_row=start_row,
+                             max_rows=IMPORT_MAX_ROWS, max_seconds=IMPORT_MAX_SECONDS)
+        invalidate_catalog_caches()
+        if stats['imported']:
+            start_autocomplete_rebuild()
+            start_similarity_rebuild()
+
+        log.info("Bulk import: %s products, %s failed, %s rows/s",
+                 stats['imported'], len(stats['failed']), stats['rows_per_second'])
+        return jsonify(stats)
+
+    except Exception as e:
+        log.exception("Error in import_products: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
+# =================== SIGNED DIRECT UPLOADS =================== #
+
+# Clients PUT image bytes straight to the bucket with a short-lived V4 signed URL,
+# then call a finalize endpoint; Flask only signs and verifies.
+SIGNED_UPLOAD_EXPIRY = timedelta(minutes=int(os.getenv("SIGNED_UPLOAD_MINUTES", "15")))
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+MAX_SIGNED_UPLOADS = 10
+UPLOAD_FOLDERS = {"product": "product-image", "profile": "profile-picture"}
+
+
+def verify_uploaded_objects(object_names, folder, user_id):
+    return signed_uploads.verify_uploaded_objects(get_bucket(), object_names, folder, user_id, MAX_IMAGE_BYTES,
+                                                  call=gcs_call, timeout=GCS_TIMEOUT)
+
+
+@app.route('/api/uploads/sign', methods=['POST'])
+def sign_uploads():
+    """Issue V4 signed PUT URLs for the signed-in user's product-image/ or profile-picture/ objects.
+
+    Body: {"kind": "product" | "profile", "files": [{"filename": "a.jpg", "content_type": "image/jpeg"}]}
+    The client must send the returned headers with its PUT.
+    """
+    user_id = get_current_account_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    data = request.json or {}
+    kind = data.get('kind', 'product')
+    files = data.get('files') or []
+
+    if kind not in UPLOAD_FOLDERS:
+        return jsonify({"error": "Invalid kind"}), 400
+    if not files or len(files) > (1 if kind == 'profile' else MAX_SIGNED_UPLOADS):
+        return jsonify({"error": "Invalid number of files"}), 400
+
+    try:
+        bucket = get_bucket()
+        folder = UPLOAD_FOLDERS[kind]
+        uploads = []
+        for file in files:
+            filename = secure_filename(file.get('filename', ''))
+            content_type = file.get('content_type') or mimetypes.guess_type(filename)[0] or ''
+            if not filename or not allowed_file(filename) or not content_type.startswith('image/'):
+                return jsonify({"error": f"File type not allowed: {file.get('filename')}"}), 400
+
+            uploads.append(signed_uploads.sign_upload(bucket, folder, user_id, filename, content_type,
+                                                      MAX_IMAGE_BYTES, SIGNED_UPLOAD_EXPIRY))
+
+        return jsonify({"uploads": uploads, "expires_in": int(SIGNED_UPLOAD_EXPIRY.total_seconds())})
+
+    except Exception as e:
+        log.error("Error signing uploads: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/uploads/finalize-product', methods=['POST'])
+def finalize_product_upload():
+    """Create a product for the signed-in user from images uploaded with /api/uploads/sign."""
+    user_id = get_current_account_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    data = request.json or {}
+    name = data.get('name')
+    description = data.get('description')
+    category = data.get('category')
+    state = data.get('state') or 'Not specified'
+    price = data.get('price')
+    object_names = data.get('object_names') or []
+
+    # Validate required fields
+    if not all([name, description, category, price]):
+        return jsonify({"error": "Missing required fields"}), 400
+    if not object_names or len(object_names) > MAX_SIGNED_UPLOADS:
+        return jsonify({"error": "No images uploaded"}), 400
+
+    conn = None
+    try:
+        try:
+            image_urls = verify_uploaded_objects(object_names, UPLOAD_FOLDERS['product'], user_id)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        product_id = insert_product(cursor, user_id, name, description, category, state, price,
+                                    data.get('original_price'), data.get('months_used'), image_urls)
+        conn.commit()
+        cursor.close()
+        conn.close()
+        after_product_write(product_id, name, description, category)
+        publish_listing_event("new-listing", product_id, category, name=name, price=float(price),
+                              state=state, image_url=image_urls[0])
+
+        return jsonify({
+            "message": f"Product uploaded successfully with {len(image_urls)} images",
+            "product_id": product_id,
+            "image_urls": image_urls
+        })
+
+    except Exception as e:
+        log.exception("Error in finalize_product_upload: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+@app.route('/api/uploads/finalize-profile-picture', methods=['POST'])
+def finalize_profile_picture():
+    """Set the signed-in user's profile picture to one uploaded with /api/uploads/sign."""
+    user_id = get_current_account_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    object_name = (request.json or {}).get('object_name')
+    if not object_name:
+        return jsonify({"error": "Missing object_name"}), 400
+
+    conn = None
+    try:
+        try:
+            image_url = verify_uploaded_objects([object_name], UPLOAD_FOLDERS['profile'], user_id)[0]
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT profile_picture FROM users WHERE id = %s", (user_id,))
+        row = cursor.fetchone()
+        cursor.execute("UPDATE users SET profile_picture = %s WHERE id = %s", (image_url, user_id))
+        conn.commit()
+        cursor.close()
+        conn.close()
+        invalidate_user_profile(user_id)
+        release_replaced_picture(row[0] if row else None)
+
+        return jsonify({"message": "Profile picture updated", "image_url": image_url}), 200
+
+    except Exception as e:
+        log.error("Error in finalize_profile_picture: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn is not None:
+            conn.close()
+
+
 # Cart Routes
+CART_ITEMS_SQL = """
+    SELECT c.id as cart_id, c.quantity, 
+           p.id as product_id, p.name, p.description, p.price, p.image_url,
+           p.user_id as seller_id
+    FROM cart c
+    JOIN products p ON c.product_id = p.id
+    WHERE c.user_id = %s
+"""
+
+
 @app.route('/api/cart', methods=['GET'])
+@read_only
 def get_cart():
     try:
         user_id = get_current_user_id()
-        print(f"User ID from token: {user_id}")  # Debug log
+        log.debug("User ID from token: %s", user_id)
         
         if not user_id:
             return jsonify({"error": "Unauthorized"}), 401
 
         conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        cursor.execute("""
-            SELECT c.id as cart_id, c.quantity, 
-                   p.id as product_id, p.name, p.description, p.price, p.image_url,
-                   u.name as seller_name
-            FROM cart c
-            JOIN products p ON c.product_id = p.id
-            JOIN users u ON p.user_id = u.id
-            WHERE c.user_id = %s
-        """, (user_id,))
-        
-        cart_items = cursor.fetchall()
-        print(f"Found cart items: {cart_items}")  # Debug log
+        try:
+            cart_items = conn.execute_prepared(CART_ITEMS_SQL, (user_id,))
+        finally:
+            conn.close()
+
+        # Decorate with seller names from the profile cache instead of joining users
+        sellers = get_user_profiles(item['seller_id'] for item in cart_items)
+        for item in cart_items:
+            seller = sellers.get(item.pop('seller_id'))
+            item['seller_name'] = seller['name'] if seller else None
+        log.debug("Found cart items: %s", cart_items)
         
-        conn.close()
         return jsonify(cart_items)
         
     except Exception as e:
-        print(f"Error fetching cart: {str(e)}")
+        log.error("Error fetching cart: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/cart/<int:user_id>', methods=['GET'])
+@read_only
 def get_cart_items(user_id):
+    conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
@@ -873,12 +2322,15 @@ def get_cart_items(user_id):
         """, (user_id,))
         
         cart_items = cursor.fetchall()
-        conn.close()
+        cursor.close()
         
         return jsonify(cart_items)
     except Exception as e:
-        print(f"Error fetching cart items: {str(e)}")
+        log.error("Error fetching cart items: %s", e)
         return jsonify({"error": str(e)}), 500
+    finally:
+        if conn is not None:
+            conn.close()
 
 @app.route('/api/cart/add', methods=['POST'])
 def add_to_cart():
@@ -887,9 +2339,19 @@ def add_to_cart():
     product_id = int(data.get('productId'))  # Convert to int
     quantity = int(data.get('quantity', 1))  # Convert to int
     
+    conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
+
+        cursor.execute("SELECT status FROM products WHERE id = %s", (product_id,))
+        product = cursor.fetchone()
+        if not product:
+            conn.close()
+            return jsonify({"error": "Product not found"}), 404
+        if product['status'] != 'available':
+            conn.close()
+            return jsonify({"error": "Product has already been sold"}), 409
         
         # Check if item exists in cart
         cursor.execute(
@@ -911,14 +2373,19 @@ def add_to_cart():
             
         conn.commit()
         conn.close()
+        popularity.incr(product_id, "cart_adds")
         return jsonify({"message": "Added to cart successfully"})
         
     except Exception as e:
-        print(f"Error adding to cart: {str(e)}")
+        log.error("Error adding to cart: %s", e)
         return jsonify({"error": str(e)}), 500
+    finally:
+        if conn is not None:
+            conn.close()
 
 @app.route('/api/cart/remove', methods=['POST'])
 def remove_from_cart():
+    conn = None
     try:
         data = request.json
         user_id = data.get('userId')
@@ -952,38 +2419,34 @@ def remove_from_cart():
         return jsonify({"message": "Item removed successfully"})
 
     except Exception as e:
-        print(f"Error removing item from cart: {str(e)}")
+        log.error("Error removing item from cart: %s", e)
         return jsonify({"error": str(e)}), 500
+    finally:
+        if conn is not None:
+            conn.close()
 
 @app.route('/api/wishlist/check/<int:product_id>', methods=['POST'])
+@read_only
 def check_wishlist_status(product_id):
     data = request.get_json()
     user_id = data.get('userId')
     
+    conn = None
     try:
-        # First, get the image_url for this product
         conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
 
-        # Get the product's image_url
-        cursor.execute(
-            "SELECT image_url FROM products WHERE id = %s",
-            (product_id,)
-        )
-        product = cursor.fetchone()
+        rows = conn.execute_prepared("""
+            SELECT p.id, w.users_id AS wishlisted
+            FROM products p
+            LEFT JOIN wishlist w ON w.product_id = p.id AND w.users_id = %s
+            WHERE p.id = %s
+        """, (user_id, product_id))
         
-        if not product:
+        if not rows:
             conn.close()
             return jsonify({"status": "not_exists", "error": "Product not found"}), 404
-            
-        image_url = product['image_url']
-        
-        # Check if this image_url is in the user's wishlist
-        cursor.execute(
-            "SELECT * FROM wishlist WHERE users_id = %s AND image_url = %s",
-            (user_id, image_url)
-        )
-        wishlist_item = cursor.fetchone()
+
+        wishlist_item = rows[0]['wishlisted'] is not None
 
         conn.close()
 
@@ -993,19 +2456,83 @@ def check_wishlist_status(product_id):
             return jsonify({"status": "not_exists"})
             
     except Exception as e:
-        print(f"Error checking wishlist status: {str(e)}")
+        log.error("Error checking wishlist status: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+# =================== INVENTORY RESERVATIONS =================== #
+
+# How long a buyer's hold on their cart items lasts once they start checkout
+RESERVATION_TTL = int(os.getenv("RESERVATION_TTL_SECONDS", str(inventory.RESERVATION_TTL)))
+
+
+def after_product_sold(product_id):
+    """Takes a sold product out of the listing caches and in-memory indexes."""
+    invalidate_catalog_caches(product_id)
+    autocomplete_index.remove_product(product_id)
+    similarity_index.remove_product(product_id)
+
+
+@app.route('/api/checkout/reserve', methods=['POST', 'DELETE'])
+def checkout_reservation():
+    """POST holds every item in the user's cart for RESERVATION_TTL seconds, or none of them
+    (409 with the unavailable ids). DELETE releases the user's holds."""
+    data = request.get_json(silent=True) or {}
+    user_id = data.get('userId')
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+
+    def hold_cart():
+        conn = get_db_connection(read_only=False)
+        cursor = conn.cursor()
+        try:
+            conn.start_transaction()
+            if request.method == 'DELETE':
+                inventory.release(cursor, int(user_id))
+                conn.commit()
+                return jsonify({"message": "Reservation released"})
+
+            cursor.execute("SELECT product_id FROM cart WHERE user_id = %s", (user_id,))
+            product_ids = [row[0] for row in cursor.fetchall()]
+            if not product_ids:
+                conn.rollback()
+                return jsonify({"error": "Cart is empty"}), 400
+
+            # Items that left the cart since the last attempt lose their hold
+            inventory.replace_holds(cursor, int(user_id), product_ids, RESERVATION_TTL)
+            conn.commit()
+            return jsonify({"productIds": sorted(product_ids), "expiresIn": RESERVATION_TTL})
+
+        except inventory.Unavailable as e:
+            conn.rollback()
+            return jsonify({"error": "Some items are no longer available", "unavailable": e.product_ids}), 409
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    try:
+        return retry_on_deadlock(hold_cart)
+    except Exception as e:
+        log.error("Error reserving checkout items: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
 # Checkout Routes
 @app.route('/api/checkout', methods=['POST'])
+@idempotent
 def create_order():
-    try:
-        data = request.json
-        user_id = data.get('userId')  # Get userId from request body
-        if not user_id:
-            return jsonify({"error": "User ID is required"}), 400
+    data = request.get_json(silent=True) or {}
+    user_id = data.get('userId')  # Get userId from request body
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
 
+    def place_order():
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
 
@@ -1015,7 +2542,7 @@ def create_order():
 
             # Get cart items first
             cursor.execute("""
-                SELECT c.product_id, c.quantity, p.price, p.name
+                SELECT c.product_id, c.quantity, p.price, p.name, p.category
                 FROM cart c
                 JOIN products p ON c.product_id = p.id
                 WHERE c.user_id = %s
@@ -1025,6 +2552,13 @@ def create_order():
             if not cart_items:
                 return jsonify({"error": "Cart is empty"}), 400
 
+            # Locks just these products' rows until commit; fails if any was sold or is held by another buyer
+            inventory_cursor = conn.cursor()
+            try:
+                inventory.mark_sold(inventory_cursor, int(user_id), [item['product_id'] for item in cart_items])
+            finally:
+                inventory_cursor.close()
+
             # Calculate total amount
             total_amount = sum(item['price'] * item['quantity'] for item in cart_items)
 
@@ -1066,235 +2600,370 @@ def create_order():
             # Commit transaction
             conn.commit()
 
+            for item in cart_items:
+                popularity.incr(item['product_id'], "orders")
+                after_product_sold(item['product_id'])
+                publish_listing_event("sold", item['product_id'], item['category'], name=item['name'])
+
             return jsonify({
                 "message": "Order placed successfully",
                 "orderId": order_id
             })
 
+        except inventory.Unavailable as e:
+            conn.rollback()
+            return jsonify({"error": "Some items are no longer available", "unavailable": e.product_ids}), 409
+
         except Exception as e:
             conn.rollback()
-            print(f"Error in transaction: {str(e)}")
+            log.error("Error in transaction: %s", e)
             raise e
 
         finally:
             conn.close()
 
+    try:
+        return retry_on_deadlock(place_order)
     except Exception as e:
-        print(f"Error creating order: {str(e)}")
+        log.error("Error creating order: %s", e)
         return jsonify({"error": str(e)}), 500
 
+# =================== ORDER HISTORY =================== #
+
+# Orders older than this move to the archive tables (see order_archive.py); 0 keeps them all hot
+ORDER_ARCHIVE_AFTER_DAYS = float(os.getenv("ORDER_ARCHIVE_AFTER_DAYS", "0"))
+order_archiver = None
+if ORDER_ARCHIVE_AFTER_DAYS > 0:
+    order_archiver = order_archive.OrderArchiver(
+        lambda: get_db_connection(read_only=False),
+        max_age=ORDER_ARCHIVE_AFTER_DAYS * 86400,
+        interval=float(os.getenv("ORDER_ARCHIVE_INTERVAL_HOURS", "6")) * 3600,
+    )
+    order_archiver.start()
+
+
+def parse_order_page():
+    """(limit, before) from the request args; both optional. Raises ValueError."""
+    limit = request.args.get('limit')
+    before = request.args.get('before')
+    try:
+        limit = min(int(limit), 100) if limit else None
+        before = int(before) if before else None
+    except ValueError:
+        raise ValueError("limit and before must be integers")
+    if limit is not None and limit < 1:
+        raise ValueError("limit must be positive")
+    return limit, before
+
+
+def order_history(conn, sql, user_id, limit=None, before=None):
+    """Yields (tables, rows) for a user's orders, newest first: the hot tables, then the archive.
+
+    `sql` names the tables as {orders}, {items} and {addresses} and takes
+    {where} and {limit}. With a limit the archive is only queried once the
+    hot tables can't fill the page; `before` is the last order id of the
+    previous page.
+    """
+    where = "o.user_id = %s" + (" AND o.id < %s" if before else "")
+    for tables in order_archive.TIERS:
+        params = [user_id] + ([before] if before else []) + ([limit] if limit is not None else [])
+        rows = conn.execute_prepared(
+            sql.format(where=where, limit=" LIMIT %s" if limit is not None else "", **tables._asdict()),
+            params
+        )
+        yield tables, rows
+        if limit is not None:
+            limit -= len(rows)
+            if limit <= 0:
+                return
+
+
+GROUPED_ORDERS_SQL = """
+    SELECT 
+        o.id, o.user_id, o.total_amount, o.status, o.created_at,
+        da.full_name, da.phone, da.address, da.city, da.state, da.pincode,
+        GROUP_CONCAT(oi.product_id) as product_ids,
+        GROUP_CONCAT(oi.quantity) as quantities,
+        GROUP_CONCAT(oi.price) as prices,
+        GROUP_CONCAT(p.name) as product_names,
+        GROUP_CONCAT(p.image_url) as image_urls
+    FROM {orders} o
+    LEFT JOIN {addresses} da ON o.id = da.order_id
+    LEFT JOIN {items} oi ON o.id = oi.order_id
+    LEFT JOIN products p ON oi.product_id = p.id
+    WHERE {where}
+    GROUP BY o.id, da.id
+    ORDER BY o.created_at DESC, o.id DESC{limit}
+"""
+
+
 @app.route('/api/orders', methods=['GET'])
+@read_only
 def get_orders():
+    """The user's orders, newest first. Optional paging: limit, and before (the last id of the previous page)."""
     try:
         user_id = get_current_user_id()
         if not user_id:
             return jsonify({"error": "Unauthorized"}), 401
+        try:
+            limit, before = parse_order_page()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # Updated query with correct JOIN condition
-        cursor.execute("""
-            SELECT 
-                o.id, o.user_id, o.total_amount, o.status, o.created_at,
-                da.full_name, da.phone, da.address, da.city, da.state, da.pincode,
-                GROUP_CONCAT(oi.product_id) as product_ids,
-                GROUP_CONCAT(oi.quantity) as quantities,
-                GROUP_CONCAT(oi.price) as prices,
-                GROUP_CONCAT(p.name) as product_names,
-                GROUP_CONCAT(p.image_url) as image_urls
-            FROM orders o
-            LEFT JOIN delivery_addresses da ON o.id = da.order_id
-            LEFT JOIN order_items oi ON o.id = oi.order_id
-            LEFT JOIN products p ON oi.product_id = p.id
-            WHERE o.user_id = %s
-            GROUP BY o.id, da.id
-            ORDER BY o.created_at DESC
-        """, (user_id,))
-        
-        orders_data = cursor.fetchall()
-        print(f"Orders data: {orders_data}")  # Debug log
-        
-        orders = []
-        for order in orders_data:
-            # Format items data
-            product_ids = str(order['product_ids']).split(',') if order['product_ids'] else []
-            quantities = str(order['quantities']).split(',') if order['quantities'] else []
-            prices = str(order['prices']).split(',') if order['prices'] else []
-            names = str(order['product_names']).split(',') if order['product_names'] else []
-            images = str(order['image_urls']).split(',') if order['image_urls'] else []
-            
-            items = [
-                {
-                    'id': pid,
-                    'quantity': int(qty),
-                    'price': float(price),
-                    'name': name,
-                    'image_url': img
-                }
-                for pid, qty, price, name, img in zip(product_ids, quantities, prices, names, images)
-                if pid and qty and price and name
+        try:
+            orders_data = [
+                order for _, rows in order_history(conn, GROUPED_ORDERS_SQL, user_id, limit, before) for order in rows
             ]
-            
-            orders.append({
-                'id': order['id'],
-                'total_amount': float(order['total_amount']),
-                'status': order['status'],
-                'created_at': order['created_at'].isoformat() if order['created_at'] else None,
-                'delivery_address': {
-                    'full_name': order['full_name'],
-                    'phone': order['phone'],
-                    'address': order['address'],
-                    'city': order['city'],
-                    'state': order['state'],
-                    'pincode': order['pincode']
-                },
-                'items': items
-            })
+        finally:
+            conn.close()
+        log.debug("Orders data: %s", orders_data)
         
-        print(f"Formatted orders: {orders}")  # Debug log
+        orders = [shape_grouped_order(order) for order in orders_data]
+        
+        log.debug("Formatted orders: %s", orders)
+        memory_profiler.checkpoint()
         return jsonify(orders)
         
     except Exception as e:
-        print(f"Error fetching orders: {str(e)}")
+        log.error("Error fetching orders: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
 @app.route('/api/orders/<int:order_id>', methods=['GET'])
+@read_only
 def get_order_details(order_id):
+    conn = None
     try:
         conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
 
-        # Get order details
-        cursor.execute("""
-            SELECT o.*, 
-                   d.full_name, d.phone, d.address, d.city, d.state, d.pincode, d.hostel_room
-            FROM orders o
-            LEFT JOIN delivery_addresses d ON o.id = d.order_id
-            WHERE o.id = %s
-        """, (order_id,))
-        order = cursor.fetchone()
-
-        if not order:
+        # Get order details, from the archive if it has been moved there
+        for tables in order_archive.TIERS:
+            rows = conn.execute_prepared(f"""
+                SELECT o.*, 
+                       d.full_name, d.phone, d.address, d.city, d.state, d.pincode, d.hostel_room
+                FROM {tables.orders} o
+                LEFT JOIN {tables.addresses} d ON o.id = d.order_id
+                WHERE o.id = %s
+            """, (order_id,))
+            if rows:
+                break
+
+        if not rows:
+            conn.close()
             return jsonify({"error": "Order not found"}), 404
+        order = rows[0]
 
         # Get order items
-        cursor.execute("""
-            SELECT oi.*, p.name, p.image_url
-            FROM order_items oi
+        items = conn.execute_prepared(f"""
+            SELECT oi.*, p.name, p.image_url, p.user_id as seller_id
+            FROM {tables.items} oi
             JOIN products p ON oi.product_id = p.id
             WHERE oi.order_id = %s
         """, (order_id,))
-        items = cursor.fetchall()
+        # Released before the profile lookup, which may need a pooled connection of its own
+        conn.close()
+        sellers = get_user_profiles(item['seller_id'] for item in items)
 
         # Construct response
-        response = {
-            "id": order['id'],
-            "user_id": order['user_id'],
-            "status": order['status'],
-            "total_amount": float(order['total_amount']),
-            "created_at": order['created_at'].isoformat(),
-            "delivery_address": {
-                "full_name": order['full_name'],
-                "phone": order['phone'],
-                "address": order['address'],
-                "city": order['city'],
-                "state": order['state'],
-                "pincode": order['pincode'],
-                "hostel_room": order['hostel_room']
-            },
-            "items": [{
-                "id": item['id'],
-                "product_id": item['product_id'],
-                "quantity": item['quantity'],
-                "price": float(item['price']),
-                "name": item['name'],
-                "image_url": item['image_url']
-            } for item in items]
-        }
-
-        cursor.close()
-        conn.close()
+        response = shape_order_detail(order, items, sellers)
 
         return jsonify(response)
 
     except Exception as e:
-        print(f"Error fetching order details: {str(e)}")
+        log.error("Error fetching order details: %s", e)
         return jsonify({"error": str(e)}), 500
+    finally:
+        if conn is not None:
+            conn.close()
 
 
 @app.route('/api/orders/user/<int:user_id>', methods=['GET'])
+@read_only
 def get_user_orders(user_id):
+    """A user's orders, newest first. Optional paging: limit, and before (the last id of the previous page)."""
+    conn = None
     try:
+        try:
+            limit, before = parse_order_page()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        # First, get all orders for the user
-        cursor.execute("""
+        # First, get the orders for the user
+        history = order_history(conn, """
             SELECT o.id, o.total_amount, o.status, o.created_at
-            FROM orders o
-            WHERE o.user_id = %s
-        """, (user_id,))
-        
-        orders_data = cursor.fetchall()
+            FROM {orders} o
+            WHERE {where}
+            ORDER BY o.created_at DESC, o.id DESC{limit}
+        """, user_id, limit, before)
         
         # Format the orders data
         orders = []
-        for order in orders_data:
-            # Get delivery address for this order
-            cursor.execute("""
-                SELECT full_name, phone, address, city, state, pincode, hostel_room
-                FROM delivery_addresses
-                WHERE order_id = %s
-            """, (order['id'],))
-            
-            address_data = cursor.fetchone() or {}
-            
-            # Get order items for this order
-            cursor.execute("""
-                SELECT oi.product_id, oi.quantity, oi.price, p.name, p.image_url
-                FROM order_items oi
-                JOIN products p ON oi.product_id = p.id
-                WHERE oi.order_id = %s
-            """, (order['id'],))
-            
-            items_data = cursor.fetchall() or []
-            
-            # Format order data
-            orders.append({
-                'id': order['id'],
-                'total_amount': float(order['total_amount']),
-                'status': order['status'],
-                'created_at': order['created_at'].isoformat() if order['created_at'] else None,
-                'delivery_address': {
-                    'full_name': address_data.get('full_name', ''),
-                    'phone': address_data.get('phone', ''),
-                    'address': address_data.get('address', ''),
-                    'city': address_data.get('city', ''),
-                    'state': address_data.get('state', ''),
-                    'pincode': address_data.get('pincode', '')
-                },
-                'items': [
-                    {
-                        'id': item['product_id'],
-                        'quantity': item['quantity'],
-                        'price': float(item['price']),
-                        'name': item['name'],
-                        'image_url': item['image_url']
-                    }
-                    for item in items_data
-                ]
-            })
+        for tables, orders_data in history:
+            for order in orders_data:
+                # Get delivery address for this order
+                cursor.execute(f"""
+                    SELECT full_name, phone, address, city, state, pincode, hostel_room
+                    FROM {tables.addresses}
+                    WHERE order_id = %s
+                """, (order['id'],))
+                
+                address_data = cursor.fetchone() or {}
+                
+                # Get order items for this order
+                cursor.execute(f"""
+                    SELECT oi.product_id, oi.quantity, oi.price, p.name, p.image_url
+                    FROM {tables.items} oi
+                    JOIN products p ON oi.product_id = p.id
+                    WHERE oi.order_id = %s
+                """, (order['id'],))
+                
+                items_data = cursor.fetchall() or []
+                
+                # Format order data
+                orders.append(shape_user_order(order, address_data, items_data))
         
         cursor.close()
         conn.close()
         return jsonify(orders)
         
     except Exception as e:
-        print(f"Error fetching user orders: {str(e)}")
+        log.error("Error fetching user orders: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+# =================== EXPORTS =================== #
+
+# Exports include every user's contact details and delivery addresses; they're disabled without a key
+EXPORT_API_KEY = os.getenv("EXPORT_API_KEY")
+
+
+def export_response(conn, cursor, records, fmt, fields, name):
+    """Streams records as NDJSON or CSV, closing the connection once the stream is drained."""
+    def generate():
+        try:
+            if fmt == 'csv':
+                yield from exports.csv_lines(records, fields)
+            else:
+                yield from exports.ndjson_lines(records)
+        finally:
+            try:
+                cursor.close()
+            except mysql.connector.Error as e:
+                # A client that disconnects mid-stream leaves unread rows; the pool drains them on release
+                log.debug("Closing export cursor: %s", e)
+            finally:
+                conn.close()
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{name}.{"csv" if fmt == "csv" else "ndjson"}"'
+    return response
+
+
+def check_export_request():
+    """Returns (format, error response)."""
+    if not EXPORT_API_KEY:
+        return None, (jsonify({"error": "Exports are not enabled"}), 503)
+    if request.headers.get('X-Export-Key') != EXPORT_API_KEY:
+        return None, (jsonify({"error": "Unauthorized"}), 401)
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return None, (jsonify({"error": "format must be ndjson or csv"}), 400)
+    return fmt, None
+
+
+@app.route('/api/export/orders', methods=['GET'])
+@read_only
+def export_orders():
+    """Stream orders with delivery address and items.
+
+    Filters: from / to (ISO dates, to is exclusive), user_id (buyer), seller_id.
+    NDJSON yields one nested order per line; CSV yields one line per order item.
+    """
+    fmt, error = check_export_request()
+    if error:
+        return error
+
+    query = """
+        SELECT o.id as order_id, o.user_id, o.status, o.total_amount, o.created_at,
+               da.full_name, da.phone, da.address, da.city, da.state, da.pincode, da.hostel_room,
+               oi.id as item_id, oi.product_id, p.name as product_name, oi.quantity, oi.price
+        FROM {orders} o
+        LEFT JOIN {addresses} da ON o.id = da.order_id
+        LEFT JOIN {items} oi ON o.id = oi.order_id
+        LEFT JOIN products p ON oi.product_id = p.id
+        WHERE 1=1
+    """
+    params = []
+    try:
+        if request.args.get('from'):
+            query += " AND o.created_at >= %s"
+            params.append(datetime.fromisoformat(request.args['from']))
+        if request.args.get('to'):
+            query += " AND o.created_at < %s"
+            params.append(datetime.fromisoformat(request.args['to']))
+    except ValueError:
+        return jsonify({"error": "from/to must be ISO dates"}), 400
+    if request.args.get('user_id'):
+        query += " AND o.user_id = %s"
+        params.append(request.args['user_id'])
+    if request.args.get('seller_id'):
+        query += " AND p.user_id = %s"
+        params.append(request.args['seller_id'])
+    query += " ORDER BY o.id"
+    # Archived orders included: every archived id is below every hot one, so streaming the
+    # archive and then the hot tables, each in primary key order, keeps ids ascending
+    # without sorting their union
+    queries = [(query.format(**tables._asdict()), params) for tables in reversed(order_archive.TIERS)]
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        # Unbuffered cursor: rows are pulled from the server as the response is written
+        cursor = conn.cursor(dictionary=True, buffered=False)
+        cursor.execute(*queries[0])
+    except Exception as e:
+        log.error("Error exporting orders: %s", e)
+        if conn is not None:
+            conn.close()
         return jsonify({"error": str(e)}), 500
 
+    rows = exports.iter_queries(cursor, queries[1:])
+    if fmt == 'csv':
+        records = exports.flatten_order_rows(rows)
+    else:
+        records = exports.group_order_rows(rows)
+    return export_response(conn, cursor, records, fmt, exports.ORDER_CSV_FIELDS, "orders")
+
+
+@app.route('/api/export/users', methods=['GET'])
+@read_only
+def export_users():
+    """Stream all users as NDJSON or CSV."""
+    fmt, error = check_export_request()
+    if error:
+        return error
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True, buffered=False)
+        cursor.execute("SELECT id, name, email, phone, verified FROM users ORDER BY id")
+    except Exception as e:
+        log.error("Error exporting users: %s", e)
+        if conn is not None:
+            conn.close()
+        return jsonify({"error": str(e)}), 500
+
+    return export_response(conn, cursor, exports.iter_cursor(cursor), fmt, exports.USER_CSV_FIELDS, "users")
+
 
 if __name__ == "__main__":
     app.run(debug=True)
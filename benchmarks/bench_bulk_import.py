@@ -0,0 +1,91 @@
+"""Measures bulk import throughput (rows/sec) against in-memory fakes for MySQL and GCS.
+
+Upload latency is simulated with a sleep so the effect of --workers is visible.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bulk_import import BulkImporter, read_rows  # noqa: E402
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.lastrowid = None
+        self._result = []
+
+    def execute(self, query, params=()):
+        if query.lstrip().startswith("INSERT INTO products"):
+            self.lastrowid = len(self.db["products"]) + 1
+            for i in range(0, len(params), 9):
+                self.db["products"].append(params[i + 6])
+        elif query.startswith("SELECT id, image_url FROM products"):
+            first, last = params
+            self._result = [(pid, self.db["products"][pid - 1]) for pid in range(first, last + 1)]
+        else:
+            self.db["product_images"] += len(params) // 2
+
+    def fetchall(self):
+        return self._result
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self):
+        return FakeCursor(self.db)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--images", type=int, default=3)
+    parser.add_argument("--upload-ms", type=float, default=2.0)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    lines = io.StringIO("".join(
+        json.dumps({
+            "user_id": 1, "name": f"Item {i}", "description": "Synthetic listing", "category": "Books",
+            "price": "199.00", "images": [f"https://example.com/{i}_{n}.jpg" for n in range(args.images)]
+        }) + "\n" for i in range(args.rows)
+    ))
+
+    db = {"products": [], "product_images": 0}
+    counter = iter(range(10 ** 9))
+
+    def upload_bytes(data, filename, folder):
+        time.sleep(args.upload_ms / 1000)
+        return f"https://storage.googleapis.com/unisale-storage/{folder}/{next(counter)}_{filename}"
+
+    importer = BulkImporter(lambda: FakeConnection(db), upload_bytes, lambda url: None,
+                            lambda name: True, batch_size=args.batch_size, workers=args.workers)
+    importer._upload_one = lambda source: upload_bytes(b"", os.path.basename(source), "product-image")
+
+    stats = importer.run(read_rows(lines, "jsonl"))
+    print(f"{stats['imported']} rows, {db['product_images']} images in {stats['elapsed_seconds']}s "
+          f"-> {stats['rows_per_second']} rows/s (workers={args.workers}, batch={args.batch_size})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Checkout throughput with many buyers competing for a few popular items.
+
+Buyer threads go through rounds; in each round every buyer tries to buy one of
+the same few fresh "hot" products (sometimes together with a random cold one)
+the way /api/checkout does: lock, check, mark sold, record the order. Only one
+buyer per item can win, the rest must be rejected. Compares row locks on just
+the purchased ids (inventory.mark_sold) against serializing every checkout on a
+table lock, and checks that no product was sold twice.
+
+Creates its own tables in a scratch database and never touches the app's:
+    MYSQL_HOST=localhost MYSQL_USER=root MYSQL_PASSWORD= MYSQL_DATABASE=unisale_bench \\
+        python benchmarks/bench_checkout_contention.py --buyers 32 --hot 5
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import inventory  # noqa: E402
+from db import ConnectionPool  # noqa: E402
+
+SCHEMA = [
+    "DROP TABLE IF EXISTS order_items, products, product_reservations",
+    """CREATE TABLE products (
+        id INT NOT NULL PRIMARY KEY,
+        price DECIMAL(10, 2) NOT NULL,
+        status ENUM('available', 'sold') NOT NULL DEFAULT 'available'
+    )""",
+    """CREATE TABLE product_reservations (
+        product_id INT NOT NULL PRIMARY KEY,
+        user_id INT NOT NULL,
+        expires_at DATETIME NOT NULL,
+        KEY idx_reservations_user (user_id)
+    )""",
+    """CREATE TABLE order_items (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        product_id INT NOT NULL,
+        price DECIMAL(10, 2) NOT NULL
+    )""",
+]
+
+
+def setup(pool, products):
+    conn = pool.get()
+    cursor = conn.cursor()
+    for statement in SCHEMA:
+        cursor.execute(statement)
+    for start in range(1, products + 1, 1000):
+        ids = range(start, min(start + 1000, products + 1))
+        cursor.execute(
+            "INSERT INTO products (id, price) VALUES " + ", ".join(["(%s, 100)"] * len(ids)),
+            list(ids)
+        )
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def checkout_row_locks(conn, user_id, product_ids):
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        inventory.mark_sold(cursor, user_id, product_ids)
+        cursor.executemany(
+            "INSERT INTO order_items (user_id, product_id, price) VALUES (%s, %s, 100)",
+            [(user_id, product_id) for product_id in product_ids]
+        )
+        conn.commit()
+        return True
+    except inventory.Unavailable:
+        conn.rollback()
+        return False
+    finally:
+        cursor.close()
+
+
+def checkout_table_lock(conn, user_id, product_ids):
+    # Baseline: every checkout serialized behind one lock on the tables involved
+    cursor = conn.cursor()
+    try:
+        cursor.execute("LOCK TABLES products WRITE, product_reservations WRITE, order_items WRITE")
+        placeholders = ", ".join(["%s"] * len(product_ids))
+        cursor.execute(
+            f"SELECT COUNT(*) FROM products WHERE id IN ({placeholders}) AND status = 'available'",
+            product_ids
+        )
+        if cursor.fetchone()[0] != len(product_ids):
+            return False
+        cursor.execute(f"UPDATE products SET status = 'sold' WHERE id IN ({placeholders})", product_ids)
+        cursor.executemany(
+            "INSERT INTO order_items (user_id, product_id, price) VALUES (%s, %s, 100)",
+            [(user_id, product_id) for product_id in product_ids]
+        )
+        conn.commit()
+        return True
+    finally:
+        cursor.execute("UNLOCK TABLES")
+        cursor.close()
+
+
+def run(pool, checkout, buyers, rounds, hot, cold):
+    stats = {"sold": 0, "rejected": 0}
+    lock = threading.Lock()
+
+    def buyer(user_id):
+        rng = random.Random(user_id)
+        conn = pool.get()
+        sold = rejected = 0
+        try:
+            for round_ in range(rounds):
+                # This round's hot items, sometimes in a cart with a cold one
+                product_ids = [round_ * hot + rng.randint(1, hot)]
+                if rng.random() < 0.3:
+                    product_ids.append(rng.randint(rounds * hot + 1, rounds * hot + cold))
+                if checkout(conn, user_id, product_ids):
+                    sold += 1
+                else:
+                    rejected += 1
+        finally:
+            conn.close()
+        with lock:
+            stats["sold"] += sold
+            stats["rejected"] += rejected
+
+    threads = [threading.Thread(target=buyer, args=(user_id,)) for user_id in range(1, buyers + 1)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def double_sold(pool):
+    conn = pool.get()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM (SELECT product_id FROM order_items GROUP BY product_id HAVING COUNT(*) > 1) d")
+    count = cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--buyers", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=50, help="checkouts attempted per buyer")
+    parser.add_argument("--hot", type=int, default=5, help="popular products everyone competes for per round")
+    parser.add_argument("--cold", type=int, default=5000)
+    args = parser.parse_args()
+
+    database = os.getenv("MYSQL_DATABASE", "unisale_bench")
+    if database == "unisale":
+        sys.exit("Refusing to drop tables in the app database; point MYSQL_DATABASE at a scratch one")
+    pool = ConnectionPool(
+        size=args.buyers,
+        host=os.getenv("MYSQL_HOST", "localhost"),
+        user=os.getenv("MYSQL_USER", "root"),
+        password=os.getenv("MYSQL_PASSWORD", ""),
+        database=database,
+    )
+
+    attempts = args.buyers * args.rounds
+    for name, checkout in (("table lock", checkout_table_lock), ("row locks", checkout_row_locks)):
+        setup(pool, args.rounds * args.hot + args.cold)
+        stats = run(pool, checkout, args.buyers, args.rounds, args.hot, args.cold)
+        print(f"{name}: {attempts / stats['seconds']:.0f} checkouts/s, {stats['sold']} sold, "
+              f"{stats['rejected']} rejected, {double_sold(pool)} double-sold "
+              f"({args.buyers} buyers, {args.hot} hot products)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Streams a synthetic 1M-row order export through the NDJSON/CSV shaping and reports peak RSS.
+
+Rows are generated lazily, standing in for an unbuffered MySQL cursor, so the
+peak RSS reflects the export pipeline itself. It should stay flat as --rows grows.
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+from datetime import datetime
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import exports  # noqa: E402
+
+
+def synthetic_rows(count, items_per_order=3):
+    created_at = datetime(2025, 1, 1)
+    for i in range(count):
+        order_id = i // items_per_order + 1
+        yield {
+            "order_id": order_id, "user_id": order_id % 5000, "status": "pending",
+            "total_amount": Decimal("597.00"), "created_at": created_at,
+            "full_name": "Test Student", "phone": "9999999999", "address": "Block A",
+            "city": "Dehradun", "state": "Uttarakhand", "pincode": "248007", "hostel_room": "A-101",
+            "product_id": i, "product_name": f"Item {i}", "quantity": 1, "price": Decimal("199.00")
+        }
+
+
+def peak_rss_mb():
+    # ru_maxrss is KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    args = parser.parse_args()
+
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    rows = synthetic_rows(args.rows)
+    if args.format == "csv":
+        chunks = exports.csv_lines(exports.flatten_order_rows(rows), exports.ORDER_CSV_FIELDS)
+    else:
+        chunks = exports.ndjson_lines(exports.group_order_rows(rows))
+
+    written = 0
+    for chunk in chunks:
+        written += len(chunk)
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.format}: {args.rows} rows, {written / 1e6:.1f} MB written in {elapsed:.1f}s, "
+          f"peak RSS {peak_rss_mb():.1f} MB (baseline {baseline:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
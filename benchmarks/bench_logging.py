@@ -0,0 +1,112 @@
+"""Cost of request-path logging: print() versus the queued JSON logger in logs.py.
+
+Eight threads each run a request that writes what get_cart used to print (the
+user id and the full cart rows) plus one access line, into a pipe drained by
+another thread the way a container runtime drains stdout. Times are what the
+request threads spend; the queued logger's writer thread is timed separately
+until the queue has drained.
+"""
+import io
+import logging
+import os
+import sys
+import threading
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from logs import setup_logging  # noqa: E402
+
+THREADS = 8
+REQUESTS = 2000     # per thread
+
+CART = [{"cart_id": i, "quantity": 1, "product_id": 1000 + i, "name": f"Product {i}",
+         "description": "Some description " * 4, "price": Decimal("199.00"),
+         "image_url": f"https://storage.googleapis.com/bucket/product-image/{i:064x}.jpg", "seller_id": 7}
+        for i in range(10)]
+
+
+def open_sink():
+    """A text stream over a pipe whose other end is read by a drain thread."""
+    read_fd, write_fd = os.pipe()
+
+    def drain():
+        with os.fdopen(read_fd, "rb") as pipe:
+            while pipe.read(65536):
+                pass
+
+    drainer = threading.Thread(target=drain, daemon=True)
+    drainer.start()
+    return io.TextIOWrapper(os.fdopen(write_fd, "wb"), line_buffering=True), drainer
+
+
+def run_threads(request):
+    def worker():
+        for _ in range(REQUESTS):
+            request()
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start
+
+
+def bench_print():
+    sink, drainer = open_sink()
+    stdout, sys.stdout = sys.stdout, sink
+    try:
+        def request():
+            print(f"User ID from token: {42}")
+            print(f"Found cart items: {CART}")
+            print(f"GET /api/cart 200 {1.2}ms")
+        elapsed = run_threads(request)
+    finally:
+        sys.stdout = stdout
+        sink.close()
+        drainer.join()
+    return elapsed
+
+
+def bench_logging(level, sample_rate):
+    sink, drainer = open_sink()
+    # Unbounded queue so every line is written and the comparison with print() is like for like
+    handler = setup_logging(level=level, debug_sample_rate=sample_rate, stream=sink, max_queue=0,
+                            context=lambda: {"request_id": "0" * 32, "route": "get_cart"})
+    log = logging.getLogger("unisale")
+
+    def request():
+        log.debug("User ID from token: %s", 42)
+        log.debug("Found cart items: %s", CART)
+        log.info("%s %s %s", "GET", "/api/cart", 200, extra={"method": "GET", "status": 200, "duration_ms": 1.2})
+
+    elapsed = run_threads(request)
+    start = time.perf_counter()
+    handler.queue.join()
+    drain = time.perf_counter() - start
+    logging.getLogger().removeHandler(handler)
+    sink.close()
+    drainer.join()
+    return elapsed, drain
+
+
+def main():
+    total = THREADS * REQUESTS
+    elapsed = bench_print()
+    baseline = elapsed / total
+    print(f"print(): {baseline * 1e6:.1f} us/request on the request threads")
+
+    for label, level, rate in (("logging, INFO", "INFO", 1.0),
+                               ("logging, DEBUG sampled 1%", "DEBUG", 0.01),
+                               ("logging, DEBUG", "DEBUG", 1.0)):
+        elapsed, drain = bench_logging(level, rate)
+        per_request = elapsed / total
+        print(f"{label}: {per_request * 1e6:.1f} us/request ({per_request / baseline:.2f}x print), "
+              f"writer drained {drain * 1000:.0f} ms later")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Overhead of sampled allocation profiling on a handler that materializes a result set,
+and what a sample reports for it."""
+import os
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from memprofile import AllocationProfiler  # noqa: E402
+
+REQUESTS = 2000
+
+
+def fake_handler(profiler):
+    # fetchall() plus a per-row dict, like get_products()
+    rows = [(i, 1, f"Product {i}", "Some description " * 4, "Books", "Good", Decimal("199.00"))
+            for i in range(2000)]
+    products = [dict(zip(("id", "user_id", "name", "description", "category", "state", "price"), row))
+                for row in rows]
+    for product in products:
+        product["price"] = float(product["price"])
+    profiler.checkpoint()
+    return len(products)
+
+
+def run(sample_rate):
+    profiler = AllocationProfiler(sample_rate=sample_rate)
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        token = profiler.start()
+        fake_handler(profiler)
+        if token is not None:
+            profiler.finish(token, "get_products")
+    elapsed = time.perf_counter() - start
+    return elapsed / REQUESTS, profiler
+
+
+def main():
+    baseline, _ = run(0)
+    print(f"no profiling: {baseline * 1000:.2f} ms/request")
+    for rate in (0.01, 0.1, 1.0):
+        per_request, profiler = run(rate)
+        print(f"sample rate {rate}: {per_request * 1000:.2f} ms/request "
+              f"(+{(per_request / baseline - 1) * 100:.1f}%), {profiler.stats['sampled']} samples")
+
+    report = profiler.report()["get_products"]
+    print(f"median peak {report['peak_bytes_median'] / 1024:.0f} KiB over {report['samples']} samples")
+    for site in report["recent"][0]["top_sites"][:3]:
+        print(f"  {site['site']}: {site['bytes'] / 1024:.0f} KiB in {site['blocks']} blocks")
+
+
+if __name__ == "__main__":
+    main()
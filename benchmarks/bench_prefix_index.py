@@ -0,0 +1,71 @@
+"""Reports prefix index rebuild time, memory per 100k names and suggestion latency."""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from prefix_index import PrefixIndex  # noqa: E402
+
+WORDS = ("casio scientific calculator engineering drawing kit lab coat hostel mattress cycle "
+         "physics chemistry textbook notes laptop stand headphones kettle study table chair "
+         "guitar cricket bat football shoes jacket hoodie backpack charger monitor keyboard").split()
+CATEGORIES = ["Books", "Electronics", "Furniture", "Clothing", "Sports", "Stationery", "Others"]
+
+
+def synthetic_products(count, seed=7):
+    rng = random.Random(seed)
+    for product_id in range(1, count + 1):
+        name = " ".join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(2, 4)))
+        yield product_id, f"{name} {product_id % 997}", rng.choice(CATEGORIES)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=100000)
+    args = parser.parse_args()
+
+    products = list(synthetic_products(args.products))
+    index = PrefixIndex()
+
+    start = time.perf_counter()
+    index.rebuild(products)
+    rebuild_seconds = time.perf_counter() - start
+
+    # Measured on a second build, tracemalloc slows the timed one down considerably
+    index = PrefixIndex()
+    tracemalloc.start()
+    index.rebuild(products)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    prefixes = ["c", "ca", "calc", "lab co", "hostel m", "text", "zz", "b"]
+    rounds = 5000
+    start = time.perf_counter()
+    for i in range(rounds):
+        index._results = {}
+        index.suggest(prefixes[i % len(prefixes)])
+    per_cold_lookup = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    for i in range(rounds):
+        index.suggest(prefixes[i % len(prefixes)])
+    per_lookup = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    for product_id, name, category in synthetic_products(1000, seed=11):
+        index.add_product(args.products + product_id, name, category)
+    per_insert = (time.perf_counter() - start) / 1000
+
+    print(f"{args.products} products -> {len(index)} keys")
+    print(f"rebuild: {rebuild_seconds:.2f}s, index memory: {current / 1e6:.1f} MB "
+          f"({current / 1e6 * 100000 / args.products:.1f} MB per 100k names)")
+    print(f"suggest: {per_cold_lookup * 1e6:.1f} us/lookup uncached, {per_lookup * 1e6:.1f} us/lookup memoized")
+    print(f"incremental add: {per_insert * 1e6:.1f} us/product")
+
+
+if __name__ == "__main__":
+    main()
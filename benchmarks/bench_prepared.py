@@ -0,0 +1,78 @@
+"""Compares text-protocol vs server-side prepared execution of the hot catalog and cart queries.
+
+Needs a MySQL server with the unisale schema:
+    MYSQL_HOST=localhost MYSQL_USER=root MYSQL_PASSWORD= python benchmarks/bench_prepared.py --threads 8
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from db import ConnectionPool  # noqa: E402
+from query_builder import QueryPlanner, ProductFilters  # noqa: E402
+
+CART_ITEMS_SQL = """
+    SELECT c.id as cart_id, c.quantity,
+           p.id as product_id, p.name, p.description, p.price, p.image_url,
+           p.user_id as seller_id
+    FROM cart c
+    JOIN products p ON c.product_id = p.id
+    WHERE c.user_id = %s
+"""
+
+
+def workload():
+    planner = QueryPlanner()
+    listing = planner.listing(ProductFilters("", ("Books",), (), None, 500.0, None, None, None, "newest"))
+    return [("get-products", *listing), ("cart", CART_ITEMS_SQL, [1])]
+
+
+def run(pool, sql, params, prepared, threads, rounds):
+    def worker():
+        conn = pool.get()
+        try:
+            for _ in range(rounds):
+                if prepared:
+                    conn.execute_prepared(sql, params)
+                else:
+                    cursor = conn.cursor(dictionary=True)
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+                    cursor.close()
+        finally:
+            conn.close()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return threads * rounds / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    pool = ConnectionPool(
+        size=args.threads,
+        host=os.getenv("MYSQL_HOST", "localhost"),
+        user=os.getenv("MYSQL_USER", "root"),
+        password=os.getenv("MYSQL_PASSWORD", ""),
+        database=os.getenv("MYSQL_DATABASE", "unisale"),
+    )
+    for name, sql, params in workload():
+        text_qps = run(pool, sql, params, False, args.threads, args.rounds)
+        prepared_qps = run(pool, sql, params, True, args.threads, args.rounds)
+        print(f"{name}: text {text_qps:.0f} q/s, prepared {prepared_qps:.0f} q/s "
+              f"({(prepared_qps / text_qps - 1) * 100:+.1f}%) with {args.threads} threads")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Measures per-request overhead of the rate limiter (no Flask, no MySQL)."""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rate_limit import RateLimiter  # noqa: E402
+
+ROUNDS = 500000
+CLIENTS = 10000
+
+
+def bench_limiter():
+    limiter = RateLimiter({"get_products": (20, 5)}, (60, 10))
+    clients = [f"uid:{i}" for i in range(CLIENTS)]
+
+    start = time.perf_counter()
+    for i in range(ROUNDS):
+        limiter.check("get_products", clients[i % CLIENTS])
+    elapsed = time.perf_counter() - start
+    print(f"RateLimiter.check: {elapsed / ROUNDS * 1e9:.0f} ns/op ({CLIENTS} clients)")
+
+
+def bench_limiter_threads(threads=8):
+    limiter = RateLimiter({}, (60, 10))
+    per_thread = ROUNDS // threads
+
+    def worker(n):
+        for i in range(per_thread):
+            limiter.check("get_products", f"ip:{n}.{i % 1000}")
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    print(f"RateLimiter.check with {threads} threads: {elapsed / (per_thread * threads) * 1e9:.0f} ns/op")
+
+
+if __name__ == "__main__":
+    bench_limiter()
+    bench_limiter_threads()
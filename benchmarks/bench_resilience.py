@@ -0,0 +1,67 @@
+"""Fault injection against local fakes: shows latency stays bounded when a dependency
+hangs or fails, and that the breaker fails fast once open."""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from resilience import (  # noqa: E402
+    CircuitBreaker, CircuitOpenError, DeadlineExceeded, call_with_deadline, retry
+)
+
+
+class FakeUpstreamError(Exception):
+    pass
+
+
+def hanging_upstream():
+    time.sleep(30)
+
+
+def failing_upstream():
+    time.sleep(0.05)
+    raise FakeUpstreamError("503 Service Unavailable")
+
+
+def timed(label, fn, calls=10):
+    latencies = []
+    outcomes = {}
+    for _ in range(calls):
+        start = time.perf_counter()
+        try:
+            fn()
+            outcome = "ok"
+        except Exception as e:
+            outcome = type(e).__name__
+        latencies.append(time.perf_counter() - start)
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    print(f"{label}: max {max(latencies) * 1000:.0f} ms, "
+          f"mean {sum(latencies) / len(latencies) * 1000:.0f} ms, outcomes {outcomes}")
+
+
+def main():
+    # A hanging dependency costs the caller at most the deadline, and the breaker then fails fast
+    breaker = CircuitBreaker("hang", failure_threshold=3, reset_timeout=60)
+    timed("hanging upstream, 0.5s deadline + breaker",
+          lambda: breaker.call(call_with_deadline, hanging_upstream, 0.5,
+                               is_failure=lambda e: isinstance(e, DeadlineExceeded)))
+
+    # A failing dependency: bounded jittered retries, then the breaker opens
+    breaker = CircuitBreaker("fail", failure_threshold=5, reset_timeout=60)
+    timed("failing upstream, 3 retries within 1s + breaker",
+          lambda: retry(lambda: breaker.call(failing_upstream), attempts=3, base_delay=0.1,
+                        deadline=time.monotonic() + 1, retry_on=(FakeUpstreamError,)))
+    print(f"breaker after failures: {breaker.snapshot()}")
+
+    # Half-open recovery once the upstream is healthy again
+    breaker.opened_at -= breaker.reset_timeout
+    try:
+        breaker.call(lambda: "ok")
+    except CircuitOpenError:
+        pass
+    print(f"breaker after successful trial call: {breaker.snapshot()['state']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Micro-benchmarks for the response shaping functions in shaping.py, on synthetic rows.
+
+Each run appends one JSON line (commit, Python version, best-of-N seconds per
+function and scale) to the results file and prints the change against the
+previous run recorded there, so runs on different commits can be compared.
+
+Usage:
+    python benchmarks/bench_shaping.py [--scales 1000 10000 100000] [--repeat 5]
+                                       [--output benchmarks/results/shaping.jsonl]
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import shaping  # noqa: E402
+
+CREATED = datetime(2025, 1, 1, 12, 0, 0)
+
+
+def price(rng):
+    return Decimal(rng.randint(50, 50000)) / 100
+
+
+def listing_rows(n, rng):
+    return [{
+        "id": i, "user_id": rng.randint(1, 500), "name": f"Product {i}",
+        "description": "Lightly used, works perfectly", "category": "Books",
+        "state": "Good", "price": price(rng), "image_url": f"https://storage.googleapis.com/b/product-image/{i}.jpg",
+    } for i in range(n)]
+
+
+def detail_rows(n, rng):
+    def images(i):
+        # JSON_ARRAYAGG over no rows is NULL
+        count = rng.randint(0, 4)
+        return json.dumps([[i * 4 + k, f"https://storage.googleapis.com/b/product-image/{i}-{k}.jpg"]
+                           for k in range(count)]) if count else None
+
+    return [{
+        "id": i, "user_id": rng.randint(1, 500), "name": f"Product {i}",
+        "description": "Lightly used, works perfectly", "category": "Books", "state": "Good",
+        "price": price(rng), "main_image": f"https://storage.googleapis.com/b/product-image/{i}.jpg",
+        "created_at": CREATED + timedelta(minutes=i),
+        "additional_images": images(i),
+    } for i in range(n)]
+
+
+def address(i):
+    return {"full_name": f"Student {i}", "phone": "9876543210", "address": "Block A",
+            "city": "Dehradun", "state": "Uttarakhand", "pincode": "248007", "hostel_room": "A-101"}
+
+
+def grouped_order_rows(n, rng):
+    rows = []
+    for i in range(n):
+        k = rng.randint(1, 5)
+        rows.append({
+            "id": i, "user_id": 1, "total_amount": price(rng), "status": "pending",
+            "created_at": CREATED + timedelta(minutes=i), **address(i),
+            "product_ids": ",".join(str(rng.randint(1, 10 ** 5)) for _ in range(k)),
+            "quantities": ",".join(str(rng.randint(1, 3)) for _ in range(k)),
+            "prices": ",".join(str(price(rng)) for _ in range(k)),
+            "product_names": ",".join(f"Product {j}" for j in range(k)),
+            "image_urls": ",".join(f"https://storage.googleapis.com/b/product-image/{j}.jpg" for j in range(k)),
+        })
+    return rows
+
+
+def order_items(k, rng):
+    return [{"id": j, "product_id": rng.randint(1, 10 ** 5), "quantity": rng.randint(1, 3), "price": price(rng),
+             "name": f"Product {j}", "image_url": f"https://storage.googleapis.com/b/product-image/{j}.jpg",
+             "seller_id": rng.randint(1, 500)} for j in range(k)]
+
+
+def user_order_inputs(n, rng):
+    return [({"id": i, "total_amount": price(rng), "status": "pending", "created_at": CREATED},
+             address(i), order_items(rng.randint(1, 5), rng)) for i in range(n)]
+
+
+def order_detail_inputs(n, rng):
+    sellers = {seller_id: {"id": seller_id, "name": f"Seller {seller_id}"} for seller_id in range(1, 501)}
+    order = {"id": 1, "user_id": 1, "status": "pending", "total_amount": price(rng),
+             "created_at": CREATED, **address(1)}
+    return order, order_items(n, rng), sellers
+
+
+# name -> (build inputs for n rows, run the shaping over them)
+CASES = {
+    "prices_to_float": (listing_rows, shaping.prices_to_float),
+    "format_product_detail": (detail_rows, lambda rows: [shaping.format_product_detail(row) for row in rows]),
+    "shape_grouped_order": (grouped_order_rows, lambda rows: [shaping.shape_grouped_order(row) for row in rows]),
+    "shape_user_order": (user_order_inputs, lambda inputs: [shaping.shape_user_order(*args) for args in inputs]),
+    "shape_order_detail": (order_detail_inputs, lambda args: shaping.shape_order_detail(*args)),
+}
+
+
+def best_of(case, n, repeat):
+    build, run = CASES[case]
+    best = None
+    for attempt in range(repeat):
+        # Fresh inputs each time; prices_to_float converts in place
+        inputs = build(n, random.Random(attempt))
+        # As timeit does, keep collector pauses out of the measurement
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            run(inputs)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_run(path):
+    if not os.path.exists(path):
+        return None
+    last = None
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                last = json.loads(line)
+    return last
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES))
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results", "shaping.jsonl"))
+    args = parser.parse_args()
+
+    previous = previous_run(args.output)
+    results = {}
+    for case in args.cases:
+        for n in args.scales:
+            key = f"{case}/{n}"
+            seconds = best_of(case, n, args.repeat)
+            results[key] = seconds
+            line = f"{key:32} {seconds * 1000:10.2f} ms  {seconds / n * 1e6:7.2f} us/row"
+            before = previous and previous["results"].get(key)
+            if before:
+                line += f"  {(seconds / before - 1) * 100:+6.1f}% vs {previous['commit']}"
+            print(line)
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "a") as f:
+        f.write(json.dumps({
+            "commit": git_commit(),
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "repeat": args.repeat,
+            "results": results,
+        }) + "\n")
+    print(f"Results appended to {os.path.relpath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
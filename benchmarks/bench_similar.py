@@ -0,0 +1,80 @@
+"""Reports similarity index build time, memory and top-K query latency at catalog scale."""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from similar import SimilarityIndex  # noqa: E402
+
+CATEGORIES = ["Books", "Electronics", "Furniture", "Clothing", "Sports", "Stationery", "Others"]
+
+
+def synthetic_products(count, vocabulary=20000, seed=7):
+    """Zipf-ish word frequencies, so a few words are everywhere and most are rare."""
+    rng = np.random.default_rng(seed)
+    words = np.array([f"w{i}" for i in range(vocabulary)])
+    probabilities = 1 / np.arange(1, vocabulary + 1)
+    probabilities /= probabilities.sum()
+    lengths = rng.integers(12, 66, size=count)
+    drawn = words[rng.choice(vocabulary, size=int(lengths.sum()), p=probabilities)]
+    categories = rng.choice(CATEGORIES, size=count)
+    offset = 0
+    products = []
+    for product_id, length in enumerate(lengths.tolist(), start=1):
+        text = drawn[offset:offset + length].tolist()
+        offset += length
+        products.append((product_id, " ".join(text[:4]), " ".join(text[4:]), str(categories[product_id - 1])))
+    return products
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    products = synthetic_products(args.products)
+    index = SimilarityIndex()
+    index.rebuild(products)
+    stats = index.stats()
+    print(f"build: {stats['build_seconds']:.2f}s for {stats['products']} products, "
+          f"{stats['terms']} terms, {stats['nonzeros']} non-zeros")
+    print(f"index memory: {stats['memory_bytes'] / 2 ** 20:.1f} MiB")
+
+    def query_latency(label):
+        rng = random.Random(1)
+        latencies = []
+        for _ in range(args.queries):
+            product_id = rng.randint(1, args.products)
+            start = time.perf_counter()
+            index.similar(product_id, args.limit)
+            latencies.append(time.perf_counter() - start)
+        print(f"{label}: p50 {percentile(latencies, 0.5) * 1000:.2f} ms, "
+              f"p99 {percentile(latencies, 0.99) * 1000:.2f} ms")
+
+    query_latency(f"top-{args.limit} query")
+
+    # Incremental updates land in the overlay and are scored alongside the matrix
+    updates = synthetic_products(args.updates, seed=11)
+    start = time.perf_counter()
+    for product_id, name, description, category in updates:
+        index.add_product(product_id, name, description, category)
+    elapsed = time.perf_counter() - start
+    print(f"incremental update: {elapsed / args.updates * 1e6:.0f} us per product")
+    query_latency(f"top-{args.limit} query with {args.updates} overlay products")
+
+
+if __name__ == "__main__":
+    main()
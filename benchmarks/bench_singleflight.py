@@ -0,0 +1,62 @@
+"""Burst of identical catalog requests against a fake database: counts the queries
+that reach the database with and without single-flight coalescing."""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from singleflight import SingleFlight  # noqa: E402
+
+QUERY_TIME = 0.05
+BURST = 200
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def query(self, sql):
+        with self._lock:
+            self.queries += 1
+        time.sleep(QUERY_TIME)
+        return [{"id": i, "price": 10.0} for i in range(50)]
+
+
+def burst(label, fetch):
+    barrier = threading.Barrier(BURST)
+    latencies = []
+
+    def request():
+        barrier.wait()
+        start = time.perf_counter()
+        fetch()
+        latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=request) for _ in range(BURST)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    print(f"{label}: p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+          f"max {latencies[-1] * 1000:.0f} ms")
+
+
+def main():
+    sql = "SELECT ... FROM products p WHERE 1=1 ORDER BY p.created_at DESC"
+
+    db = FakeDatabase()
+    burst("uncoalesced", lambda: db.query(sql))
+    print(f"  {db.queries} queries for {BURST} requests")
+
+    db = FakeDatabase()
+    flights = SingleFlight()
+    burst("single-flight", lambda: flights.do(("products", sql), lambda: db.query(sql), timeout=5))
+    print(f"  {db.queries} queries for {BURST} requests, stats {flights.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""L1/L2 hit latency and cross-instance invalidation delay of TieredCache against a
+local Redis server (REDIS_URL, default redis://localhost:6379/15). Two cache
+instances stand in for two app instances."""
+import os
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from cache import MISSING, InvalidationBus, RedisBackend, TieredCache  # noqa: E402
+from resilience import CircuitBreaker  # noqa: E402
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/15")
+ROUNDS = 2000
+
+
+def instance():
+    backend = RedisBackend.from_url(REDIS_URL, CircuitBreaker("redis"), prefix="bench:")
+    bus = InvalidationBus(backend)
+    cache = TieredCache("product-detail", maxsize=ROUNDS * 2, ttl=60, backend=backend, bus=bus)
+    bus.start()
+    return cache
+
+
+def product(i):
+    return {"id": i, "name": f"Product {i}", "price": Decimal("499.00"), "images": [f"img-{i}-{k}.jpg" for k in range(4)]}
+
+
+def per_call(fn):
+    start = time.perf_counter()
+    for i in range(ROUNDS):
+        fn(i)
+    return (time.perf_counter() - start) / ROUNDS * 1e6
+
+
+def main():
+    first, second = instance(), instance()
+    time.sleep(0.5)
+
+    print(f"set (L1 + L2):      {per_call(lambda i: first.set(i, product(i))):8.1f} us")
+    print(f"get, L2 hit:        {per_call(lambda i: second.get(i)):8.1f} us")
+    print(f"get, L1 hit:        {per_call(lambda i: second.get(i)):8.1f} us")
+
+    delays = []
+    for i in range(100):
+        start = time.perf_counter()
+        first.delete(i)
+        while second.local.get(repr(i)) is not MISSING:
+            time.sleep(0.0001)
+        delays.append(time.perf_counter() - start)
+    delays.sort()
+    print(f"invalidation reaches the other instance: p50 {delays[50] * 1000:.2f} ms, "
+          f"max {delays[-1] * 1000:.2f} ms")
+    first.clear()
+
+
+if __name__ == "__main__":
+    main()
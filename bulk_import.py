@@ -0,0 +1,412 @@
+"""Bulk product import from CSV or JSONL.
+
+Each row describes one listing: user_id, name, description, category, price and
+optionally state, original_price, months_used, plus `images` - a JSON list or a
+"|"-separated string of local file paths or http(s) URLs. Rows are validated
+with the same rules as /api/upload-multiple, images are uploaded concurrently,
+and products/product_images are inserted with batched multi-row statements.
+
+Large imports belong on the command line. The HTTP endpoint only runs a bounded
+slice per request, fetches images from public hosts only, and caps each download.
+
+Usage:
+    python bulk_import.py listings.csv [--batch-size 200] [--workers 8] [--checkpoint FILE]
+"""
+import argparse
+import csv
+import io
+import ipaddress
+import json
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+REQUIRED_FIELDS = ("user_id", "name", "description", "category", "price")
+
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+
+class RowError(Exception):
+    pass
+
+
+def read_rows(stream, fmt):
+    """Yields (row_number, row dict) from a text stream without loading it whole."""
+    if fmt == "csv":
+        for row_number, row in enumerate(csv.DictReader(stream), start=1):
+            yield row_number, row
+    else:
+        for row_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if line:
+                yield row_number, json.loads(line)
+
+
+def detect_format(filename):
+    return "jsonl" if filename.lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def check_public_url(url):
+    """Raises RowError unless every address the URL's host resolves to is a public one.
+    Returns one of those addresses, for fetch_image to connect to.
+
+    Keeps the endpoint from fetching internal services or the metadata server.
+    """
+    host = urlsplit(url).hostname
+    if not host:
+        raise RowError(f"Invalid image URL: {url}")
+    try:
+        addresses = sorted({info[4][0] for info in socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)})
+    except socket.gaierror:
+        raise RowError(f"Could not resolve image host: {host}")
+    for address in addresses:
+        if not ipaddress.ip_address(address.split("%")[0]).is_global:
+            raise RowError(f"Image host is not public: {host}")
+    return addresses[0]
+
+
+class PinnedAdapter(HTTPAdapter):
+    """Sends TLS SNI and checks the certificate for `hostname` while the URL names an IP."""
+
+    def __init__(self, hostname, **kwargs):
+        self.hostname = hostname
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        # urllib3 drops both for plain http pools
+        kwargs["server_hostname"] = self.hostname
+        kwargs["assert_hostname"] = self.hostname
+        super().init_poolmanager(*args, **kwargs)
+
+
+def pinned_request(url, address):
+    """(session, URL, headers) that connect to `address` instead of resolving the URL's host again,
+    so a DNS answer that changes after check_public_url can't redirect the fetch."""
+    parts = urlsplit(url)
+    ip = f"[{address}]" if ":" in address else address
+    netloc = f"{ip}:{parts.port}" if parts.port else ip
+    host = parts.netloc.rpartition("@")[2]
+    session = requests.Session()
+    session.trust_env = False   # a proxy would resolve the name itself
+    session.mount(f"{parts.scheme}://", PinnedAdapter(parts.hostname))
+    return session, urlunsplit(parts._replace(netloc=netloc)), {"Host": host}
+
+
+def fetch_image(url, max_bytes, timeout=30, address=None):
+    """Downloads an image, giving up once it grows past `max_bytes`. Redirects aren't followed.
+
+    With `address` (from check_public_url), connects there rather than resolving the host.
+    """
+    if address is None:
+        session, target, headers = requests.Session(), url, {}
+    else:
+        session, target, headers = pinned_request(url, address)
+    with session, session.get(target, headers=headers, timeout=timeout, stream=True,
+                              allow_redirects=False) as response:
+        if response.is_redirect:
+            raise RowError(f"Image URL redirects: {url}")
+        response.raise_for_status()
+        if int(response.headers.get("Content-Length") or 0) > max_bytes:
+            raise RowError(f"Image is larger than {max_bytes} bytes: {url}")
+        data = bytearray()
+        for chunk in response.iter_content(65536):
+            data += chunk
+            if len(data) > max_bytes:
+                raise RowError(f"Image is larger than {max_bytes} bytes: {url}")
+        return bytes(data)
+
+
+def parse_images(value):
+    if not value:
+        return []
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    value = value.strip()
+    if value.startswith("["):
+        return [str(v).strip() for v in json.loads(value) if str(v).strip()]
+    return [v.strip() for v in value.split("|") if v.strip()]
+
+
+class BulkImporter:
+    """Streams rows into products/product_images.
+
+    Dependencies are passed in so the importer can be driven both from the
+    /api/products/import endpoint and from the command line:
+      get_connection()                      -> MySQL connection
+      upload_bytes(data, filename, folder)  -> public URL or None
+      delete_image(url)                     -> None
+      allowed_file(filename)                -> bool
+
+    With `owner_id` set every row is listed for that user; rows naming another
+    seller fail. Only the command line passes `allow_local_paths`, which also
+    allows image URLs on private hosts.
+    """
+
+    def __init__(self, get_connection, upload_bytes, delete_image, allowed_file,
+                 batch_size=200, workers=8, allow_local_paths=False,
+                 default_user_id=None, owner_id=None, max_image_bytes=MAX_IMAGE_BYTES,
+                 fetch_timeout=30, progress=None):
+        self.get_connection = get_connection
+        self.upload_bytes = upload_bytes
+        self.delete_image = delete_image
+        self.allowed_file = allowed_file
+        self.batch_size = batch_size
+        self.workers = workers
+        self.allow_local_paths = allow_local_paths
+        self.default_user_id = owner_id if owner_id is not None else default_user_id
+        self.owner_id = owner_id
+        self.max_image_bytes = max_image_bytes
+        self.fetch_timeout = fetch_timeout
+        self.progress = progress
+
+    # ---- validation ---- #
+
+    def validate(self, row):
+        """Returns the normalized listing for a row or raises RowError."""
+        listing = {key: (str(row.get(key)).strip() if row.get(key) not in (None, "") else None)
+                   for key in ("user_id", "name", "description", "category", "state",
+                               "price", "original_price", "months_used")}
+        listing["user_id"] = listing["user_id"] or self.default_user_id
+        listing["state"] = listing["state"] or "Not specified"
+        if self.owner_id is not None and str(listing["user_id"]) != str(self.owner_id):
+            raise RowError("Rows can only list products for the importing user")
+
+        missing = [field for field in REQUIRED_FIELDS if not listing[field]]
+        if missing:
+            raise RowError(f"Missing required fields: {', '.join(missing)}")
+
+        for field in ("price", "original_price"):
+            if listing[field] is not None:
+                try:
+                    float(listing[field])
+                except ValueError:
+                    raise RowError(f"Invalid {field}: {listing[field]}")
+        if listing["months_used"] is not None and not listing["months_used"].isdigit():
+            raise RowError(f"Invalid months_used: {listing['months_used']}")
+
+        # Same rule as upload_multiple: invalid files are skipped, at least one must remain
+        images = []
+        for source in parse_images(row.get("images")):
+            is_url = source.startswith(("http://", "https://"))
+            if not is_url and not self.allow_local_paths:
+                raise RowError("Local image paths are only allowed from the command line")
+            if self.allowed_file(source.split("?")[0]):
+                images.append(source)
+        if not images:
+            raise RowError("No valid images")
+        listing["images"] = images
+        return listing
+
+    # ---- images ---- #
+
+    def _upload_one(self, source):
+        filename = os.path.basename(source.split("?")[0])
+        if source.startswith(("http://", "https://")):
+            address = None if self.allow_local_paths else check_public_url(source)
+            data = fetch_image(source, self.max_image_bytes, timeout=self.fetch_timeout, address=address)
+        else:
+            with open(source, "rb") as f:
+                data = f.read(self.max_image_bytes + 1)
+            if len(data) > self.max_image_bytes:
+                raise RowError(f"Image is larger than {self.max_image_bytes} bytes: {source}")
+        return self.upload_bytes(data, filename, "product-image")
+
+    def upload_images(self, listings, pool):
+        """Uploads every image of the batch concurrently. Listings whose uploads fail are returned as errors."""
+        futures = [[pool.submit(self._upload_one, source) for source in listing["images"]]
+                   for listing in listings]
+
+        uploaded, failed = [], []
+        for listing, listing_futures in zip(listings, futures):
+            urls, error = [], None
+            for future in listing_futures:
+                try:
+                    url = future.result()
+                except Exception as e:
+                    url, error = None, str(e)
+                if url:
+                    urls.append(url)
+                elif error is None:
+                    error = "Failed to upload image to Google Cloud Storage"
+            if error:
+                for url in urls:
+                    self.delete_image(url)
+                failed.append((listing, error))
+            else:
+                listing["image_urls"] = urls
+                uploaded.append(listing)
+        return uploaded, failed
+
+    # ---- database ---- #
+
+    def insert_batch(self, listings):
+        """Inserts a batch with one multi-row INSERT per table. Returns the new product ids."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s, %s)"] * len(listings))
+            params = []
+            for listing in listings:
+                params.extend([
+                    listing["user_id"], listing["name"], listing["description"], listing["category"],
+                    listing["state"], listing["price"], listing["image_urls"][0],
+                    listing["original_price"], listing["months_used"]
+                ])
+            cursor.execute(f"""
+                INSERT INTO products
+                (user_id, name, description, category, state, price, image_url, original_price, months_used)
+                VALUES {placeholders}
+            """, params)
+
+            # A single multi-row INSERT gets consecutive auto-increment ids starting at
+            # lastrowid; verify against the main image URLs rather than trusting it blindly.
+            first_id = cursor.lastrowid
+            product_ids = list(range(first_id, first_id + len(listings)))
+            cursor.execute(
+                "SELECT id, image_url FROM products WHERE id BETWEEN %s AND %s ORDER BY id",
+                (product_ids[0], product_ids[-1])
+            )
+            inserted = cursor.fetchall()
+            if [row[1] for row in inserted] != [listing["image_urls"][0] for listing in listings]:
+                raise RuntimeError("Auto-increment ids for the batch were not consecutive")
+
+            image_rows = [(product_id, url)
+                          for product_id, listing in zip(product_ids, listings)
+                          for url in listing["image_urls"]]
+            cursor.execute(
+                "INSERT INTO product_images (product_id, image_url) VALUES "
+                + ", ".join(["(%s, %s)"] * len(image_rows)),
+                [value for row in image_rows for value in row]
+            )
+            conn.commit()
+            return product_ids
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    # ---- driver ---- #
+
+    def run(self, rows, start_row=0, checkpoint=None, max_rows=None, max_seconds=None):
+        """Imports `rows` (an iterable of (row_number, row)), skipping rows <= start_row.
+
+        `checkpoint(rows_done)` is called after every committed batch so an
+        interrupted import can resume from the last committed row. With
+        `max_rows` or `max_seconds` the run stops at the first batch boundary
+        past either limit and reports `complete: False`; resume from `rows_done`.
+        """
+        stats = {"imported": 0, "failed": [], "product_ids": [], "rows_done": start_row, "complete": True}
+        started = time.perf_counter()
+
+        def flush(batch, last_row):
+            uploaded, failed = self.upload_images([listing for _, listing in batch], pool)
+            row_numbers = {id(listing): row_number for row_number, listing in batch}
+            for listing, error in failed:
+                stats["failed"].append({"row": row_numbers[id(listing)], "error": error})
+            if uploaded:
+                try:
+                    stats["product_ids"].extend(self.insert_batch(uploaded))
+                    stats["imported"] += len(uploaded)
+                except Exception as e:
+                    for listing in uploaded:
+                        for url in listing["image_urls"]:
+                            self.delete_image(url)
+                        stats["failed"].append({"row": row_numbers[id(listing)], "error": str(e)})
+            stats["rows_done"] = last_row
+            if checkpoint:
+                checkpoint(last_row)
+            if self.progress:
+                elapsed = time.perf_counter() - started
+                self.progress(stats, elapsed)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            batch = []
+            last_row = start_row
+            for row_number, row in rows:
+                if row_number <= start_row:
+                    continue
+                if (max_rows is not None and row_number - start_row > max_rows) or \
+                        (max_seconds is not None and time.perf_counter() - started > max_seconds):
+                    stats["complete"] = False
+                    break
+                last_row = row_number
+                try:
+                    batch.append((row_number, self.validate(row)))
+                except (RowError, ValueError) as e:
+                    stats["failed"].append({"row": row_number, "error": str(e)})
+                if len(batch) >= self.batch_size:
+                    flush(batch, last_row)
+                    batch = []
+            if batch or last_row != stats["rows_done"]:
+                flush(batch, last_row)
+
+        elapsed = time.perf_counter() - started
+        processed = stats["rows_done"] - start_row
+        stats["elapsed_seconds"] = round(elapsed, 3)
+        stats["rows_per_second"] = round(processed / elapsed, 1) if elapsed > 0 else None
+        return stats
+
+
+def load_checkpoint(path, source):
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        state = json.load(f)
+    return state.get("rows_done", 0) if state.get("source") == os.path.abspath(source) else 0
+
+
+def save_checkpoint(path, source, rows_done):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"source": os.path.abspath(source), "rows_done": rows_done}, f)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import product listings from CSV or JSONL")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "jsonl"])
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--user-id", help="Seller for rows without a user_id column")
+    parser.add_argument("--checkpoint", help="Checkpoint file used to resume an interrupted import")
+    args = parser.parse_args()
+
+    # Imported here so the module stays usable without initializing the app
+    from app import get_db_connection, gcs_upload_bytes, delete_from_gcs, allowed_file, invalidate_catalog_caches
+
+    def report(stats, elapsed):
+        rate = (stats["rows_done"] - start_row) / elapsed if elapsed > 0 else 0
+        print(f"rows={stats['rows_done']} imported={stats['imported']} "
+              f"failed={len(stats['failed'])} {rate:.1f} rows/s", flush=True)
+
+    importer = BulkImporter(
+        get_db_connection, gcs_upload_bytes, delete_from_gcs, allowed_file,
+        batch_size=args.batch_size, workers=args.workers, allow_local_paths=True,
+        default_user_id=args.user_id, progress=report
+    )
+    start_row = load_checkpoint(args.checkpoint, args.path)
+    if start_row:
+        print(f"Resuming after row {start_row}")
+
+    checkpoint = (lambda rows_done: save_checkpoint(args.checkpoint, args.path, rows_done)) if args.checkpoint else None
+    with io.open(args.path, newline="", encoding="utf-8") as stream:
+        stats = importer.run(read_rows(stream, args.format or detect_format(args.path)),
+                             start_row=start_row, checkpoint=checkpoint)
+    invalidate_catalog_caches()
+
+    for failure in stats["failed"]:
+        print(f"row {failure['row']}: {failure['error']}")
+    print(f"Imported {stats['imported']} products in {stats['elapsed_seconds']}s "
+          f"({stats['rows_per_second']} rows/s), {len(stats['failed'])} rows failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""In-process caches, optionally backed by a shared Redis tier.
+
+TTLCache is the per-process L1. TieredCache puts one in front of a
+RedisBackend (L2) shared by every instance; writes go to both tiers, and
+delete()/clear() are broadcast over Redis pub/sub by an InvalidationBus so the
+other instances drop their L1 copies too. Without a backend a TieredCache is
+just its L1.
+
+clear() does not scan Redis: each namespace's keys carry a generation number,
+and clearing bumps it so older entries are never read again and simply expire.
+Redis failures are treated as misses and never fail a request.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+log = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire `ttl` seconds after being set."""
+
+    def __init__(self, maxsize=1024, ttl=60, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (self.clock() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# =================== SERIALIZATION =================== #
+
+def _encode(value):
+    # Tagged so values read back from L2 have the types the handlers put in
+    if isinstance(value, Decimal):
+        return {"__decimal__": str(value)}
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    raise TypeError(f"{type(value).__name__} is not cacheable")
+
+
+def _decode(obj):
+    if len(obj) == 1:
+        if "__decimal__" in obj:
+            return Decimal(obj["__decimal__"])
+        if "__datetime__" in obj:
+            return datetime.fromisoformat(obj["__datetime__"])
+        if "__date__" in obj:
+            return date.fromisoformat(obj["__date__"])
+    return obj
+
+
+def dumps(value):
+    return json.dumps(value, default=_encode, separators=(",", ":")).encode()
+
+
+def loads(data):
+    return json.loads(data, object_hook=_decode)
+
+
+# =================== SHARED TIER =================== #
+
+class RedisBackend:
+    """Thin wrapper over a redis-py client that turns every failure into a miss.
+
+    Calls go through a CircuitBreaker so a Redis outage costs one fast
+    rejection per call rather than a socket timeout.
+    """
+
+    def __init__(self, client, breaker, prefix="unisale:"):
+        self.client = client
+        self.breaker = breaker
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, breaker, timeout=0.2, prefix="unisale:"):
+        # Optional dependency, only needed when a shared tier is configured
+        import redis
+        client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        return cls(client, breaker, prefix)
+
+    def _call(self, name, *args, default=None):
+        try:
+            return self.breaker.call(getattr(self.client, name), *args)
+        except Exception as e:
+            log.warning("Redis %s failed: %s", name, e)
+            return default
+
+    def get(self, key):
+        return self._call("get", self.prefix + key)
+
+    def set(self, key, data, ttl):
+        self._call("set", self.prefix + key, data, max(1, int(ttl)))
+
+    def delete(self, key):
+        self._call("delete", self.prefix + key)
+
+    def generation(self, namespace, bump=False):
+        """The namespace's current key generation, or None while Redis is unreachable."""
+        key = f"{self.prefix}{namespace}:generation"
+        if bump:
+            return self._call("incr", key)
+        value = self._call("get", key, default=MISSING)
+        return None if value is MISSING else int(value or 0)
+
+    def publish(self, channel, message):
+        self._call("publish", self.prefix + channel, message)
+
+
+class InvalidationBus:
+    """Broadcasts cache deletes and clears to every instance over Redis pub/sub.
+
+    Messages can be missed while the subscription is down, so every L1 is
+    cleared whenever it (re)connects. Other channels can ride on the same
+    subscription: add_channel() them before start(), then broadcast() to them.
+    """
+
+    CHANNEL = "cache-invalidation"
+
+    def __init__(self, backend, retry_delay=1.0):
+        self.backend = backend
+        self.retry_delay = retry_delay
+        self.instance_id = uuid.uuid4().hex
+        self.stats = {"published": 0, "received": 0, "subscriptions": 0}
+        self._caches = {}
+        self._handlers = {}
+        self._thread = None
+
+    def register(self, cache):
+        self._caches[cache.namespace] = cache
+
+    def publish(self, namespace, op, key=None, generation=None):
+        self.stats["published"] += 1
+        self.backend.publish(self.CHANNEL, json.dumps({
+            "origin": self.instance_id, "ns": namespace, "op": op, "key": key, "generation": generation
+        }))
+
+    def add_channel(self, channel, handler):
+        """Calls handler(payload) for every broadcast() other instances make on `channel`."""
+        self._handlers[channel] = handler
+
+    def broadcast(self, channel, payload):
+        self.backend.publish(channel, json.dumps({"origin": self.instance_id, "payload": payload}, default=str))
+
+    def receive(self, channel, data):
+        """Dispatches one pub/sub message by its channel name (without the key prefix)."""
+        if channel == self.CHANNEL:
+            self.handle(data)
+            return
+        message = json.loads(data)
+        handler = self._handlers.get(channel)
+        if handler is not None and message["origin"] != self.instance_id:
+            handler(message["payload"])
+
+    def handle(self, data):
+        message = json.loads(data)
+        if message["origin"] == self.instance_id:
+            return
+        cache = self._caches.get(message["ns"])
+        if cache is None:
+            return
+        self.stats["received"] += 1
+        if message["op"] == "delete":
+            cache.local.delete(message["key"])
+        else:
+            cache.local.clear()
+            cache.generation = message["generation"]
+
+    def _run(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.backend.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(*(self.backend.prefix + channel for channel in [self.CHANNEL, *self._handlers]))
+                self.stats["subscriptions"] += 1
+                for cache in self._caches.values():
+                    cache.local.clear()
+                    cache.generation = None
+                while True:
+                    message = pubsub.get_message(timeout=5)
+                    if message and message["type"] == "message":
+                        channel = message["channel"]
+                        if isinstance(channel, bytes):
+                            channel = channel.decode()
+                        self.receive(channel[len(self.backend.prefix):], message["data"])
+            except Exception as e:
+                log.warning("Cache invalidation subscription lost: %s", e)
+                time.sleep(self.retry_delay)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+
+class TieredCache:
+    """L1 TTLCache in front of an optional shared backend, with the TTLCache interface.
+
+    Keys may be any value with a stable repr() (ints, strings, tuples,
+    namedtuples); values must be JSON-serializable apart from Decimal and
+    datetime, which round-trip. Values are shared, treat them as read-only.
+    """
+
+    def __init__(self, namespace, maxsize=1024, ttl=60, backend=None, bus=None, clock=time.monotonic):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.local = TTLCache(maxsize, ttl, clock)
+        self.backend = backend
+        self.bus = bus
+        self.generation = None
+        self.clock = clock
+        self._bypass_l2_until = 0
+        self.stats = {"l1_hits": 0, "l2_hits": 0, "misses": 0}
+        if bus is not None:
+            bus.register(self)
+
+    def _remote_key(self, key):
+        if self.generation is None:
+            self.generation = self.backend.generation(self.namespace)
+            if self.generation is None:
+                return None
+        return f"{self.namespace}:{self.generation}:{key}"
+
+    def get(self, key, default=MISSING):
+        key = repr(key)
+        value = self.local.get(key)
+        if value is not MISSING:
+            self.stats["l1_hits"] += 1
+            return value
+
+        if self.backend is not None and self.clock() >= self._bypass_l2_until:
+            remote_key = self._remote_key(key)
+            data = remote_key and self.backend.get(remote_key)
+            if data is not None:
+                try:
+                    value = loads(data)
+                except ValueError:
+                    value = MISSING
+                if value is not MISSING:
+                    self.stats["l2_hits"] += 1
+                    self.local.set(key, value)
+                    return value
+
+        self.stats["misses"] += 1
+        return default
+
+    def set(self, key, value, ttl=None):
+        key = repr(key)
+        self.local.set(key, value, ttl)
+        if self.backend is not None:
+            remote_key = self._remote_key(key)
+            if remote_key:
+                self.backend.set(remote_key, dumps(value), self.ttl if ttl is None else ttl)
+
+    def delete(self, key):
+        key = repr(key)
+        self.local.delete(key)
+        if self.backend is not None:
+            remote_key = self._remote_key(key)
+            if remote_key:
+                self.backend.delete(remote_key)
+        if self.bus is not None:
+            self.bus.publish(self.namespace, "delete", key=key)
+
+    def clear(self):
+        self.local.clear()
+        if self.backend is not None:
+            self.generation = self.backend.generation(self.namespace, bump=True)
+            if self.generation is None:
+                # Entries under the old generation may still be in L2; don't read it until they expired
+                self._bypass_l2_until = self.clock() + self.ttl
+        if self.bus is not None:
+            self.bus.publish(self.namespace, "clear", generation=self.generation)
+
+    def __len__(self):
+        return len(self.local)
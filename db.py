@@ -0,0 +1,293 @@
+"""MySQL connection pool with a per-connection prepared statement cache.
+
+mysql.connector's own pool resets the session whenever a connection is
+returned, which deallocates server-side prepared statements. This pool keeps
+sessions alive instead (rolling back any open transaction on release) so the
+hot statements are parsed once per connection and then only executed.
+"""
+import logging
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import mysql.connector
+from mysql.connector import errorcode
+
+log = logging.getLogger(__name__)
+
+# Errors after which the session (and every statement prepared in it) is gone
+RECONNECT_ERRNOS = {
+    errorcode.CR_SERVER_GONE_ERROR,
+    errorcode.CR_SERVER_LOST,
+    errorcode.ER_UNKNOWN_STMT_HANDLER,
+}
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class PoolOverloaded(PoolExhausted):
+    """Too many callers already waiting for a connection; raised without waiting."""
+
+
+class ConnectionPool:
+    """Fixed-size pool; connections are opened lazily up to `size`.
+
+    With `max_waiting`, a get() that would join a wait queue already that long
+    raises PoolOverloaded at once, so a backed-up database sheds load instead
+    of queueing every request for `timeout` seconds.
+    """
+
+    def __init__(self, size=10, timeout=5, ping_after=30, max_statements=64, max_waiting=None, **connect_args):
+        self.size = size
+        self.timeout = timeout
+        self.max_waiting = max_waiting
+        self.ping_after = ping_after
+        self.max_statements = max_statements
+        self.connect_args = connect_args
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self):
+        """Threads currently blocked waiting for a connection."""
+        return self._waiting
+
+    def _open(self):
+        cnx = mysql.connector.connect(**self.connect_args)
+        return _Slot(cnx, self.max_statements)
+
+    def get(self):
+        try:
+            slot = self._idle.get_nowait()
+        except queue.Empty:
+            slot = None
+            with self._lock:
+                if self._opened < self.size:
+                    self._opened += 1
+                    opening = True
+                else:
+                    opening = False
+            if opening:
+                try:
+                    slot = self._open()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                with self._lock:
+                    if self.max_waiting is not None and self._waiting >= self.max_waiting:
+                        raise PoolOverloaded(f"{self._waiting} requests already waiting for a database connection")
+                    self._waiting += 1
+                try:
+                    slot = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise PoolExhausted(f"No database connection available within {self.timeout}s")
+                finally:
+                    with self._lock:
+                        self._waiting -= 1
+
+        # Connections idle for a while may have been dropped by the server
+        if time.monotonic() - slot.released_at > self.ping_after:
+            try:
+                slot.cnx.ping(reconnect=True, attempts=1)
+            except Exception:
+                self._discard(slot)
+                raise
+            slot.check_session()
+        return PooledConnection(self, slot)
+
+    def _release(self, slot):
+        try:
+            if slot.cnx.unread_result:
+                slot.cnx.consume_results()
+            if slot.cnx.in_transaction:
+                slot.cnx.rollback()
+        except Exception:
+            self._discard(slot)
+            return
+        slot.released_at = time.monotonic()
+        self._idle.put(slot)
+
+    def _discard(self, slot):
+        try:
+            slot.cnx.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._opened -= 1
+
+
+class _Slot:
+    """A pooled connection plus the statements prepared in its current session."""
+
+    def __init__(self, cnx, max_statements):
+        self.cnx = cnx
+        self.max_statements = max_statements
+        self.session_id = cnx.connection_id
+        self.statements = OrderedDict()
+        self.released_at = time.monotonic()
+
+    def check_session(self):
+        """Drops cached statements if the connection reconnected under us."""
+        if self.cnx.connection_id != self.session_id:
+            self.statements.clear()
+            self.session_id = self.cnx.connection_id
+
+    def statement(self, sql):
+        cursor = self.statements.get(sql)
+        if cursor is None:
+            cursor = self.cnx.cursor(prepared=True)
+            self.statements[sql] = cursor
+            if len(self.statements) > self.max_statements:
+                _, evicted = self.statements.popitem(last=False)
+                try:
+                    evicted.close()
+                except Exception:
+                    pass
+        else:
+            self.statements.move_to_end(sql)
+        return cursor
+
+
+class PooledConnection:
+    """What get_db_connection() hands out. Behaves like a mysql.connector connection;
+    close() returns it to the pool instead of closing the socket. Callers must
+    close() it on every path, usually in a finally block."""
+
+    _slot = None
+
+    def __init__(self, pool, slot):
+        self._pool = pool
+        self._slot = slot
+
+    def __getattr__(self, name):
+        return getattr(self._slot.cnx, name)
+
+    def close(self):
+        if self._slot is not None:
+            self._pool._release(self._slot)
+            self._slot = None
+
+    def execute_prepared(self, sql, params=(), dictionary=True):
+        """Runs `sql` as a server-side prepared statement and returns all rows.
+
+        The statement is prepared the first time this connection sees the SQL
+        text and re-executed afterwards. If the session was lost, the cache is
+        rebuilt on a fresh session and the statement retried once.
+        """
+        # Prepared cursors re-prepare unless given the very object they last ran
+        # (`operation is not self._executed`), so SQL built per call is interned
+        sql = sys.intern(sql)
+        # A lost session mid-transaction must surface, retrying would run outside it
+        can_retry = not self._slot.cnx.in_transaction
+        for attempt in (1, 2):
+            cursor = self._slot.statement(sql)
+            try:
+                cursor.execute(sql, tuple(params))
+                if not cursor.with_rows:
+                    return cursor.rowcount
+                rows = cursor.fetchall()
+                if dictionary:
+                    columns = cursor.column_names
+                    rows = [dict(zip(columns, row)) for row in rows]
+                return rows
+            except mysql.connector.Error as err:
+                if attempt == 2 or not can_retry or err.errno not in RECONNECT_ERRNOS:
+                    raise
+                self._slot.statements.clear()
+                if err.errno != errorcode.ER_UNKNOWN_STMT_HANDLER:
+                    self._slot.cnx.reconnect(attempts=1)
+                    self._slot.check_session()
+
+
+class ReplicaSet:
+    """Read replicas with lag tracking.
+
+    A background thread polls each replica's replication status every
+    `check_interval` seconds; replicas that are lagging more than `max_lag`
+    seconds, not replicating, or unreachable are skipped until they recover.
+    """
+
+    def __init__(self, pools, max_lag=5, check_interval=5):
+        self.pools = pools
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.lag = {id(pool): None for pool in pools}
+        self.healthy = []
+        self._next = 0
+        self._thread = None
+
+    def _replica_lag(self, pool):
+        conn = pool.get()
+        try:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+                status = cursor.fetchone()
+                lag = status and status.get("Seconds_Behind_Source")
+            except mysql.connector.Error:
+                # Servers before 8.0.22
+                cursor.execute("SHOW SLAVE STATUS")
+                status = cursor.fetchone()
+                lag = status and status.get("Seconds_Behind_Master")
+            cursor.close()
+            return lag
+        finally:
+            conn.close()
+
+    def check(self):
+        healthy = []
+        for pool in self.pools:
+            try:
+                lag = self._replica_lag(pool)
+            except Exception as e:
+                log.warning("Replica %s unreachable: %s", pool.connect_args.get('host'), e)
+                lag = None
+            self.lag[id(pool)] = lag
+            if lag is not None and lag <= self.max_lag:
+                healthy.append(pool)
+        self.healthy = healthy
+
+    def _run(self):
+        while True:
+            self.check()
+            time.sleep(self.check_interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def pick(self, max_lag=None):
+        """Round-robin over healthy replicas (at most `max_lag` seconds behind, if given);
+        None when reads must go to the primary."""
+        healthy = self.healthy
+        if max_lag is not None:
+            healthy = [pool for pool in healthy if self.lag[id(pool)] <= max_lag]
+        if not healthy:
+            return None
+        self._next = (self._next + 1) % len(healthy)
+        return healthy[self._next]
+
+
+def retry_on_deadlock(transaction, attempts=3, delay=0.05):
+    """Runs transaction() again when MySQL rolled it back as a deadlock victim (errno 1213).
+
+    `transaction` must open, commit and close its own connection, so every
+    attempt starts from scratch.
+    """
+    for attempt in range(attempts):
+        try:
+            return transaction()
+        except mysql.connector.Error as err:
+            if err.errno != errorcode.ER_LOCK_DEADLOCK or attempt == attempts - 1:
+                raise
+            log.warning("Deadlock, retrying transaction (attempt %s of %s)", attempt + 2, attempts)
+            time.sleep(delay * (attempt + 1))
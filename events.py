@@ -0,0 +1,97 @@
+"""Server-sent events for catalog changes (new listings, price changes, sold and removed items).
+
+Events are kept in a bounded in-memory ring buffer with increasing ids, so a
+client reconnecting with Last-Event-ID gets everything it missed. If it has
+been away longer than the buffer covers, or its id comes from another
+instance, it gets a single `reset` event and should refetch the listing.
+
+A subscriber waits on a Condition between events. Under gunicorn's gevent
+worker (see Dockerfile) that parks a greenlet, not an OS thread, so idle
+subscribers cost only memory. With Redis configured, each instance relays the
+events it publishes to the others over the cache invalidation bus, so every
+subscriber sees every write; ids are still per instance.
+"""
+import itertools
+import json
+import threading
+import time
+from collections import deque
+
+# Reconnect delay suggested to EventSource clients, in milliseconds
+RETRY_MS = 3000
+
+
+def format_event(event_id, event_type, data):
+    return f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n"
+
+
+class EventHub:
+    def __init__(self, capacity=1000):
+        self._events = deque(maxlen=capacity)   # (id, type, category, JSON data)
+        # Ids start at the boot time in ms, so ids from a previous process are never mistaken for ours
+        self._last_id = int(time.time() * 1000)
+        self._cond = threading.Condition()
+        self.subscribers = 0
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, event_type, data, category=None):
+        with self._cond:
+            self._last_id += 1
+            self._events.append((self._last_id, event_type, category, json.dumps(data, default=str)))
+            self._cond.notify_all()
+            return self._last_id
+
+    def since(self, last_id):
+        """Buffered events after `last_id`, or None if some of them are no longer buffered."""
+        with self._cond:
+            newest = self._last_id
+            oldest = self._events[0][0] if self._events else newest + 1
+            if not oldest - 1 <= last_id <= newest:
+                return None
+            # Ids are consecutive, so the newest `newest - last_id` entries are the missed ones
+            return list(itertools.islice(reversed(self._events), newest - last_id))[::-1]
+
+    def wait(self, last_id, timeout):
+        """Blocks until an event after `last_id` is published. False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._last_id > last_id, timeout)
+
+    def stream(self, last_id=None, categories=(), heartbeat=15, max_duration=300):
+        """SSE lines for one subscriber.
+
+        Starts after `last_id` (None: from now), sends a comment every
+        `heartbeat` seconds so proxies keep the connection open, and ends after
+        `max_duration` seconds; the client then reconnects with Last-Event-ID.
+        """
+        categories = set(categories)
+        deadline = time.monotonic() + max_duration
+        with self._cond:
+            self.subscribers += 1
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            if last_id is None:
+                last_id = self._last_id
+
+            while True:
+                events = self.since(last_id)
+                if events is None:
+                    last_id = self._last_id
+                    yield format_event(last_id, "reset", "{}")
+                    events = []
+                for event_id, event_type, category, data in events:
+                    last_id = event_id
+                    # Events without a category (none today) go to everyone
+                    if not categories or category is None or category in categories:
+                        yield format_event(event_id, event_type, data)
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                if not self.wait(last_id, min(heartbeat, remaining)):
+                    yield ": heartbeat\n\n"
+        finally:
+            with self._cond:
+                self.subscribers -= 1
@@ -0,0 +1,124 @@
+"""Streaming shaping for NDJSON/CSV exports.
+
+Everything here works on iterators so memory stays flat regardless of export
+size: rows come from an unbuffered cursor, records are yielded one at a time
+and serialized line by line into the response.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+ORDER_CSV_FIELDS = [
+    "order_id", "user_id", "status", "total_amount", "created_at",
+    "full_name", "phone", "address", "city", "state", "pincode", "hostel_room",
+    "product_id", "product_name", "quantity", "price"
+]
+USER_CSV_FIELDS = ["id", "name", "email", "phone", "verified"]
+
+
+def iter_cursor(cursor, size=1000):
+    """Yields rows from an (unbuffered) cursor in fetchmany-sized chunks."""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            break
+        yield from rows
+
+
+def iter_query(cursor, query, params=(), size=1000):
+    """Like iter_cursor, but the query only runs once iteration starts."""
+    cursor.execute(query, params)
+    yield from iter_cursor(cursor, size)
+
+
+def iter_queries(cursor, queries, size=1000):
+    """Yields the rows of the query already executed on `cursor`, then runs each
+    (query, params) pair of `queries` on it in turn and yields theirs."""
+    yield from iter_cursor(cursor, size)
+    for query, params in queries:
+        cursor.execute(query, params)
+        yield from iter_cursor(cursor, size)
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def group_order_rows(rows):
+    """Folds flat order/address/item rows, ordered by order id, into one nested record per order."""
+    current = None
+    for row in rows:
+        if current is None or current["id"] != row["order_id"]:
+            if current is not None:
+                yield current
+            current = {
+                "id": row["order_id"],
+                "user_id": row["user_id"],
+                "status": row["status"],
+                "total_amount": float(row["total_amount"]),
+                "created_at": row["created_at"].isoformat() if row["created_at"] else None,
+                "delivery_address": {
+                    "full_name": row["full_name"],
+                    "phone": row["phone"],
+                    "address": row["address"],
+                    "city": row["city"],
+                    "state": row["state"],
+                    "pincode": row["pincode"],
+                    "hostel_room": row["hostel_room"]
+                },
+                "items": []
+            }
+        if row["product_id"] is not None:
+            current["items"].append({
+                "product_id": row["product_id"],
+                "name": row["product_name"],
+                "quantity": row["quantity"],
+                "price": float(row["price"])
+            })
+    if current is not None:
+        yield current
+
+
+def flatten_order_rows(rows):
+    """One CSV record per order item, with the order columns repeated."""
+    for row in rows:
+        yield {
+            **{field: row.get(field) for field in ORDER_CSV_FIELDS},
+            "total_amount": float(row["total_amount"]),
+            "price": float(row["price"]) if row["price"] is not None else None,
+            "created_at": row["created_at"].isoformat() if row["created_at"] else None
+        }
+
+
+def ndjson_lines(records):
+    # Lines are yielded in ~64KB chunks rather than one write per record
+    chunk, size = [], 0
+    for record in records:
+        line = json.dumps(record, default=_json_default) + "\n"
+        chunk.append(line)
+        size += len(line)
+        if size >= 65536:
+            yield "".join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield "".join(chunk)
+
+
+def csv_lines(records, fields):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        # Same ~64KB chunking as ndjson_lines
+        if buffer.tell() >= 65536:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,150 @@
+"""Idempotency-Key support for retried writes (checkout, product uploads).
+
+The first request with a key claims it by inserting a row in idempotency_keys
+(sql/idempotency.sql) together with a fingerprint of the request. When the
+handler finishes, its response is stored on the row for `ttl` seconds, and
+retries with the same key get that response back without redoing the work.
+
+A duplicate arriving while the original is still running polls the row until
+the response is stored. A claim whose handler died is taken over once
+`lock_timeout` has passed. Reusing a key for a different request is an error.
+Keys live in MySQL so retries landing on another instance are recognized too.
+"""
+import hashlib
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+PURGE_BATCH_SIZE = 1000
+
+
+class IdempotencyError(Exception):
+    pass
+
+
+class KeyReused(IdempotencyError):
+    """The key was already used for a request with a different fingerprint."""
+
+
+class StillInProgress(IdempotencyError):
+    """The original request didn't finish within the wait timeout."""
+
+
+class StoredResponse:
+    def __init__(self, status, body, content_type):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+
+
+def key_id(scope, key):
+    return hashlib.sha256(f"{scope}\0{key}".encode()).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, get_connection, ttl=86400, lock_timeout=120, wait_timeout=10,
+                 poll_interval=0.1, purge_interval=600):
+        self.get_connection = get_connection
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.purge_interval = purge_interval
+        self.stats = {"claimed": 0, "replayed": 0, "waited": 0, "conflicts": 0, "purged": 0}
+        self._thread = None
+
+    def _execute(self, sql, params, fetch=False):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            result = cursor.fetchone() if fetch else cursor.rowcount
+            conn.commit()
+            return result
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _try_claim(self, id_, fingerprint):
+        # The primary key makes this the lock: exactly one concurrent request inserts the row
+        return self._execute(
+            "INSERT IGNORE INTO idempotency_keys (id, fingerprint, expires_at) "
+            "VALUES (%s, %s, UTC_TIMESTAMP() + INTERVAL %s SECOND)",
+            (id_, fingerprint, self.lock_timeout)
+        ) == 1
+
+    def begin(self, scope, key, fingerprint):
+        """Claims the key and returns None, or returns the StoredResponse to replay.
+
+        Raises KeyReused or StillInProgress.
+        """
+        id_ = key_id(scope, key)
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+        while True:
+            if self._try_claim(id_, fingerprint):
+                self.stats["claimed"] += 1
+                return None
+
+            row = self._execute(
+                "SELECT fingerprint, response_status, response_body, content_type, "
+                "expires_at <= UTC_TIMESTAMP() FROM idempotency_keys WHERE id = %s",
+                (id_,), fetch=True
+            )
+            if row is None:
+                continue    # Finished and purged, or abandoned, in between; claim again
+            stored_fingerprint, status, body, content_type, expired = row
+            if expired:
+                # A stale claim or an old response: drop it (unless someone beat us to it) and claim afresh
+                self._execute(
+                    "DELETE FROM idempotency_keys WHERE id = %s AND expires_at <= UTC_TIMESTAMP()", (id_,)
+                )
+                continue
+            if stored_fingerprint != fingerprint:
+                self.stats["conflicts"] += 1
+                raise KeyReused(key)
+            if status is not None:
+                self.stats["replayed"] += 1
+                return StoredResponse(status, bytes(body), content_type)
+
+            if not waited:
+                self.stats["waited"] += 1
+                waited = True
+            if time.monotonic() >= deadline:
+                raise StillInProgress(key)
+            time.sleep(self.poll_interval)
+
+    def complete(self, scope, key, status, body, content_type):
+        """Stores the response for replay."""
+        self._execute(
+            "UPDATE idempotency_keys SET response_status = %s, response_body = %s, content_type = %s, "
+            "expires_at = UTC_TIMESTAMP() + INTERVAL %s SECOND WHERE id = %s",
+            (status, body, content_type, self.ttl, key_id(scope, key))
+        )
+
+    def abandon(self, scope, key):
+        """Releases the claim without a response, so a retry runs the request again."""
+        self._execute("DELETE FROM idempotency_keys WHERE id = %s", (key_id(scope, key),))
+
+    def purge_expired(self, limit=PURGE_BATCH_SIZE):
+        purged = self._execute(
+            "DELETE FROM idempotency_keys WHERE expires_at <= UTC_TIMESTAMP() LIMIT %s", (limit,)
+        )
+        self.stats["purged"] += purged
+        return purged
+
+    def _run(self):
+        while True:
+            time.sleep(self.purge_interval)
+            try:
+                while self.purge_expired() == PURGE_BATCH_SIZE:
+                    pass
+            except Exception as e:
+                log.error("Error purging idempotency keys: %s", e)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
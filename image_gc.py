@@ -0,0 +1,127 @@
+"""Garbage collector for images in the storage bucket that nothing references.
+
+Objects under product-image/ and profile-picture/ are compared against every
+image URL stored in products, product_images, users.profile_picture and
+wishlist, plus every object tracked in image_blobs (image_store deletes those
+when their last reference goes). Unreferenced objects older than the grace
+period (which covers uploads still in flight and signed uploads not yet
+finalized) are deleted in batched requests.
+
+Usage:
+    python image_gc.py [--dry-run] [--grace-hours 24]
+"""
+import argparse
+from datetime import datetime, timedelta, timezone
+
+GC_PREFIXES = ("product-image/", "profile-picture/")
+
+REFERENCE_QUERIES = (
+    "SELECT image_url FROM products WHERE image_url IS NOT NULL",
+    "SELECT image_url FROM product_images WHERE image_url IS NOT NULL",
+    "SELECT profile_picture FROM users WHERE profile_picture IS NOT NULL",
+    "SELECT image_url FROM wishlist WHERE image_url IS NOT NULL",
+    "SELECT public_url FROM image_blobs",
+)
+
+# Cloud Storage accepts up to 100 calls per batch request
+BATCH_SIZE = 100
+
+
+def blob_name_from_url(public_url, bucket_name):
+    marker = f"{bucket_name}/"
+    if not public_url or marker not in public_url:
+        return None
+    return public_url.split(marker, 1)[1].split("?", 1)[0]
+
+
+def referenced_blob_names(conn, bucket_name):
+    """Every object name referenced from the database, streamed table by table."""
+    names = set()
+    for query in REFERENCE_QUERIES:
+        cursor = conn.cursor(buffered=False)
+        cursor.execute(query)
+        while True:
+            rows = cursor.fetchmany(5000)
+            if not rows:
+                break
+            for (url,) in rows:
+                name = blob_name_from_url(url, bucket_name)
+                if name:
+                    names.add(name)
+        cursor.close()
+    return names
+
+
+def batch_delete(client, bucket, blob_names, call=lambda operation: operation()):
+    """Deletes objects BATCH_SIZE at a time. `call` wraps each batch request (retries, breaker)."""
+    blob_names = list(blob_names)
+    for start in range(0, len(blob_names), BATCH_SIZE):
+        chunk = blob_names[start:start + BATCH_SIZE]
+
+        def delete_chunk():
+            # Objects that are already gone are not an error
+            with client.batch(raise_exception=False):
+                for name in chunk:
+                    bucket.delete_blob(name)
+
+        call(delete_chunk)
+    return len(blob_names)
+
+
+def find_orphans(bucket, referenced, grace_period, now=None):
+    now = now or datetime.now(timezone.utc)
+    cutoff = now - grace_period
+    orphans = []
+    for prefix in GC_PREFIXES:
+        for blob in bucket.list_blobs(prefix=prefix):
+            if blob.name in referenced or blob.name.endswith("/"):
+                continue
+            if blob.time_created and blob.time_created > cutoff:
+                continue
+            orphans.append((blob.name, blob.size or 0))
+    return orphans
+
+
+def collect(conn, client, bucket, grace_period=timedelta(hours=24), dry_run=True, call=lambda operation: operation()):
+    """Runs one GC pass. Returns a summary dict."""
+    # References are read before listing so an image uploaded and referenced
+    # mid-run is protected by the grace period rather than by luck.
+    referenced = referenced_blob_names(conn, bucket.name)
+    orphans = find_orphans(bucket, referenced, grace_period)
+    summary = {
+        "referenced": len(referenced),
+        "orphans": len(orphans),
+        "orphan_bytes": sum(size for _, size in orphans),
+        "deleted": 0,
+        "dry_run": dry_run,
+    }
+    if not dry_run and orphans:
+        summary["deleted"] = batch_delete(client, bucket, (name for name, _ in orphans), call)
+    return summary, orphans
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete unreferenced images from the storage bucket")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be deleted")
+    parser.add_argument("--grace-hours", type=float, default=24)
+    args = parser.parse_args()
+
+    # Imported here so the module stays usable without initializing the app
+    from app import get_db_connection, get_bucket, gcs_call
+
+    bucket = get_bucket()
+    conn = get_db_connection(read_only=False)
+    try:
+        summary, orphans = collect(conn, bucket.client, bucket, timedelta(hours=args.grace_hours),
+                                   dry_run=args.dry_run, call=gcs_call)
+    finally:
+        conn.close()
+
+    for name, size in orphans:
+        print(f"{'would delete' if args.dry_run else 'deleted'} {name} ({size} bytes)")
+    print(f"{summary['orphans']} orphaned objects ({summary['orphan_bytes']} bytes), "
+          f"{summary['deleted']} deleted, {summary['referenced']} referenced")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Content-addressed image uploads with reference counting.
+
+Uploads are hashed while they are copied into a spooled temp file, and the
+object is named after the hash (`<folder>/<sha256><ext>`). The image_blobs
+table (sql/image_blobs.sql) maps each object to its public URL and counts the
+references to it: one per upload that resolved to it. Uploading bytes that
+are already stored only adds a reference and skips the bucket write.
+
+release() drops references and deletes the object when the last one goes.
+The row is first committed with ref_count 0 (a tombstone) and only removed
+once the bucket delete is done, so no row lock is held across the call to
+GCS. An upload of the same bytes meanwhile never takes a reference to a
+tombstone; it waits for the delete to finish and then writes the object
+again. Objects uploaded before this scheme (uuid names) have no row;
+release() hands those back to the caller.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# Uploads larger than this spill from memory to disk while being hashed
+SPOOL_MAX_SIZE = 1024 * 1024
+# How long put() waits for a release() that is deleting the same object
+DELETE_WAIT_SECONDS = 30
+DELETE_POLL_SECONDS = 0.1
+
+
+def hash_to_spool(stream):
+    """Copies `stream` into a temp file while hashing it. Returns (sha256 hex, size, file rewound)."""
+    digest = hashlib.sha256()
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    size = 0
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+        spool.write(chunk)
+        size += len(chunk)
+    spool.seek(0)
+    return digest.hexdigest(), size, spool
+
+
+def content_object_name(folder, digest, filename):
+    return f"{folder}/{digest}{os.path.splitext(filename or '')[1].lower()}"
+
+
+class ImageStore:
+    """Deduplicating front for the bucket.
+
+    upload(object_name, fileobj, size, content_type) -> public URL
+    delete(object_name) -> None; a missing object is not an error
+    """
+
+    def __init__(self, get_connection, upload, delete, delete_wait=DELETE_WAIT_SECONDS):
+        self.get_connection = get_connection
+        self.upload = upload
+        self.delete = delete
+        self.delete_wait = delete_wait
+        self.stats = {"uploads": 0, "deduplicated": 0, "bytes_saved": 0, "released": 0, "deleted": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            for name, value in increments.items():
+                self.stats[name] += value
+
+    def _add_reference(self, object_name):
+        """Public URL of an already stored object after taking a reference to it, or None."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "UPDATE image_blobs SET ref_count = ref_count + 1 WHERE object_name = %s AND ref_count > 0",
+                (object_name,)
+            )
+            url = None
+            if cursor.rowcount:
+                cursor.execute("SELECT public_url FROM image_blobs WHERE object_name = %s", (object_name,))
+                url = cursor.fetchone()[0]
+            conn.commit()
+            return url
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _wait_for_delete(self, object_name):
+        """Waits while a release() is deleting the object, so it can't delete the upload that follows."""
+        deadline = time.monotonic() + self.delete_wait
+        while True:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    "SELECT 1 FROM image_blobs WHERE object_name = %s AND ref_count = 0", (object_name,)
+                )
+                deleting = cursor.fetchone() is not None
+            finally:
+                cursor.close()
+                conn.close()
+            if not deleting:
+                return
+            if time.monotonic() >= deadline:
+                # The release died before removing its tombstone; the upload takes the row over
+                log.warning("Taking over %s from an unfinished delete", object_name)
+                return
+            time.sleep(DELETE_POLL_SECONDS)
+
+    def put(self, stream, filename, folder):
+        """Stores the image read from `stream` (or finds it already stored). Returns its public URL."""
+        digest, size, spool = hash_to_spool(stream)
+        with spool:
+            object_name = content_object_name(folder, digest, filename)
+            url = self._add_reference(object_name)
+            if url:
+                self._count(deduplicated=1, bytes_saved=size)
+                return url
+
+            self._wait_for_delete(object_name)
+            # Same name means same bytes, so concurrent uploads of one image can't clash
+            url = self.upload(object_name, spool, size, mimetypes.guess_type(filename or "")[0])
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    "INSERT INTO image_blobs (object_name, content_hash, public_url, size, ref_count) "
+                    "VALUES (%s, %s, %s, %s, 1) ON DUPLICATE KEY UPDATE ref_count = ref_count + 1",
+                    (object_name, digest, url, size)
+                )
+                conn.commit()
+            finally:
+                cursor.close()
+                conn.close()
+            self._count(uploads=1)
+            return url
+
+    def release(self, object_names):
+        """Drops one reference per name given (repeats count). Returns the names that aren't tracked here."""
+        untracked = []
+        unreferenced = []
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            # One short transaction per object, in name order so concurrent releases can't deadlock
+            for object_name, count in sorted(Counter(object_names).items()):
+                conn.start_transaction()
+                cursor.execute(
+                    "SELECT ref_count FROM image_blobs WHERE object_name = %s FOR UPDATE", (object_name,)
+                )
+                row = cursor.fetchone()
+                if row is None:
+                    conn.rollback()
+                    untracked.append(object_name)
+                    continue
+                if row[0] == 0:
+                    # Another release is already deleting it
+                    conn.rollback()
+                    continue
+                if row[0] > count:
+                    cursor.execute(
+                        "UPDATE image_blobs SET ref_count = ref_count - %s WHERE object_name = %s",
+                        (count, object_name)
+                    )
+                else:
+                    cursor.execute("UPDATE image_blobs SET ref_count = 0 WHERE object_name = %s", (object_name,))
+                    unreferenced.append(object_name)
+                conn.commit()
+                self._count(released=count)
+
+            # Outside any transaction: uploads of these bytes wait on the tombstone, not on a row lock
+            for object_name in unreferenced:
+                try:
+                    self.delete(object_name)
+                    self._count(deleted=1)
+                except Exception as e:
+                    # The row goes anyway; without it the image GC job picks the object up
+                    log.error("Error deleting %s from storage: %s", object_name, e)
+                cursor.execute("DELETE FROM image_blobs WHERE object_name = %s AND ref_count = 0", (object_name,))
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+        return untracked
@@ -0,0 +1,117 @@
+"""Inventory reservations so a listing can only be sold once.
+
+Every listing is a single second-hand item. A buyer starting checkout gets a
+short hold on the items in their cart (product_reservations, see
+sql/inventory.sql); other buyers can't hold or buy them until it expires.
+Placing the order marks the items sold.
+
+All changes to a product's hold or status happen with that product's row
+locked (SELECT ... FOR UPDATE on just the ids involved, in id order), so
+checkouts for different items run in parallel and only buyers competing for
+the same item wait for each other. Product rows are always locked before any
+product_reservations row is written, in holds and orders alike, so the two
+never wait on each other in opposite orders.
+
+Every function takes a cursor inside the caller's transaction and leaves the
+commit to the caller.
+"""
+
+RESERVATION_TTL = 600
+
+
+class Unavailable(Exception):
+    """Some of the products are sold, deleted or held by another buyer."""
+
+    def __init__(self, product_ids):
+        super().__init__(f"Products no longer available: {sorted(product_ids)}")
+        self.product_ids = sorted(product_ids)
+
+
+def _placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+
+def lock_products(cursor, user_id, product_ids):
+    """Locks the products' rows and returns the ids this user can't have."""
+    product_ids = sorted(set(product_ids))
+    cursor.execute(
+        f"SELECT id FROM products WHERE id IN ({_placeholders(product_ids)}) "
+        f"AND status = 'available' ORDER BY id FOR UPDATE",
+        product_ids
+    )
+    available = {row[0] for row in cursor.fetchall()}
+
+    # Holds are only created or taken over with the product row locked, so reading them now is safe
+    cursor.execute(
+        f"SELECT product_id FROM product_reservations WHERE product_id IN ({_placeholders(product_ids)}) "
+        f"AND user_id <> %s AND expires_at > UTC_TIMESTAMP()",
+        [*product_ids, user_id]
+    )
+    held_by_others = {row[0] for row in cursor.fetchall()}
+    return set(product_ids) - available | held_by_others
+
+
+def reserve(cursor, user_id, product_ids, ttl=RESERVATION_TTL):
+    """Holds every product for `ttl` seconds, or none of them. Raises Unavailable."""
+    if not product_ids:
+        return
+    unavailable = lock_products(cursor, user_id, product_ids)
+    if unavailable:
+        raise Unavailable(unavailable)
+    _hold(cursor, user_id, product_ids, ttl)
+
+
+def replace_holds(cursor, user_id, product_ids, ttl=RESERVATION_TTL):
+    """Holds exactly `product_ids` for the user: all of them or none (raises Unavailable),
+    and drops the user's holds on anything else."""
+    cursor.execute("SELECT product_id FROM product_reservations WHERE user_id = %s", (user_id,))
+    stale = {row[0] for row in cursor.fetchall()} - set(product_ids)
+    # The stale holds' products are locked too, before their reservation rows are deleted
+    unavailable = lock_products(cursor, user_id, stale | set(product_ids)) & set(product_ids)
+    if unavailable:
+        raise Unavailable(unavailable)
+    release(cursor, user_id, stale)
+    _hold(cursor, user_id, product_ids, ttl)
+
+
+def _hold(cursor, user_id, product_ids, ttl):
+    product_ids = sorted(set(product_ids))
+    cursor.execute(
+        "INSERT INTO product_reservations (product_id, user_id, expires_at) VALUES "
+        + ", ".join(["(%s, %s, UTC_TIMESTAMP() + INTERVAL %s SECOND)"] * len(product_ids))
+        + " ON DUPLICATE KEY UPDATE user_id = VALUES(user_id), expires_at = VALUES(expires_at)",
+        [value for product_id in product_ids for value in (product_id, user_id, int(ttl))]
+    )
+
+
+def release(cursor, user_id, product_ids=None):
+    """Drops the user's holds (on `product_ids`, or all of them)."""
+    if product_ids is None:
+        cursor.execute("DELETE FROM product_reservations WHERE user_id = %s", (user_id,))
+    elif product_ids:
+        product_ids = sorted(set(product_ids))
+        cursor.execute(
+            f"DELETE FROM product_reservations WHERE user_id = %s AND product_id IN ({_placeholders(product_ids)})",
+            [user_id, *product_ids]
+        )
+
+
+def mark_sold(cursor, user_id, product_ids):
+    """Checks the products are still the user's to buy and marks them sold. Raises Unavailable.
+
+    Buying without a hold is allowed as long as nobody else holds the item.
+    """
+    unavailable = lock_products(cursor, user_id, product_ids)
+    if unavailable:
+        raise Unavailable(unavailable)
+
+    product_ids = sorted(set(product_ids))
+    cursor.execute(
+        f"UPDATE products SET status = 'sold' WHERE id IN ({_placeholders(product_ids)})",
+        product_ids
+    )
+    cursor.execute(
+        f"DELETE FROM product_reservations WHERE product_id IN ({_placeholders(product_ids)})",
+        product_ids
+    )
+
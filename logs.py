@@ -0,0 +1,131 @@
+"""Structured JSON logging with a background writer.
+
+Handlers log through the standard logging module; records are put on an
+in-memory queue by a QueueHandler and a single QueueListener thread formats
+them as JSON lines and writes them to stdout. A request thread only builds the
+record and enqueues it, it never waits on stdout or on other threads writing.
+
+Each line carries the request id and route of the request that logged it
+(supplied by the app through `context`), levels can be set per logger, and
+DEBUG records can be sampled so verbose handlers stay cheap in production.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+
+# Attributes every LogRecord has; anything else on a record came in through `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """Adds the fields returned by `context()` (e.g. request_id, route) to every record."""
+
+    def __init__(self, context):
+        super().__init__()
+        self.context = context
+
+    def filter(self, record):
+        fields = self.context()
+        if fields:
+            for key, value in fields.items():
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """Passes every INFO and above record but only `rate` of DEBUG ones."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+
+class BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records without formatting them; the listener thread does the JSON encoding.
+
+    The message is merged with its args here, while the args still hold
+    their values, and tracebacks are rendered here because they are rare.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Never block a request on logging; a burst beyond the queue is dropped and counted
+            self.dropped += 1
+
+
+def parse_levels(spec):
+    """"db=DEBUG,cache=WARNING" -> {"db": "DEBUG", "cache": "WARNING"}"""
+    levels = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level="INFO", module_levels=None, debug_sample_rate=1.0, context=None,
+                  stream=None, max_queue=10000):
+    """Routes the root logger through a queue to a JSON writer thread. Returns the queue handler."""
+    handler = BackgroundQueueHandler(queue.Queue(max_queue))
+    # Sampling first, so dropped records don't pay for the context lookup
+    if debug_sample_rate < 1:
+        handler.addFilter(DebugSampler(debug_sample_rate))
+    if context is not None:
+        handler.addFilter(ContextFilter(context))
+
+    writer = logging.StreamHandler(stream or sys.stdout)
+    writer.setFormatter(JsonFormatter())
+    listener = logging.handlers.QueueListener(handler.queue, writer, respect_handler_level=False)
+    listener.start()
+    # Flush what is still queued on shutdown
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    for name, module_level in (module_levels or {}).items():
+        logging.getLogger(name).setLevel(module_level)
+    return handler
+
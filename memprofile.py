@@ -0,0 +1,128 @@
+"""Sampled per-route memory allocation profiling with tracemalloc.
+
+tracemalloc slows every allocation in the process while it is tracing, so it
+is only switched on for the duration of a sampled request and only one request
+is sampled at a time; everything else runs untraced. For each sample the
+profiler records the traced peak, the memory still held when the request
+finished and the allocation sites holding the most memory. By the end of a
+request its result sets are usually gone already, so handlers that materialize
+large results call checkpoint() right after building them; the sites are then
+taken from the largest checkpoint instead. The last `window` samples are kept
+per route.
+
+Other threads keep allocating while a sample runs, so a single sample can
+include some of their allocations; the rolling per-route numbers are what to
+look at.
+
+Snapshots and their statistics are CPU-bound. They go through `run(fn, *args)`,
+which the app points at the gevent threadpool so they don't stall the hub.
+"""
+import os
+import random
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+_OWN_FILES = {tracemalloc.__file__, __file__}
+
+
+class AllocationProfiler:
+    def __init__(self, sample_rate=0.0, top_n=10, window=20, frames=1, run=None):
+        self.sample_rate = sample_rate
+        self.top_n = top_n
+        self.window = window
+        self.frames = frames
+        self.run = run or (lambda fn, *args: fn(*args))
+        self.stats = {"sampled": 0, "skipped_busy": 0}
+        self._routes = {}
+        self._busy = threading.Lock()
+        self._owner = None
+        self._checkpoint = None     # (traced bytes, snapshot) of the largest checkpoint
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0
+
+    def start(self, force=False):
+        """Starts tracing for this request if it is sampled. Returns a token for finish(), or None."""
+        if not force and (self.sample_rate <= 0 or random.random() >= self.sample_rate):
+            return None
+        if tracemalloc.is_tracing() or not self._busy.acquire(blocking=False):
+            self.stats["skipped_busy"] += 1
+            return None
+        self._owner = threading.get_ident()
+        self._checkpoint = None
+        tracemalloc.start(self.frames)
+        return time.perf_counter()
+
+    def checkpoint(self):
+        """Captures allocation sites now if this thread is being sampled and holds more than before."""
+        if self._owner != threading.get_ident() or not tracemalloc.is_tracing():
+            return
+        current, _ = tracemalloc.get_traced_memory()
+        if self._checkpoint is None or current > self._checkpoint[0]:
+            self._checkpoint = (current, self.run(tracemalloc.take_snapshot))
+
+    def _top_sites(self, snapshot):
+        # Snapshot.filter_traces() glob-matches every trace; dropping our own sites afterwards is far cheaper
+        top = []
+        for stat in snapshot.statistics("lineno"):
+            frame = stat.traceback[0]
+            if frame.filename in _OWN_FILES:
+                continue
+            if len(top) == self.top_n:
+                break
+            top.append({
+                "site": f"{os.path.relpath(frame.filename)}:{frame.lineno}",
+                "bytes": stat.size,
+                "blocks": stat.count,
+            })
+        return top
+
+    def finish(self, token, route):
+        """Stops tracing and records the sample under `route`."""
+        try:
+            duration = time.perf_counter() - token
+            current, peak = tracemalloc.get_traced_memory()
+            checkpoint = self._checkpoint
+            snapshot = checkpoint[1] if checkpoint else self.run(tracemalloc.take_snapshot)
+        finally:
+            self._owner = self._checkpoint = None
+            tracemalloc.stop()
+            self._busy.release()
+
+        sample = {
+            "at": time.time(),
+            "duration_ms": round(duration * 1000, 1),
+            "peak_bytes": peak,
+            "retained_bytes": current,
+            "sites_from": "checkpoint" if checkpoint else "end",
+            "top_sites": self.run(self._top_sites, snapshot),
+        }
+        with self._lock:
+            samples = self._routes.get(route)
+            if samples is None:
+                samples = self._routes[route] = deque(maxlen=self.window)
+            samples.append(sample)
+            self.stats["sampled"] += 1
+
+    def report(self):
+        """Per route: rolling peak statistics plus the retained samples, newest first."""
+        with self._lock:
+            routes = {route: list(samples) for route, samples in self._routes.items()}
+        report = {}
+        for route, samples in routes.items():
+            peaks = sorted(sample["peak_bytes"] for sample in samples)
+            report[route] = {
+                "samples": len(samples),
+                "peak_bytes_max": peaks[-1],
+                "peak_bytes_median": peaks[len(peaks) // 2],
+                "recent": samples[::-1],
+            }
+        return report
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
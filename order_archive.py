@@ -0,0 +1,150 @@
+"""Moves old orders into archive tables so the hot order tables stay small.
+
+Orders older than the configured age are copied with their items and delivery
+address into orders_archive, order_items_archive and
+delivery_addresses_archive (sql/order_archive.sql) and deleted from the hot
+tables, a batch per transaction. Order ids are never reused, so the archive
+holds exactly the orders older than everything left in the hot tables; read
+paths page through the hot tables first and only continue into the archive
+when a user asks for more history than is left there.
+
+Each batch takes the oldest orders with a plain FOR UPDATE. SKIP LOCKED
+would let a batch step over an order some other transaction has locked and
+archive newer ones, breaking the rule above; this way runs on several
+instances, or a batch meeting a locked order, wait their turn instead.
+
+Usage:
+    python order_archive.py --older-than-days 365 [--batch-size 500] [--dry-run]
+"""
+import argparse
+import logging
+import threading
+import time
+from collections import namedtuple
+
+log = logging.getLogger(__name__)
+
+OrderTables = namedtuple("OrderTables", ["orders", "items", "addresses"])
+
+HOT = OrderTables("orders", "order_items", "delivery_addresses")
+ARCHIVE = OrderTables("orders_archive", "order_items_archive", "delivery_addresses_archive")
+# Newest orders first; every archived id is lower than every hot one
+TIERS = (HOT, ARCHIVE)
+
+
+def archive_batch(conn, max_age, batch_size=500):
+    """Moves up to `batch_size` orders older than `max_age` seconds. Returns how many were moved."""
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        cursor.execute(
+            # Compared with NOW() as created_at is set by the server, in its time zone
+            "SELECT id FROM orders WHERE created_at < NOW() - INTERVAL %s SECOND "
+            "ORDER BY id LIMIT %s FOR UPDATE",
+            (int(max_age), batch_size)
+        )
+        order_ids = [row[0] for row in cursor.fetchall()]
+        if not order_ids:
+            conn.rollback()
+            return 0
+
+        placeholders = ', '.join(['%s'] * len(order_ids))
+        moves = ((HOT.orders, ARCHIVE.orders, "id"),
+                 (HOT.items, ARCHIVE.items, "order_id"),
+                 (HOT.addresses, ARCHIVE.addresses, "order_id"))
+        for hot, archive, key in moves:
+            cursor.execute(f"INSERT INTO {archive} SELECT * FROM {hot} WHERE {key} IN ({placeholders})", order_ids)
+        # Children first, they may reference the order
+        for hot, _, key in reversed(moves):
+            cursor.execute(f"DELETE FROM {hot} WHERE {key} IN ({placeholders})", order_ids)
+        conn.commit()
+        return len(order_ids)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def count_archivable(conn, max_age):
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM orders WHERE created_at < NOW() - INTERVAL %s SECOND", (int(max_age),))
+    count = cursor.fetchone()[0]
+    cursor.close()
+    return count
+
+
+class OrderArchiver:
+    """Archives orders older than `max_age` seconds every `interval` seconds in a background thread."""
+
+    def __init__(self, get_connection, max_age, interval=3600, batch_size=500, pause=0.1):
+        self.get_connection = get_connection
+        self.max_age = max_age
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause      # Between batches, so archiving never hogs the primary or the replicas
+        self.stats = {"runs": 0, "archived": 0, "last_run": None, "last_error": None}
+        self._thread = None
+
+    def run_once(self):
+        archived = 0
+        conn = self.get_connection()
+        try:
+            while True:
+                moved = archive_batch(conn, self.max_age, self.batch_size)
+                archived += moved
+                if moved < self.batch_size:
+                    break
+                time.sleep(self.pause)
+        finally:
+            conn.close()
+            self.stats["runs"] += 1
+            self.stats["archived"] += archived
+            self.stats["last_run"] = time.time()
+        return archived
+
+    def _run(self):
+        while True:
+            try:
+                archived = self.run_once()
+                if archived:
+                    log.info("Archived %s orders", archived)
+            except Exception as e:
+                self.stats["last_error"] = str(e)
+                log.error("Error archiving orders: %s", e)
+            time.sleep(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old orders into the archive tables")
+    parser.add_argument("--older-than-days", type=float, required=True)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="Only count the orders that would be moved")
+    args = parser.parse_args()
+
+    # Imported here so the module stays usable without initializing the app
+    from app import get_db_connection
+
+    archiver = OrderArchiver(lambda: get_db_connection(read_only=False),
+                             args.older_than_days * 86400, batch_size=args.batch_size)
+    if args.dry_run:
+        conn = archiver.get_connection()
+        try:
+            count = count_archivable(conn, archiver.max_age)
+        finally:
+            conn.close()
+        print(f"{count} orders would be archived")
+        return
+
+    started = time.perf_counter()
+    archived = archiver.run_once()
+    print(f"Archived {archived} orders in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
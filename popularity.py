@@ -0,0 +1,139 @@
+"""Buffered popularity counters and a time-decayed trending score.
+
+Request handlers only bump in-memory counters; a background thread flushes
+them to product_popularity (sql/product_popularity.sql) in multi-row upserts.
+
+The trending score decays with a half-life H. Rather than rewriting every
+row as time passes, each row stores
+
+    trend = log2( sum of weight * 2 ** ((t - EPOCH) / H) )
+
+over all its events. Ranking by `trend` is the same as ranking by the decayed
+score at any moment, a new batch merges in with a log-sum-exp in the upsert,
+and the column can be indexed. The decayed score at time `now` is
+2 ** (trend - (now - EPOCH) / H). Changing H requires resetting the column.
+"""
+import logging
+import math
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+EVENTS = ("views", "wishlist_adds", "cart_adds", "orders")
+
+# How much each event says about interest in a product
+EVENT_WEIGHTS = {"views": 1, "wishlist_adds": 3, "cart_adds": 5, "orders": 10}
+
+# Fixed reference point for `trend` (2024-01-01 UTC); never change it on a live table
+EPOCH = 1704067200
+
+# Rows per upsert statement
+FLUSH_BATCH_SIZE = 500
+
+
+def trend_increment(counts, now, half_life):
+    """The `trend` a batch of counts would have on its own, as of `now`."""
+    weight = sum(EVENT_WEIGHTS[event] * count for event, count in zip(EVENTS, counts))
+    return math.log2(weight) + (now - EPOCH) / half_life
+
+
+def decayed_score(trend, now, half_life):
+    return 2 ** (trend - (now - EPOCH) / half_life)
+
+
+def upsert_sql(rows):
+    """Multi-row upsert for `rows` batch rows. The trend column merges with a log-sum-exp."""
+    values = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * rows)
+    return (
+        "INSERT INTO product_popularity (product_id, views, wishlist_adds, cart_adds, orders, trend) "
+        f"VALUES {values} "
+        "ON DUPLICATE KEY UPDATE "
+        "views = views + VALUES(views), "
+        "wishlist_adds = wishlist_adds + VALUES(wishlist_adds), "
+        "cart_adds = cart_adds + VALUES(cart_adds), "
+        "orders = orders + VALUES(orders), "
+        "trend = GREATEST(trend, VALUES(trend)) + LOG2(1 + POW(2, -ABS(trend - VALUES(trend))))"
+    )
+
+
+class PopularityCounters:
+    """In-memory increments, flushed every `flush_interval` seconds or once
+    `max_pending` products are waiting, whichever comes first."""
+
+    def __init__(self, get_connection, half_life=86400, flush_interval=10, max_pending=5000, clock=time.time):
+        self.get_connection = get_connection
+        self.half_life = half_life
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.clock = clock
+        self.stats = {"flushes": 0, "rows_flushed": 0, "failed_flushes": 0}
+        self._pending = {}          # product id -> [views, wishlist_adds, cart_adds, orders]
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def incr(self, product_id, event, count=1):
+        index = EVENTS.index(event)
+        with self._lock:
+            counts = self._pending.get(product_id)
+            if counts is None:
+                counts = self._pending[product_id] = [0, 0, 0, 0]
+            counts[index] += count
+            if len(self._pending) >= self.max_pending:
+                self._wake.set()
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def flush(self):
+        """Writes pending increments. On failure they are merged back for the next flush."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+
+            now = self.clock()
+            rows = [(product_id, *counts, trend_increment(counts, now, self.half_life))
+                    for product_id, counts in sorted(batch.items())]
+            conn = None
+            try:
+                conn = self.get_connection()
+                cursor = conn.cursor()
+                for start in range(0, len(rows), FLUSH_BATCH_SIZE):
+                    chunk = rows[start:start + FLUSH_BATCH_SIZE]
+                    cursor.execute(upsert_sql(len(chunk)), [value for row in chunk for value in row])
+                conn.commit()
+                cursor.close()
+            except Exception:
+                self.stats["failed_flushes"] += 1
+                with self._lock:
+                    for product_id, counts in batch.items():
+                        merged = self._pending.setdefault(product_id, [0, 0, 0, 0])
+                        for i, count in enumerate(counts):
+                            merged[i] += count
+                raise
+            finally:
+                if conn is not None:
+                    conn.close()
+
+            self.stats["flushes"] += 1
+            self.stats["rows_flushed"] += len(rows)
+            return len(rows)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                log.error("Error flushing popularity counters: %s", e)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
@@ -0,0 +1,165 @@
+"""In-memory prefix index for search-as-you-type suggestions.
+
+Product names and categories are normalized and stored in a sorted list of
+(key, term) entries; a prefix lookup is a bisect plus a short forward scan, so it
+never touches MySQL. Every word position of a name is indexed, so "calc"
+suggests "Casio Calculator" as well as "Calculus Textbook".
+"""
+import bisect
+import re
+import threading
+
+_WORD_RE = re.compile(r"\w+")
+
+# Upper bound on keys scanned per lookup so very short prefixes stay cheap
+MAX_SCAN = 300
+
+# Suggestions are memoized per (prefix, limit) until the index next changes;
+# short prefixes are both the most repeated and the most expensive to scan.
+RESULT_CACHE_SIZE = 4096
+
+
+def normalize(text):
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._keys = []       # sorted [(key, word position, term)]
+        self._terms = {}      # term -> reference count, term = (kind, display text)
+        self._products = {}   # product id -> (name, category)
+        self._results = {}
+        self._replay = None   # changes made while a rebuild reads the table, applied after its swap
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _term_keys(text):
+        """(key, word position) for every word suffix of the text."""
+        words = normalize(text).split(" ")
+        keys = {}
+        for i in range(len(words) - 1, -1, -1):
+            if words[i]:
+                keys[" ".join(words[i:])] = i
+        return keys.items()
+
+    def _add_term(self, term):
+        count = self._terms.get(term, 0)
+        self._terms[term] = count + 1
+        if count == 0:
+            for key, position in self._term_keys(term[1]):
+                bisect.insort(self._keys, (key, position, term))
+
+    def _remove_term(self, term):
+        count = self._terms.get(term, 0)
+        if count > 1:
+            self._terms[term] = count - 1
+            return
+        self._terms.pop(term, None)
+        for key, position in self._term_keys(term[1]):
+            entry = (key, position, term)
+            i = bisect.bisect_left(self._keys, entry)
+            if i < len(self._keys) and self._keys[i] == entry:
+                del self._keys[i]
+
+    def _terms_for(self, name, category):
+        terms = []
+        if name and name.strip():
+            terms.append(("product", name.strip()))
+        if category and category.strip():
+            terms.append(("category", category.strip()))
+        return terms
+
+    def _add(self, product_id, name, category):
+        previous = self._products.pop(product_id, None)
+        if previous:
+            for term in self._terms_for(*previous):
+                self._remove_term(term)
+        self._products[product_id] = (name, category)
+        for term in self._terms_for(name, category):
+            self._add_term(term)
+        self._results = {}
+
+    def _remove(self, product_id):
+        previous = self._products.pop(product_id, None)
+        if previous:
+            for term in self._terms_for(*previous):
+                self._remove_term(term)
+            self._results = {}
+
+    def add_product(self, product_id, name, category):
+        """Adds or replaces a product's name and category."""
+        with self._lock:
+            self._add(product_id, name, category)
+            if self._replay is not None:
+                self._replay.append((self._add, (product_id, name, category)))
+
+    def remove_product(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+            if self._replay is not None:
+                self._replay.append((self._remove, (product_id,)))
+
+    @staticmethod
+    def _build(products):
+        fresh = PrefixIndex()
+        terms = fresh._terms
+        for product_id, name, category in products:
+            fresh._products[product_id] = (name, category)
+            for term in fresh._terms_for(name, category):
+                terms[term] = terms.get(term, 0) + 1
+        # One sort instead of an insort per key
+        fresh._keys = sorted((key, position, term) for term in terms for key, position in fresh._term_keys(term[1]))
+        return fresh
+
+    def rebuild(self, products, run=None):
+        """Replaces the index from an iterable of (product_id, name, category).
+
+        With `run`, the rows are read here and the build itself is done by
+        run(build, rows); the app passes one that moves it off the gevent hub.
+        """
+        with self._lock:
+            self._replay = []
+        try:
+            fresh = self._build(products) if run is None else run(self._build, list(products))
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+
+        with self._lock:
+            replay, self._replay = self._replay, None
+            self._keys, self._terms, self._products = fresh._keys, fresh._terms, fresh._products
+            self._results = {}
+            # Products added or removed while the table was being read may be missing from it
+            for apply, args in replay:
+                apply(*args)
+
+    def suggest(self, prefix, limit=10):
+        """Top `limit` suggestions for a prefix, most common terms first."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        with self._lock:
+            cached = self._results.get((prefix, limit))
+            if cached is not None:
+                return cached
+
+            keys, terms = self._keys, self._terms
+            matches = {}
+            start = bisect.bisect_left(keys, (prefix,))
+            for key, position, term in keys[start:start + MAX_SCAN]:
+                if not key.startswith(prefix):
+                    break
+                # Matches at the start of the text rank above mid-name word matches
+                matches[term] = matches.get(term, False) or position == 0
+            ranked = sorted(matches, key=lambda term: (not matches[term], -terms[term], term[1].lower()))
+
+            result = [{"text": text, "type": kind} for kind, text in ranked[:limit]]
+            if len(self._results) >= RESULT_CACHE_SIZE:
+                self._results = {}
+            self._results[(prefix, limit)] = result
+            return result
+
+    def __len__(self):
+        return len(self._keys)
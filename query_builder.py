@@ -0,0 +1,217 @@
+"""Catalog query builder for /get-products and its facets.
+
+Request filters are normalized into a ProductFilters tuple. The SQL text only
+depends on the filter *shape* (which filters are present and how many values
+each multi-select has), so it is compiled once per shape and cached; the
+values are bound as parameters. Each shape is also matched to the composite
+index that serves it best (see sql/product_indexes.sql), hinted only when that
+index actually exists.
+"""
+import threading
+from collections import namedtuple
+
+PRODUCT_COLUMNS = "p.id, p.user_id, p.name, p.description, p.category, p.state, p.price, p.image_url"
+
+SORTS = {
+    "newest": "p.created_at DESC",
+    "oldest": "p.created_at ASC",
+    "low-to-high": "p.price ASC",
+    "high-to-low": "p.price DESC",
+    # Products without popularity counters (NULL) rank last, newest first
+    "trending": "pp.trend DESC, p.created_at DESC",
+}
+
+# Extra joins a sort needs
+SORT_JOINS = {
+    "trending": " LEFT JOIN product_popularity pp ON pp.product_id = p.id",
+}
+
+# (index name, leading equality/range column, sort column it serves)
+COMPOSITE_INDEXES = [
+    ("idx_products_user_created", "seller", "created_at"),
+    ("idx_products_category_created", "category", "created_at"),
+    ("idx_products_category_price", "category", "price"),
+    ("idx_products_state_created", "condition", "created_at"),
+    ("idx_products_state_price", "condition", "price"),
+    ("idx_products_created", None, "created_at"),
+    ("idx_products_price", None, "price"),
+]
+
+ProductFilters = namedtuple("ProductFilters", [
+    "search", "categories", "conditions", "price_min", "price_max",
+    "seller_id", "months_used_min", "months_used_max", "sort"
+])
+
+
+def _multi(args, name):
+    """Values from repeated and/or comma-separated params, deduplicated and sorted."""
+    values = set()
+    for raw in args.getlist(name):
+        values.update(v.strip() for v in raw.split(",") if v.strip())
+    values.discard("All")
+    return tuple(sorted(values))
+
+
+def _number(args, name, cast):
+    value = args.get(name, "").strip()
+    if not value:
+        return None
+    try:
+        return cast(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+
+
+def parse_filters(args):
+    """Builds ProductFilters from request args. Raises ValueError on malformed input."""
+    sort = args.get("sort", "newest")
+    filters = ProductFilters(
+        search=args.get("search", "").strip(),
+        categories=_multi(args, "category"),
+        conditions=_multi(args, "condition"),
+        price_min=_number(args, "price_min", float),
+        price_max=_number(args, "price_max", float),
+        seller_id=args.get("seller_id", "").strip() or None,
+        months_used_min=_number(args, "months_used_min", int),
+        months_used_max=_number(args, "months_used_max", int),
+        sort=sort if sort in SORTS else "newest",
+    )
+    if filters.price_min is not None and filters.price_max is not None and filters.price_min > filters.price_max:
+        raise ValueError("price_min must not exceed price_max")
+    return filters
+
+
+def filter_shape(filters, exclude=()):
+    """Hashable description of which filters are present; everything the SQL text depends on."""
+    return (
+        bool(filters.search),
+        0 if "category" in exclude else len(filters.categories),
+        0 if "condition" in exclude else len(filters.conditions),
+        filters.price_min is not None,
+        filters.price_max is not None,
+        filters.seller_id is not None,
+        filters.months_used_min is not None,
+        filters.months_used_max is not None,
+    )
+
+
+def filter_params(filters, exclude=()):
+    """Parameters in the same order compile_where emits placeholders."""
+    params = []
+    if filters.search:
+        params.extend([f"%{filters.search}%", f"%{filters.search}%"])
+    if "category" not in exclude:
+        params.extend(filters.categories)
+    if "condition" not in exclude:
+        params.extend(filters.conditions)
+    for value in (filters.price_min, filters.price_max, filters.seller_id,
+                  filters.months_used_min, filters.months_used_max):
+        if value is not None:
+            params.append(value)
+    return params
+
+
+def compile_where(shape):
+    has_search, n_categories, n_conditions, has_min, has_max, has_seller, has_mu_min, has_mu_max = shape
+    # Sold listings are kept for order history but never listed or counted (see sql/inventory.sql)
+    clauses = ["p.status = 'available'"]
+    if has_search:
+        clauses.append("(p.name LIKE %s OR p.description LIKE %s)")
+    if n_categories:
+        clauses.append("p.category = %s" if n_categories == 1
+                       else f"p.category IN ({', '.join(['%s'] * n_categories)})")
+    if n_conditions:
+        clauses.append("p.state = %s" if n_conditions == 1
+                       else f"p.state IN ({', '.join(['%s'] * n_conditions)})")
+    if has_min:
+        clauses.append("p.price >= %s")
+    if has_max:
+        clauses.append("p.price <= %s")
+    if has_seller:
+        clauses.append("p.user_id = %s")
+    if has_mu_min:
+        clauses.append("p.months_used >= %s")
+    if has_mu_max:
+        clauses.append("p.months_used <= %s")
+    return " AND ".join(clauses)
+
+
+def choose_index(shape, sort, available):
+    """Picks the composite index matching the most selective filter and the sort column."""
+    _, n_categories, n_conditions, has_min, has_max, has_seller, _, _ = shape
+    sort_column = SORTS[sort].split()[0].split(".")[1] if sort else None
+
+    leading = []
+    if has_seller:
+        leading.append("seller")
+    if n_categories:
+        leading.append("category")
+    if n_conditions:
+        leading.append("condition")
+
+    candidates = []
+    for lead in leading:
+        candidates += [name for name, column, order in COMPOSITE_INDEXES if column == lead and order == sort_column]
+        candidates += [name for name, column, _ in COMPOSITE_INDEXES if column == lead]
+    if not leading:
+        if sort_column:
+            candidates += [name for name, column, order in COMPOSITE_INDEXES if column is None and order == sort_column]
+        if has_min or has_max:
+            candidates.append("idx_products_price")
+
+    for name in candidates:
+        if name in available:
+            return name
+    return None
+
+
+class QueryPlanner:
+    """Compiles and caches catalog SQL per filter shape."""
+
+    def __init__(self, available_indexes=()):
+        self.available_indexes = frozenset(available_indexes)
+        self._compiled = {}
+        self._lock = threading.Lock()
+
+    def set_available_indexes(self, names):
+        with self._lock:
+            self.available_indexes = frozenset(names)
+            self._compiled.clear()
+
+    def _compile(self, key, build):
+        sql = self._compiled.get(key)
+        if sql is None:
+            sql = build()
+            with self._lock:
+                self._compiled[key] = sql
+        return sql
+
+    def listing(self, filters):
+        """(sql, params) for the product listing."""
+        shape = filter_shape(filters)
+
+        def build():
+            index = choose_index(shape, filters.sort, self.available_indexes)
+            hint = f" USE INDEX ({index})" if index else ""
+            join = SORT_JOINS.get(filters.sort, "")
+            return (f"SELECT {PRODUCT_COLUMNS} FROM products p{hint}{join} "
+                    f"WHERE {compile_where(shape)} ORDER BY {SORTS[filters.sort]}")
+
+        return self._compile(("listing", shape, filters.sort), build), filter_params(filters)
+
+    def facet(self, filters, facet):
+        """(sql, params) counting products per value of `facet` ("category" or "condition").
+
+        The facet's own filter is left out so the other values stay selectable.
+        """
+        shape = filter_shape(filters, exclude=(facet,))
+        column = "p.category" if facet == "category" else "p.state"
+
+        def build():
+            return (f"SELECT {column}, COUNT(*) FROM products p "
+                    f"WHERE {compile_where(shape)} GROUP BY {column}")
+
+        return self._compile(("facet", facet, shape), build), filter_params(filters, exclude=(facet,))
+
+    def __len__(self):
+        return len(self._compiled)
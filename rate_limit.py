@@ -0,0 +1,61 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucket:
+    """Token bucket holding up to `capacity` tokens, refilled at `rate` tokens per second."""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity, rate, now):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now, cost=1):
+        """Consume `cost` tokens. Returns 0 when allowed, otherwise seconds until it would be."""
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0
+        return (cost - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Per-client, per-route token buckets.
+
+    `budgets` maps a route name to a (capacity, refill_per_second) pair; routes
+    without an entry use `default`. Buckets are kept in an LRU so memory stays
+    bounded - an evicted bucket would have refilled anyway for idle clients.
+    """
+
+    def __init__(self, budgets, default, max_keys=50000, clock=time.monotonic):
+        self.budgets = budgets
+        self.default = default
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, route, client):
+        """Returns 0 if the request may proceed, otherwise the Retry-After delay in seconds."""
+        capacity, rate = self.budgets.get(route, self.default)
+        key = (route, client)
+        now = self.clock()
+
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(capacity, rate, now)
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.take(now)
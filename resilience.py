@@ -0,0 +1,113 @@
+"""Deadlines, jittered retries and circuit breakers for calls to external services
+(Google Cloud Storage, Firebase token verification)."""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the dependency while its breaker is open."""
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and fails fast for
+    `reset_timeout` seconds, then lets a single trial call through (half-open)."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.stats = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0}
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def _allow(self):
+        with self._lock:
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def _record(self, success):
+        with self._lock:
+            self.stats["calls"] += 1
+            self._trial_in_flight = False
+            if success:
+                self.state = self.CLOSED
+                self.failures = 0
+                return
+            self.stats["failures"] += 1
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.stats["opened"] += 1
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+    def call(self, fn, *args, is_failure=lambda e: True, **kwargs):
+        """Calls fn through the breaker. Exceptions for which is_failure() is False
+        (e.g. an invalid token) propagate without counting against the dependency."""
+        if not self._allow():
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._record(not is_failure(e))
+            raise
+        self._record(True)
+        return result
+
+    def snapshot(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, **self.stats}
+
+
+def retry(fn, attempts=3, base_delay=0.2, max_delay=2.0, deadline=None, retry_on=(Exception,)):
+    """Calls fn up to `attempts` times with full-jitter exponential backoff.
+
+    Only for idempotent operations. Never sleeps past `deadline` (a
+    time.monotonic() value); the last error is raised instead.
+    """
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except CircuitOpenError:
+            raise
+        except retry_on:
+            if attempt == attempts - 1:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise
+            time.sleep(delay)
+
+
+# Calls without a native timeout run here so the request thread can give up on them
+_deadline_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="deadline")
+
+
+def call_with_deadline(fn, timeout, *args, **kwargs):
+    """Runs fn with a hard deadline for the caller. The call itself may keep running
+    in the background pool, but the request thread is released after `timeout`."""
+    future = _deadline_executor.submit(fn, *args, **kwargs)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        future.cancel()
+        raise DeadlineExceeded(f"{getattr(fn, '__name__', 'call')} exceeded {timeout}s")
@@ -0,0 +1,127 @@
+"""Response shaping for catalog and order endpoints.
+
+Pure functions from database rows to API payloads, kept free of Flask and
+MySQL so benchmarks/bench_shaping.py can time them on synthetic rows.
+"""
+import json
+
+
+def prices_to_float(products):
+    """Converts Decimal prices to float for JSON serialization, in place."""
+    for product in products:
+        if 'price' in product and product['price'] is not None:
+            product['price'] = float(product['price'])
+    return products
+
+
+def format_product_detail(product):
+    """Shapes a product detail row (with JSON-aggregated images) into the API response."""
+    # Process the additional images, ordered by insertion
+    all_images = [product['main_image']]  # Start with main image
+    if product['additional_images']:
+        image_rows = json.loads(product['additional_images'])
+        all_images.extend(url for _, url in sorted(image_rows))
+
+    # Format the product data
+    formatted_product = {
+        **product,
+        'images': all_images,  # Add all images array
+        'created_at': product['created_at'].isoformat() if product['created_at'] else None
+    }
+    del formatted_product['additional_images']  # Remove the aggregated JSON
+    return formatted_product
+
+
+def shape_grouped_order(order):
+    """One /api/orders row, with its items as parallel GROUP_CONCAT lists, into the API shape."""
+    product_ids = str(order['product_ids']).split(',') if order['product_ids'] else []
+    quantities = str(order['quantities']).split(',') if order['quantities'] else []
+    prices = str(order['prices']).split(',') if order['prices'] else []
+    names = str(order['product_names']).split(',') if order['product_names'] else []
+    images = str(order['image_urls']).split(',') if order['image_urls'] else []
+
+    items = [
+        {
+            'id': pid,
+            'quantity': int(qty),
+            'price': float(price),
+            'name': name,
+            'image_url': img
+        }
+        for pid, qty, price, name, img in zip(product_ids, quantities, prices, names, images)
+        if pid and qty and price and name
+    ]
+
+    return {
+        'id': order['id'],
+        'total_amount': float(order['total_amount']),
+        'status': order['status'],
+        'created_at': order['created_at'].isoformat() if order['created_at'] else None,
+        'delivery_address': {
+            'full_name': order['full_name'],
+            'phone': order['phone'],
+            'address': order['address'],
+            'city': order['city'],
+            'state': order['state'],
+            'pincode': order['pincode']
+        },
+        'items': items
+    }
+
+
+def shape_user_order(order, address, items):
+    """One order for /api/orders/user/<id>, from its order, address and item rows."""
+    address = address or {}
+    return {
+        'id': order['id'],
+        'total_amount': float(order['total_amount']),
+        'status': order['status'],
+        'created_at': order['created_at'].isoformat() if order['created_at'] else None,
+        'delivery_address': {
+            'full_name': address.get('full_name', ''),
+            'phone': address.get('phone', ''),
+            'address': address.get('address', ''),
+            'city': address.get('city', ''),
+            'state': address.get('state', ''),
+            'pincode': address.get('pincode', '')
+        },
+        'items': [
+            {
+                'id': item['product_id'],
+                'quantity': item['quantity'],
+                'price': float(item['price']),
+                'name': item['name'],
+                'image_url': item['image_url']
+            }
+            for item in items
+        ]
+    }
+
+
+def shape_order_detail(order, items, sellers):
+    """/api/orders/<id>: the order row with its address, items and seller names (profiles by id)."""
+    return {
+        "id": order['id'],
+        "user_id": order['user_id'],
+        "status": order['status'],
+        "total_amount": float(order['total_amount']),
+        "created_at": order['created_at'].isoformat(),
+        "delivery_address": {
+            "full_name": order['full_name'],
+            "phone": order['phone'],
+            "address": order['address'],
+            "city": order['city'],
+            "state": order['state'],
+            "pincode": order['pincode'],
+            "hostel_room": order['hostel_room']
+        },
+        "items": [{
+            "id": item['id'],
+            "product_id": item['product_id'],
+            "quantity": item['quantity'],
+            "price": float(item['price']),
+            "name": item['name'],
+            "image_url": item['image_url'],
+            "seller_name": sellers[item['seller_id']]['name'] if item['seller_id'] in sellers else None
+        } for item in items]
+    }
@@ -0,0 +1,57 @@
+"""Direct-to-bucket uploads with V4 signed URLs.
+
+Objects are issued under {folder}/{user_id}/, so the finalize endpoints can
+check that every object they attach was signed for the same user. Nothing
+here reads the user from the request; callers pass the verified one.
+"""
+import uuid
+
+from werkzeug.utils import secure_filename
+
+
+def object_prefix(folder, user_id):
+    return f"{folder}/{secure_filename(str(user_id))}/"
+
+
+def sign_upload(bucket, folder, user_id, filename, content_type, max_bytes, expiry):
+    """Signs a PUT for one new object. Returns the object name, the URL, the headers
+    the client must send with its PUT, and the object's eventual public URL."""
+    headers = {"x-goog-content-length-range": f"0,{max_bytes}"}
+    blob = bucket.blob(f"{object_prefix(folder, user_id)}{uuid.uuid4()}_{filename}")
+    # Signing is local (service account key), no call to GCS
+    upload_url = blob.generate_signed_url(
+        version="v4",
+        expiration=expiry,
+        method="PUT",
+        content_type=content_type,
+        # A copy: the library adds Host to the dict it's given, which clients mustn't send
+        headers=dict(headers)
+    )
+    return {
+        "object_name": blob.name,
+        "upload_url": upload_url,
+        "headers": {"Content-Type": content_type, **headers},
+        "public_url": blob.public_url
+    }
+
+
+def verify_uploaded_objects(bucket, object_names, folder, user_id, max_bytes,
+                            call=lambda operation: operation(), timeout=60):
+    """Checks each object was issued to this user, exists, is an image within the size limit,
+    and makes it public. Returns the public URLs, or raises ValueError.
+
+    `call` runs each GCS request (the app passes its retrying, circuit-broken gcs_call).
+    """
+    prefix = object_prefix(folder, user_id)
+    urls = []
+    for object_name in object_names:
+        if not isinstance(object_name, str) or not object_name.startswith(prefix) or '..' in object_name:
+            raise ValueError(f"Object {object_name} was not issued for this upload")
+        blob = call(lambda: bucket.get_blob(object_name, timeout=timeout, retry=None))
+        if blob is None:
+            raise ValueError(f"Object {object_name} has not been uploaded")
+        if blob.size > max_bytes or not (blob.content_type or '').startswith('image/'):
+            raise ValueError(f"Object {object_name} is not a valid image")
+        call(lambda: blob.make_public(timeout=timeout, retry=None))
+        urls.append(blob.public_url)
+    return urls
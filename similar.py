@@ -0,0 +1,265 @@
+"""Similar-product recommendations from TF-IDF vectors over name, description and category.
+
+A background build turns the products table into a sparse term-by-product
+matrix held as NumPy arrays, in both row (CSR) and column (CSC) layout.
+Scoring a product gathers the posting lists of its own terms and accumulates
+the dot product with every other product in one np.bincount; vectors are
+L2-normalized, so that is cosine similarity.
+
+Products uploaded or edited after the build go into a small overlay weighted
+with the build's IDF, and their stale matrix rows are masked out. The overlay
+is folded into the matrix by the next rebuild.
+"""
+import math
+import re
+import sys
+import threading
+import time
+
+import numpy as np
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the "
+    "this to was with very good new used condition".split()
+)
+
+# Name words count double: they say what the item is, descriptions ramble
+NAME_WEIGHT = 2
+
+# Terms in more than this share of products carry no signal but cost the longest posting lists
+MAX_DF_RATIO = 0.5
+
+# Once this many products changed since the last build, a rebuild is due
+OVERLAY_LIMIT = 2000
+
+
+def product_terms(name, description, category):
+    """Term counts for one product; the category is a single term of its own."""
+    counts = {}
+    for text, weight in ((name, NAME_WEIGHT), (description, 1)):
+        for word in _WORD_RE.findall((text or "").lower()):
+            if len(word) > 1 and word not in STOP_WORDS:
+                counts[word] = counts.get(word, 0) + weight
+    if category and category.strip():
+        key = "category:" + category.strip().lower()
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+class _Matrix:
+    """Immutable result of a build."""
+
+    def __init__(self, product_ids, vocab, idf, row_ptr, row_cols, row_vals, col_ptr, col_rows, col_vals):
+        self.product_ids = product_ids
+        self.rows = {int(product_id): row for row, product_id in enumerate(product_ids)}
+        self.vocab = vocab
+        self.idf = idf
+        self.row_ptr, self.row_cols, self.row_vals = row_ptr, row_cols, row_vals
+        self.col_ptr, self.col_rows, self.col_vals = col_ptr, col_rows, col_vals
+
+    @classmethod
+    def build(cls, products):
+        product_ids, vocab = [], {}
+        row_lengths, cols, counts = [], [], []
+        for product_id, name, description, category in products:
+            terms = product_terms(name, description, category)
+            product_ids.append(product_id)
+            row_lengths.append(len(terms))
+            for term, count in terms.items():
+                cols.append(vocab.setdefault(term, len(vocab)))
+                counts.append(count)
+
+        n = len(product_ids)
+        rows = np.repeat(np.arange(n, dtype=np.int32), row_lengths)
+        cols = np.asarray(cols, dtype=np.int32)
+        counts = np.asarray(counts, dtype=np.float32)
+
+        df = np.bincount(cols, minlength=len(vocab))
+        idf = (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+        idf[df > max(1, MAX_DF_RATIO * n)] = 0
+
+        vals = (1 + np.log(counts)) * idf[cols]
+        keep = vals > 0
+        rows, cols, vals = rows[keep], cols[keep], vals[keep]
+        norms = np.sqrt(np.bincount(rows, vals * vals, minlength=n)).astype(np.float32)
+        vals /= norms[rows]
+
+        # Entries are already grouped by row; sorting by column gives the posting lists
+        row_ptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=row_ptr[1:])
+        order = np.argsort(cols, kind="stable")
+        col_ptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cols, minlength=len(vocab)), out=col_ptr[1:])
+
+        return cls(np.asarray(product_ids, dtype=np.int64), vocab, idf,
+                   row_ptr, cols, vals, col_ptr, rows[order], vals[order])
+
+    def nbytes(self):
+        arrays = (self.product_ids, self.idf, self.row_ptr, self.row_cols, self.row_vals,
+                  self.col_ptr, self.col_rows, self.col_vals)
+        # Dicts are estimated from their containers and keys, not every int object
+        dicts = sys.getsizeof(self.vocab) + sum(sys.getsizeof(term) for term in self.vocab) + sys.getsizeof(self.rows)
+        return sum(array.nbytes for array in arrays) + dicts
+
+
+class SimilarityIndex:
+    def __init__(self):
+        self._matrix = _Matrix.build([])
+        self._removed = np.zeros(0, dtype=bool)
+        self._overlay = {}          # product id -> (term columns, weights)
+        self._extra_terms = {}      # terms first seen after the build -> column
+        self._overlay_arrays = None
+        self._replay = None         # changes made while a rebuild is running
+        self._lock = threading.Lock()
+        self.build_seconds = None
+
+    def _vector(self, name, description, category):
+        matrix = self._matrix
+        n = len(matrix.product_ids)
+        # Terms unknown to the build are as rare as a term can be
+        unseen_idf = math.log(1 + n) + 1
+        cols, vals = [], []
+        for term, count in product_terms(name, description, category).items():
+            col = matrix.vocab.get(term)
+            if col is None:
+                col = self._extra_terms.setdefault(term, len(matrix.vocab) + len(self._extra_terms))
+                idf = unseen_idf
+            else:
+                idf = float(matrix.idf[col])
+            if idf > 0:
+                cols.append(col)
+                vals.append((1 + math.log(count)) * idf)
+        vals = np.asarray(vals, dtype=np.float32)
+        norm = float(np.sqrt(np.dot(vals, vals)))
+        return np.asarray(cols, dtype=np.int64), vals / norm if norm else vals
+
+    def _add(self, product_id, name, description, category):
+        row = self._matrix.rows.get(product_id)
+        if row is not None:
+            self._removed[row] = True
+        self._overlay[product_id] = self._vector(name, description, category)
+        self._overlay_arrays = None
+
+    def _remove(self, product_id):
+        row = self._matrix.rows.get(product_id)
+        if row is not None:
+            self._removed[row] = True
+        if self._overlay.pop(product_id, None) is not None:
+            self._overlay_arrays = None
+
+    def add_product(self, product_id, name, description, category):
+        """Adds or replaces a product. Returns True once the overlay is big enough to rebuild."""
+        with self._lock:
+            self._add(product_id, name, description, category)
+            if self._replay is not None:
+                self._replay.append((self._add, (product_id, name, description, category)))
+            return len(self._overlay) >= OVERLAY_LIMIT and self._replay is None
+
+    def remove_product(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+            if self._replay is not None:
+                self._replay.append((self._remove, (product_id,)))
+
+    def rebuild(self, products, run=None):
+        """Replaces the matrix from an iterable of (product_id, name, description, category).
+
+        With `run`, the rows are read here and the build itself is done by
+        run(build, rows); the app passes one that moves it off the gevent hub.
+        """
+        started = time.perf_counter()
+        with self._lock:
+            self._replay = []
+        try:
+            matrix = _Matrix.build(products) if run is None else run(_Matrix.build, list(products))
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+
+        with self._lock:
+            replay, self._replay = self._replay, None
+            self._matrix = matrix
+            self._removed = np.zeros(len(matrix.product_ids), dtype=bool)
+            self._overlay, self._extra_terms, self._overlay_arrays = {}, {}, None
+            # Writes that landed while the table was being read may be missing from it
+            for apply, args in replay:
+                apply(*args)
+        self.build_seconds = time.perf_counter() - started
+
+    def _overlay_matrix(self):
+        """Overlay rows flattened to (ids, row of each entry, columns, weights)."""
+        if self._overlay_arrays is None:
+            ids = list(self._overlay)
+            vectors = [self._overlay[product_id] for product_id in ids]
+            self._overlay_arrays = (
+                np.asarray(ids, dtype=np.int64),
+                np.repeat(np.arange(len(ids)), [len(cols) for cols, _ in vectors]),
+                np.concatenate([cols for cols, _ in vectors]) if vectors else np.zeros(0, dtype=np.int64),
+                np.concatenate([vals for _, vals in vectors]) if vectors else np.zeros(0, dtype=np.float32),
+            )
+        return self._overlay_arrays
+
+    def similar(self, product_id, limit=10):
+        """[(product_id, cosine similarity)] for the `limit` most similar products, best first.
+        Empty if the product is unknown or shares no informative term with any other."""
+        with self._lock:
+            matrix, removed = self._matrix, self._removed
+            if product_id in self._overlay:
+                cols, vals = self._overlay[product_id]
+            else:
+                row = matrix.rows.get(product_id)
+                if row is None or removed[row]:
+                    return []
+                start, end = matrix.row_ptr[row], matrix.row_ptr[row + 1]
+                cols, vals = matrix.row_cols[start:end], matrix.row_vals[start:end]
+            overlay_ids, overlay_rows, overlay_cols, overlay_vals = self._overlay_matrix()
+            width = len(matrix.vocab) + len(self._extra_terms)
+
+        # Base matrix: gather the posting lists of the query's terms, one bincount
+        n = len(matrix.product_ids)
+        base_cols = cols < len(matrix.vocab)
+        postings = [(matrix.col_ptr[col], matrix.col_ptr[col + 1], weight)
+                    for col, weight in zip(cols[base_cols], vals[base_cols])]
+        if postings and n:
+            rows = np.concatenate([matrix.col_rows[start:end] for start, end, _ in postings])
+            weights = np.concatenate([matrix.col_vals[start:end] * weight for start, end, weight in postings])
+            base_scores = np.bincount(rows, weights, minlength=n).astype(np.float32)
+            base_scores[removed] = 0
+        else:
+            base_scores = np.zeros(n, dtype=np.float32)
+
+        # Overlay: dense query vector, one gather
+        query = np.zeros(width, dtype=np.float32)
+        query[cols] = vals
+        overlay_scores = np.bincount(overlay_rows, overlay_vals * query[overlay_cols],
+                                     minlength=len(overlay_ids)).astype(np.float32)
+
+        ids = np.concatenate([matrix.product_ids, overlay_ids])
+        scores = np.concatenate([base_scores, overlay_scores])
+        scores[ids == product_id] = 0
+
+        limit = min(limit, len(scores))
+        if limit <= 0:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(ids[i]), round(float(scores[i]), 4)) for i in top if scores[i] > 0]
+
+    def stats(self):
+        with self._lock:
+            matrix = self._matrix
+            return {
+                "products": len(matrix.product_ids) - int(self._removed.sum()) + len(self._overlay),
+                "terms": len(matrix.vocab) + len(self._extra_terms),
+                "nonzeros": len(matrix.row_vals),
+                "overlay": len(self._overlay),
+                "memory_bytes": matrix.nbytes(),
+                "build_seconds": None if self.build_seconds is None else round(self.build_seconds, 3),
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._matrix.product_ids) - int(self._removed.sum()) + len(self._overlay)
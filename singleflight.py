@@ -0,0 +1,65 @@
+"""Request coalescing: concurrent callers with the same key share one execution.
+
+Independent of any cache - once the in-flight call finishes, the next caller
+runs it again. Results are shared between threads, so callers must treat them
+as read-only.
+"""
+import threading
+
+
+class SingleFlightTimeout(TimeoutError):
+    pass
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {"executions": 0, "shared": 0, "timeouts": 0}
+
+    def do(self, key, fn, timeout=None):
+        """Returns fn()'s result, running it only if no call for `key` is in flight.
+
+        Followers wait up to `timeout` seconds for the leader and then raise
+        SingleFlightTimeout; if the leader raises, every follower gets the same
+        exception.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.stats["executions"] += 1
+            else:
+                call.waiters += 1
+                self.stats["shared"] += 1
+
+        if not leader:
+            if not call.done.wait(timeout):
+                with self._lock:
+                    self.stats["timeouts"] += 1
+                raise SingleFlightTimeout(f"Timed out waiting for in-flight call {key!r}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
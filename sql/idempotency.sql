@@ -0,0 +1,12 @@
+-- Idempotency-Key claims and stored responses, used by idempotency.IdempotencyStore.
+-- `id` is the sha256 of the endpoint/user scope and the client's key. While the request
+-- runs response_status is NULL and expires_at is when the claim may be taken over.
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    id CHAR(64) NOT NULL PRIMARY KEY,
+    fingerprint CHAR(64) NOT NULL,
+    response_status SMALLINT NULL,
+    response_body MEDIUMBLOB NULL,
+    content_type VARCHAR(100) NULL,
+    expires_at DATETIME NOT NULL,
+    KEY idx_idempotency_expires (expires_at)
+);
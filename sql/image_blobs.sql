@@ -0,0 +1,12 @@
+-- Content-addressed images and their reference counts, used by image_store.ImageStore.
+-- One reference per upload that resolved to the object. When the count reaches zero the
+-- row stays as a tombstone (ref_count 0) until the object is deleted from the bucket.
+CREATE TABLE IF NOT EXISTS image_blobs (
+    object_name VARCHAR(255) NOT NULL PRIMARY KEY,
+    content_hash CHAR(64) NOT NULL,
+    public_url VARCHAR(512) NOT NULL,
+    size INT UNSIGNED NOT NULL,
+    ref_count INT UNSIGNED NOT NULL DEFAULT 1,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_image_blobs_hash (content_hash)
+);
@@ -0,0 +1,12 @@
+-- Listing status and short checkout holds, used by inventory.py.
+-- Sold products stay in the table for order history but drop out of every catalog query.
+ALTER TABLE products ADD COLUMN status ENUM('available', 'sold') NOT NULL DEFAULT 'available';
+
+-- One row per held product. Expired rows are ignored and overwritten by the next hold,
+-- so abandoned checkouts leave at most one row per product behind.
+CREATE TABLE IF NOT EXISTS product_reservations (
+    product_id INT NOT NULL PRIMARY KEY,
+    user_id INT NOT NULL,
+    expires_at DATETIME NOT NULL,
+    KEY idx_reservations_user (user_id)
+);
@@ -0,0 +1,8 @@
+-- Cold storage for orders moved by order_archive.py. Same columns and indexes as the
+-- hot tables (CREATE TABLE ... LIKE copies no foreign keys, which archived rows don't need).
+CREATE TABLE IF NOT EXISTS orders_archive LIKE orders;
+CREATE TABLE IF NOT EXISTS order_items_archive LIKE order_items;
+CREATE TABLE IF NOT EXISTS delivery_addresses_archive LIKE delivery_addresses;
+
+-- Lets the archival job find old orders without scanning the hot table
+CREATE INDEX idx_orders_created ON orders (created_at);
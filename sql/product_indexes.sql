@@ -0,0 +1,9 @@
+-- Composite indexes used by the /get-products query planner (query_builder.COMPOSITE_INDEXES).
+-- The planner only hints indexes that exist, so these can be rolled out independently.
+CREATE INDEX idx_products_user_created ON products (user_id, created_at);
+CREATE INDEX idx_products_category_created ON products (category, created_at);
+CREATE INDEX idx_products_category_price ON products (category, price);
+CREATE INDEX idx_products_state_created ON products (state, created_at);
+CREATE INDEX idx_products_state_price ON products (state, price);
+CREATE INDEX idx_products_created ON products (created_at);
+CREATE INDEX idx_products_price ON products (price);
@@ -0,0 +1,11 @@
+-- Per-product popularity counters maintained by popularity.PopularityCounters.
+-- `trend` is the log2 of the time-decayed score anchored at popularity.EPOCH; see popularity.py.
+CREATE TABLE IF NOT EXISTS product_popularity (
+    product_id INT NOT NULL PRIMARY KEY,
+    views INT UNSIGNED NOT NULL DEFAULT 0,
+    wishlist_adds INT UNSIGNED NOT NULL DEFAULT 0,
+    cart_adds INT UNSIGNED NOT NULL DEFAULT 0,
+    orders INT UNSIGNED NOT NULL DEFAULT 0,
+    trend DOUBLE NOT NULL DEFAULT 0,
+    KEY idx_popularity_trend (trend)
+);
@@ -0,0 +1,14 @@
+-- Wishlist rows keyed by product. image_url alone was ambiguous: identical photos are
+-- stored once (image_store.py), so several listings can share one main image.
+ALTER TABLE wishlist ADD COLUMN product_id INT NULL;
+
+-- Existing rows go to the oldest listing with that main image; rows matching no listing are dropped
+UPDATE wishlist w
+JOIN (SELECT image_url, MIN(id) AS product_id FROM products GROUP BY image_url) p ON p.image_url = w.image_url
+SET w.product_id = p.product_id;
+DELETE FROM wishlist WHERE product_id IS NULL;
+
+ALTER TABLE wishlist MODIFY product_id INT NOT NULL;
+CREATE UNIQUE INDEX idx_wishlist_user_product ON wishlist (users_id, product_id);
+-- delete_products clears wishlist rows by product
+CREATE INDEX idx_wishlist_product ON wishlist (product_id);
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the top-level modules the same way the benchmarks do
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
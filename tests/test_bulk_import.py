@@ -0,0 +1,56 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from bulk_import import RowError, check_public_url, fetch_image
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    body = b"\xff\xd8" + b"x" * 1000
+    hosts = []
+
+    def do_GET(self):
+        self.hosts.append(self.headers["Host"])
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def image_server():
+    ImageHandler.hosts = []
+    server = HTTPServer(("127.0.0.1", 0), ImageHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_connects_to_checked_address_with_original_host(image_server):
+    # The hostname doesn't resolve; the fetch must go to the pinned address only.
+    url = f"http://images.example.test:{image_server}/a.jpg"
+
+    assert fetch_image(url, 4096, timeout=5, address="127.0.0.1") == ImageHandler.body
+    assert ImageHandler.hosts == [f"images.example.test:{image_server}"]
+
+
+def test_fetch_stops_past_max_bytes(image_server):
+    url = f"http://images.example.test:{image_server}/a.jpg"
+
+    with pytest.raises(RowError, match="larger than"):
+        fetch_image(url, 100, timeout=5, address="127.0.0.1")
+
+
+def test_check_public_url():
+    assert check_public_url("http://93.184.216.34/a.jpg") == "93.184.216.34"
+    for url in ("http://127.0.0.1/a.jpg", "http://169.254.169.254/latest/meta-data",
+                "http://[::1]/a.jpg"):
+        with pytest.raises(RowError):
+            check_public_url(url)
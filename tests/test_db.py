@@ -0,0 +1,111 @@
+import mysql.connector
+import pytest
+from mysql.connector import errorcode
+from mysql.connector.cursor import MySQLCursorPrepared
+
+from db import ConnectionPool, PoolOverloaded, _Slot, retry_on_deadlock
+
+
+class FakeConnection:
+    """Just enough of a MySQL connection for the real prepared cursor; counts PREPAREs."""
+
+    charset = "utf8mb4"
+    get_warnings = False
+    in_transaction = False
+    unread_result = False
+
+    def __init__(self, connection_id):
+        self.connection_id = connection_id
+        self.prepared = []
+
+    def is_connected(self):
+        return True
+
+    def cursor(self, prepared=False):
+        assert prepared
+        return MySQLCursorPrepared(self)
+
+    def cmd_stmt_prepare(self, statement):
+        self.prepared.append(statement)
+        return {"statement_id": len(self.prepared), "parameters": [None] * statement.count(b"?"), "columns": []}
+
+    def cmd_stmt_reset(self, statement_id):
+        pass
+
+    def cmd_stmt_close(self, statement_id):
+        pass
+
+    def cmd_stmt_execute(self, statement_id, data=(), parameters=(), flags=0):
+        return {"affected_rows": 1, "insert_id": 0, "warning_count": 0, "server_status": 0}
+
+    def close(self):
+        pass
+
+
+def make_pool(size=2):
+    pool = ConnectionPool(size=size, timeout=0.1)
+    connection_ids = iter(range(1, 100))
+    pool._open = lambda: _Slot(FakeConnection(next(connection_ids)), pool.max_statements)
+    return pool
+
+
+def build_sql(table):
+    # A new str object with the same text on every call, like an f-string in a handler
+    return f"UPDATE {table} SET views = views + %s WHERE id = %s"
+
+
+def test_sql_built_per_call_is_prepared_once_per_connection():
+    pool = make_pool()
+    conn = pool.get()
+    for product_id in range(5):
+        assert conn.execute_prepared(build_sql("products"), (1, product_id)) == 1
+    assert len(conn._slot.cnx.prepared) == 1
+    conn.close()
+
+
+def test_each_connection_prepares_its_own_statement():
+    pool = make_pool()
+    first, second = pool.get(), pool.get()
+    for conn in (first, second, first, second):
+        conn.execute_prepared(build_sql("products"), (1, 1))
+    assert [len(conn._slot.cnx.prepared) for conn in (first, second)] == [1, 1]
+
+    # Returned to the pool with its session, the statement stays prepared
+    cnx = first._slot.cnx
+    first.close()
+    again = pool.get()
+    again.execute_prepared(build_sql("products"), (1, 1))
+    assert again._slot.cnx is cnx and len(cnx.prepared) == 1
+    again.close()
+    second.close()
+
+
+def test_deadlock_victim_is_retried_and_other_errors_are_not():
+    attempts = []
+
+    def transaction(errno):
+        def run():
+            attempts.append(errno)
+            if len(attempts) == 1:
+                raise mysql.connector.Error(errno=errno)
+            return "committed"
+        return run
+
+    assert retry_on_deadlock(transaction(errorcode.ER_LOCK_DEADLOCK), delay=0) == "committed"
+    assert len(attempts) == 2
+
+    attempts.clear()
+    with pytest.raises(mysql.connector.Error):
+        retry_on_deadlock(transaction(errorcode.ER_LOCK_WAIT_TIMEOUT), delay=0)
+    assert len(attempts) == 1
+
+
+def test_checkout_is_refused_once_the_wait_queue_is_full():
+    pool = make_pool(size=1)
+    pool.max_waiting = 0
+    held = pool.get()
+    with pytest.raises(PoolOverloaded):
+        pool.get()
+    assert pool.waiting == 0
+    held.close()
+    pool.get().close()
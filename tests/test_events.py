@@ -0,0 +1,48 @@
+"""Catalog events relayed between instances over the cache invalidation bus."""
+import json
+
+from cache import InvalidationBus
+from events import EventHub
+
+
+class FakeRedis:
+    """Delivers every publish straight to all buses, the publisher's own included, like Redis."""
+
+    prefix = "unisale:"
+
+    def __init__(self):
+        self.buses = []
+
+    def publish(self, channel, message):
+        for bus in self.buses:
+            bus.receive(channel, message)
+
+
+def make_instance(redis):
+    hub = EventHub()
+    bus = InvalidationBus(redis)
+    bus.add_channel("catalog-events", lambda event: hub.publish(event["type"], event["data"], event["category"]))
+    redis.buses.append(bus)
+    return hub, bus
+
+
+def events(hub):
+    return [(event_type, json.loads(data)) for _, event_type, _, data in hub._events]
+
+
+def test_events_reach_subscribers_on_other_instances_once():
+    redis = FakeRedis()
+    (first, first_bus), (second, _) = make_instance(redis), make_instance(redis)
+
+    data = {"id": 7, "category": "Books", "price": 12.5}
+    first.publish("price-change", data, "Books")
+    first_bus.broadcast("catalog-events", {"type": "price-change", "data": data, "category": "Books"})
+
+    assert events(first) == events(second) == [("price-change", data)]
+
+
+def test_unknown_channels_are_ignored():
+    redis = FakeRedis()
+    hub, bus = make_instance(redis)
+    InvalidationBus(redis).broadcast("something-else", {"type": "sold"})
+    assert events(hub) == []
@@ -0,0 +1,29 @@
+"""Acceptance test: a 1M-row export keeps peak RSS flat.
+
+Runs benchmarks/bench_export_rss.py in a fresh interpreter so the peak isn't
+inherited from whatever else the test process has allocated.
+"""
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+BENCHMARK = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "bench_export_rss.py")
+
+# Buffers of one ~64KB chunk plus the current order; anything near this means rows are accumulating
+MAX_RSS_GROWTH_MB = 32
+
+
+@pytest.mark.parametrize("fmt", ["ndjson", "csv"])
+def test_million_row_export_peak_rss(fmt):
+    output = subprocess.run(
+        [sys.executable, BENCHMARK, "--rows", "1000000", "--format", fmt],
+        check=True, capture_output=True, text=True
+    ).stdout
+    match = re.search(r"peak RSS ([\d.]+) MB \(baseline ([\d.]+) MB\)", output)
+    assert match, output
+
+    peak, baseline = float(match.group(1)), float(match.group(2))
+    assert peak - baseline < MAX_RSS_GROWTH_MB, output
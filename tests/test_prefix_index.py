@@ -0,0 +1,37 @@
+from prefix_index import PrefixIndex
+
+
+def names(index, prefix):
+    return [suggestion["text"] for suggestion in index.suggest(prefix)]
+
+
+def test_changes_made_while_the_table_is_read_survive_the_rebuild():
+    index = PrefixIndex()
+    index.add_product(1, "Casio Calculator", "Electronics")
+    index.add_product(2, "Calculus Textbook", "Books")
+
+    def rows():
+        # Snapshot taken before product 3 was uploaded and product 2 sold
+        snapshot = [(1, "Casio Calculator", "Electronics"), (2, "Calculus Textbook", "Books")]
+        index.add_product(3, "Calculator Cover", "Electronics")
+        index.remove_product(2)
+        yield from snapshot
+
+    index.rebuild(rows())
+
+    assert names(index, "calc") == ["Calculator Cover", "Casio Calculator"]
+
+
+def test_rebuild_through_run_replays_too():
+    index = PrefixIndex()
+    calls = []
+
+    def run(build, rows):
+        calls.append(len(rows))
+        index.add_product(9, "Desk Lamp", "Furniture")
+        return build(rows)
+
+    index.rebuild(iter([(1, "Desk Chair", "Furniture")]), run=run)
+
+    assert calls == [1]
+    assert names(index, "desk") == ["Desk Chair", "Desk Lamp"]
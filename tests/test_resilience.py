@@ -0,0 +1,101 @@
+"""Fault injection for the deadline, retry and circuit breaker wrappers around GCS and Firebase."""
+import time
+
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, call_with_deadline, retry
+
+
+class FakeUpstreamError(Exception):
+    pass
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FlakyUpstream:
+    """Fails the first `failures` calls, then succeeds."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise FakeUpstreamError("503 Service Unavailable")
+        return "ok"
+
+
+def test_hanging_call_is_cut_off_at_the_deadline():
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        call_with_deadline(time.sleep, 0.2, 5)
+    assert time.monotonic() - start < 1
+
+
+def test_breaker_opens_after_consecutive_failures_and_fails_fast():
+    breaker = CircuitBreaker("gcs", failure_threshold=3, reset_timeout=30, clock=FakeClock())
+    upstream = FlakyUpstream(failures=100)
+    for _ in range(3):
+        with pytest.raises(FakeUpstreamError):
+            breaker.call(upstream)
+
+    with pytest.raises(CircuitOpenError):
+        breaker.call(upstream)
+    assert upstream.calls == 3
+    assert breaker.snapshot()["state"] == CircuitBreaker.OPEN
+    assert breaker.snapshot()["rejected"] == 1
+
+
+def test_half_open_trial_closes_on_success_and_reopens_on_failure():
+    clock = FakeClock()
+    breaker = CircuitBreaker("firebase", failure_threshold=1, reset_timeout=15, clock=clock)
+    with pytest.raises(FakeUpstreamError):
+        breaker.call(FlakyUpstream(failures=1))
+
+    clock.now += 15
+    with pytest.raises(FakeUpstreamError):
+        breaker.call(FlakyUpstream(failures=1))
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now += 15
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_errors_that_are_not_failures_do_not_open_the_breaker():
+    # An invalid token is the caller's problem, not Firebase being down
+    breaker = CircuitBreaker("firebase", failure_threshold=1, clock=FakeClock())
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            breaker.call(lambda: int("invalid"), is_failure=lambda e: isinstance(e, FakeUpstreamError))
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_retry_recovers_from_transient_errors():
+    upstream = FlakyUpstream(failures=2)
+    assert retry(upstream, attempts=3, base_delay=0.01, retry_on=(FakeUpstreamError,)) == "ok"
+    assert upstream.calls == 3
+
+
+def test_retry_never_sleeps_past_the_deadline():
+    upstream = FlakyUpstream(failures=100)
+    start = time.monotonic()
+    with pytest.raises(FakeUpstreamError):
+        retry(upstream, attempts=50, base_delay=0.1, max_delay=0.1,
+              deadline=start + 0.3, retry_on=(FakeUpstreamError,))
+    assert time.monotonic() - start < 0.3
+
+
+def test_retry_does_not_retry_an_open_breaker():
+    breaker = CircuitBreaker("gcs", failure_threshold=2, reset_timeout=30, clock=FakeClock())
+    upstream = FlakyUpstream(failures=100)
+    with pytest.raises(CircuitOpenError):
+        retry(lambda: breaker.call(upstream), attempts=5, base_delay=0.01, retry_on=(Exception,))
+    assert upstream.calls == 2
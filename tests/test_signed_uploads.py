@@ -0,0 +1,127 @@
+"""Signed uploads against a local fake GCS (gcp-storage-emulator, see requirements-dev.txt)."""
+import os
+import socket
+from datetime import timedelta
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+emulator = pytest.importorskip("gcp_storage_emulator.server")
+
+from cryptography.hazmat.primitives import serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import rsa  # noqa: E402
+from google.auth.credentials import AnonymousCredentials  # noqa: E402
+from google.cloud import storage  # noqa: E402
+from google.oauth2 import service_account  # noqa: E402
+
+import signed_uploads  # noqa: E402
+
+BUCKET_NAME = "unisale-storage"
+FOLDER = "product-image"
+MAX_BYTES = 1024
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def bucket():
+    port = free_port()
+    server = emulator.create_server("localhost", port, in_memory=True)
+    server.start()
+    previous = os.environ.get("STORAGE_EMULATOR_HOST")
+    os.environ["STORAGE_EMULATOR_HOST"] = f"http://localhost:{port}"
+    try:
+        client = storage.Client(project="unisale-test", credentials=AnonymousCredentials())
+        yield client.create_bucket(BUCKET_NAME)
+    finally:
+        if previous is None:
+            del os.environ["STORAGE_EMULATOR_HOST"]
+        else:
+            os.environ["STORAGE_EMULATOR_HOST"] = previous
+        server.stop()
+
+
+@pytest.fixture
+def signing_bucket():
+    # Signing needs a service account key, never a call to GCS
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    credentials = service_account.Credentials.from_service_account_info({
+        "type": "service_account",
+        "client_email": "uploads@unisale-test.iam.gserviceaccount.com",
+        "private_key": key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ).decode(),
+        "token_uri": "https://oauth2.googleapis.com/token",
+    })
+    return storage.Client(project="unisale-test", credentials=credentials).bucket(BUCKET_NAME)
+
+
+def upload(bucket, name, data=b"\xff\xd8\xff\xe0 jpeg", content_type="image/jpeg"):
+    bucket.blob(name).upload_from_string(data, content_type=content_type)
+    return name
+
+
+def test_signed_object_lives_under_the_users_prefix(signing_bucket):
+    issued = signed_uploads.sign_upload(signing_bucket, FOLDER, 7, "desk.jpg", "image/jpeg",
+                                        MAX_BYTES, timedelta(minutes=15))
+
+    assert issued["object_name"].startswith("product-image/7/")
+    assert issued["object_name"].endswith("_desk.jpg")
+    assert issued["headers"] == {"Content-Type": "image/jpeg", "x-goog-content-length-range": f"0,{MAX_BYTES}"}
+
+    url = urlsplit(issued["upload_url"])
+    assert url.path == f"/{BUCKET_NAME}/{issued['object_name']}"
+    query = parse_qs(url.query)
+    assert query["X-Goog-Expires"] == ["900"]
+    assert "x-goog-content-length-range" in query["X-Goog-SignedHeaders"][0]
+
+
+def test_verify_accepts_the_users_own_uploads_and_makes_them_public(bucket):
+    names = [upload(bucket, "product-image/7/a_front.jpg"), upload(bucket, "product-image/7/b_back.jpg")]
+
+    urls = signed_uploads.verify_uploaded_objects(bucket, names, FOLDER, 7, MAX_BYTES)
+
+    assert urls == [f"https://storage.googleapis.com/{BUCKET_NAME}/{name}" for name in names]
+    assert "READER" in bucket.get_blob(names[0]).acl.all().get_roles()
+
+
+@pytest.mark.parametrize("name", [
+    "product-image/8/c_other_user.jpg",
+    "product-image/7/../8/c_other_user.jpg",
+    "profile-picture/7/c_wrong_folder.jpg",
+    None,
+])
+def test_verify_rejects_objects_not_issued_to_the_user(bucket, name):
+    upload(bucket, "product-image/8/c_other_user.jpg")
+    upload(bucket, "profile-picture/7/c_wrong_folder.jpg")
+    with pytest.raises(ValueError, match="was not issued"):
+        signed_uploads.verify_uploaded_objects(bucket, [name], FOLDER, 7, MAX_BYTES)
+
+
+def test_verify_rejects_missing_oversized_and_non_image_objects(bucket):
+    with pytest.raises(ValueError, match="has not been uploaded"):
+        signed_uploads.verify_uploaded_objects(bucket, ["product-image/7/d_never.jpg"], FOLDER, 7, MAX_BYTES)
+
+    upload(bucket, "product-image/7/e_huge.jpg", data=b"x" * (MAX_BYTES + 1))
+    with pytest.raises(ValueError, match="not a valid image"):
+        signed_uploads.verify_uploaded_objects(bucket, ["product-image/7/e_huge.jpg"], FOLDER, 7, MAX_BYTES)
+
+    upload(bucket, "product-image/7/f_script.jpg", data=b"<script>", content_type="text/html")
+    with pytest.raises(ValueError, match="not a valid image"):
+        signed_uploads.verify_uploaded_objects(bucket, ["product-image/7/f_script.jpg"], FOLDER, 7, MAX_BYTES)
+
+
+def test_verify_routes_every_gcs_request_through_call(bucket):
+    name = upload(bucket, "product-image/7/g_counted.jpg")
+    calls = []
+
+    def call(operation):
+        calls.append(operation)
+        return operation()
+
+    signed_uploads.verify_uploaded_objects(bucket, [name], FOLDER, 7, MAX_BYTES, call=call)
+    assert len(calls) == 2